@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+故事资源索引
+用一次 os.scandir 列出项目根目录、audio/ 和 audio/thumbnails/，
+把规范化的故事名（如 `01-巫巫女的心变了`）映射到故事文稿、封面、缩略图和 MP3，
+并报告缺失或命名不一致的资源
+"""
+
+import functools
+import os
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
+AUDIO_EXTENSIONS = ['.mp3']
+
+_BRACKETS_RE = re.compile(r'[（(].*?[）)]')
+_PROCESS_SUFFIX_RE = re.compile(r'_(processed|temp|trimmed|录屏).*$')
+_TEMP_SUFFIX_RE = re.compile(r'_(processed|temp|trimmed).*$')
+_STORY_KEY_RE = re.compile(r'^(\d+)-')
+_THUMB_SUFFIX_RE = re.compile(r'_thumb(_\d+)?$')  # 缩略图后缀，如 _thumb、_thumb_200
+_TEMP_SUFFIXES = ['_temp', '_trimmed', '_with_fade', '_processed']
+
+
+def project_root() -> Path:
+    return Path(__file__).resolve().parents[1]
+
+
+def get_original_base_name(original_path: str) -> str:
+    """获取原始文件的基本名称（去掉临时后缀）"""
+    original_name = Path(original_path).stem
+    # 去掉常见的临时后缀
+    for suffix in _TEMP_SUFFIXES:
+        if original_name.endswith(suffix):
+            original_name = original_name[:-len(suffix)]
+    return original_name
+
+
+def clean_asset_name(base_name: str) -> str:
+    """清理名称：去除括号内容和 _processed、_temp、_trimmed、_录屏 等后缀"""
+    clean_name = _BRACKETS_RE.sub('', base_name).strip()
+    return _PROCESS_SUFFIX_RE.sub('', clean_name).strip()
+
+
+def strip_temp_suffix(base_name: str) -> str:
+    """只去除 _processed、_temp、_trimmed 等后缀，保留括号内容"""
+    return _TEMP_SUFFIX_RE.sub('', base_name).strip()
+
+
+def story_key(path: str) -> str:
+    """由任意资源文件名得到规范化的故事名"""
+    base_name = _THUMB_SUFFIX_RE.sub('', get_original_base_name(path))
+    return clean_asset_name(base_name)
+
+
+@functools.lru_cache(maxsize=None)
+def list_dir(directory: str) -> Dict[str, str]:
+    """列出目录中的文件，返回 小写文件名 -> 完整路径（结果会被缓存）"""
+    entries = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file():
+                    entries.setdefault(entry.name.lower(), entry.path)
+    except OSError:
+        pass
+    return entries
+
+
+def lookup(directory: Path, filename: str) -> Optional[str]:
+    """在目录列表中查找文件，不产生额外的 stat 调用"""
+    return list_dir(str(directory)).get(filename.lower())
+
+
+def invalidate() -> None:
+    """目录内容发生变化后清除缓存的列表"""
+    list_dir.cache_clear()
+
+
+@dataclass
+class AssetEntry:
+    """一个故事对应的全部资源"""
+    key: str
+    story: Optional[str] = None
+    cover: Optional[str] = None
+    thumbnail: Optional[str] = None
+    audio: Optional[str] = None
+
+    @property
+    def number(self) -> Optional[str]:
+        match = _STORY_KEY_RE.match(self.key)
+        return match.group(1) if match else None
+
+
+def build_asset_index(root: Optional[str] = None) -> Dict[str, AssetEntry]:
+    """扫描项目根目录、audio/ 和 audio/thumbnails/，建立 故事名 -> 资源 的索引
+
+    只收录以编号开头（`NN-标题`）的文件
+    """
+    root = Path(root) if root else project_root()
+    audio_dir = root / 'audio'
+    thumb_dir = audio_dir / 'thumbnails'
+    index: Dict[str, AssetEntry] = {}
+
+    def entry_for(path: str) -> Optional[AssetEntry]:
+        key = story_key(path)
+        if not _STORY_KEY_RE.match(key):
+            return None
+        return index.setdefault(key, AssetEntry(key=key))
+
+    def first(current: Optional[str], candidate: str) -> str:
+        # 同一故事有多个候选时，按文件名排序取第一个，保证结果稳定
+        return candidate if current is None else min(current, candidate)
+
+    for path in list_dir(str(root)).values():
+        if path.lower().endswith('.md'):
+            entry = entry_for(path)
+            if entry:
+                entry.story = first(entry.story, path)
+
+    for path in list_dir(str(audio_dir)).values():
+        suffix = Path(path).suffix.lower()
+        if suffix in IMAGE_EXTENSIONS:
+            entry = entry_for(path)
+            if entry:
+                entry.cover = first(entry.cover, path)
+        elif suffix in AUDIO_EXTENSIONS:
+            entry = entry_for(path)
+            if entry:
+                entry.audio = first(entry.audio, path)
+
+    for path in list_dir(str(thumb_dir)).values():
+        if Path(path).suffix.lower() in IMAGE_EXTENSIONS:
+            entry = entry_for(path)
+            if entry:
+                entry.thumbnail = first(entry.thumbnail, path)
+
+    return dict(sorted(index.items()))
+
+
+def index_report(index: Dict[str, AssetEntry], require_audio: bool = False) -> List[str]:
+    """找出缺失的资源和编号相同但名称不一致的资源"""
+    problems = []
+    by_number: Dict[str, List[AssetEntry]] = {}
+    for entry in index.values():
+        by_number.setdefault(entry.number, []).append(entry)
+
+    for number, entries in sorted(by_number.items()):
+        if len(entries) > 1:
+            names = '、'.join(f"{e.key}（{_describe(e)}）" for e in entries)
+            problems.append(f"编号 {number} 对应多个名称: {names}")
+
+    for entry in index.values():
+        missing = []
+        if not entry.story:
+            missing.append('故事文稿')
+        if not entry.cover:
+            missing.append('封面')
+        if not entry.thumbnail:
+            missing.append('缩略图')
+        if require_audio and not entry.audio:
+            missing.append('MP3')
+        if missing:
+            problems.append(f"{entry.key}: 缺少{'、'.join(missing)}")
+    return problems
+
+
+def _describe(entry: AssetEntry) -> str:
+    kinds = [name for name, value in (('故事', entry.story), ('封面', entry.cover),
+                                      ('缩略图', entry.thumbnail), ('MP3', entry.audio)) if value]
+    return '、'.join(kinds)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='检查故事文稿、封面、缩略图和 MP3 是否一一对应')
+    parser.add_argument('--root', default=None, help='项目根目录（默认: 脚本所在项目）')
+    parser.add_argument('--require-audio', action='store_true', help='把缺少 MP3 也视为问题')
+    args = parser.parse_args()
+
+    index = build_asset_index(args.root)
+    print(f"共索引 {len(index)} 个故事")
+    for entry in index.values():
+        print(f"  {entry.key}: {_describe(entry)}")
+
+    problems = index_report(index, args.require_audio)
+    if problems:
+        print(f"\n⚠ 发现 {len(problems)} 个问题:")
+        for problem in problems:
+            print(f"  - {problem}")
+    else:
+        print("\n✓ 所有资源都已对应")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
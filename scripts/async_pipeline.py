@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步流水线批量处理录屏
+把处理拆成 读取信息 -> 分析 -> 编码 -> 写入标签 -> 发布 五个阶段，阶段之间用有界队列连接，
+每个阶段有各自的并发数。不同故事同时处于不同阶段：一个故事在写标签时，其他故事的 ffmpeg
+仍在编码，整体吞吐接近编码器的上限，而不是各阶段耗时之和
+
+ffmpeg 通过 asyncio.create_subprocess_exec 启动；mutagen、文件读写等阻塞操作在线程中执行。
+只输出 MP3，结果与 `process_audio.py batch` 的单次流式编码相同，共用构建缓存
+
+用法：
+    python scripts/async_pipeline.py recordings/ --output-dir audio [--jobs 4]
+"""
+
+import asyncio
+import io
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from audio_analysis import (DEFAULT_TARGET_LUFS, AnalysisReport, analysis_cmd, build_report,
+                            load_report, report_path_for)
+from build_cache import BuildCache
+from probe_cache import probe
+from process_audio import (add_metadata, add_trace_arguments, analyze_trims, build_audio_filter,
+                           batch_output_path, cache_keys, check_ffmpeg, collect_recordings,
+                           find_cover_image, find_output_conflicts, find_story_file, mp3_pipe_cmd, plan_chapters,
+                           publish_bytes, read_story_content, trims_from_report)
+from silence_analyzer import CHUNK_SAMPLES, NUMPY_AVAILABLE, SilenceTracker
+from tracing import Tracer, aggregate, format_histogram, profiled, save_traces, span
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+
+STAGE_NAMES = ('probe', 'analyze', 'encode', 'tag', 'publish')
+QUEUE_DEPTH = 2  # 每个阶段的输入队列长度为该阶段并发数的两倍，限制内存中的音频数据
+
+
+@dataclass
+class PipelineOptions:
+    """与 process_video 相同含义的处理参数"""
+    min_start_padding: float = 0.5
+    min_end_padding: float = 0.5
+    fade_in_duration: float = 0.2
+    edges_only: bool = True
+    target_lufs: Optional[float] = None
+    chapters: bool = False
+    sylt: bool = False
+    cache: Optional[BuildCache] = None
+
+
+@dataclass
+class Job:
+    """一个录屏在流水线中的状态"""
+    recording: Path
+    output_path: Path
+    tracer: Tracer
+    cover_path: Optional[str] = None
+    story_path: Optional[str] = None
+    story_title: Optional[str] = None
+    story_content: Optional[str] = None
+    keys: Optional[Tuple[str, str, str]] = None  # (分析, 编码, 最终文件) 缓存键
+    trims: Optional[Tuple[float, float, float, float]] = None  # 开头、结尾、总时长、增益
+    encoded: Optional[bytes] = None  # 未写标签的 MP3
+    tagged: Optional[bytes] = None  # 写好标签、待发布的 MP3
+    error: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.recording.name
+
+
+async def _decode_into_async(cmd: List[str], tracker: SilenceTracker) -> str:
+    """与 silence_analyzer._decode_into 相同，但不占用线程：PCM 分块送入 tracker，返回 stderr"""
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE)
+    stderr_task = asyncio.ensure_future(proc.stderr.read())
+    leftover = b''
+    while True:
+        data = await proc.stdout.read(CHUNK_SAMPLES * 2)
+        if not data:
+            break
+        data = leftover + data
+        usable = len(data) - len(data) % 2
+        leftover = data[usable:]
+        tracker.feed(np.frombuffer(data[:usable], dtype='<i2'))
+    returncode = await proc.wait()
+    stderr = (await stderr_task).decode('utf-8', errors='replace')
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    return stderr
+
+
+async def analyze_recording_async(audio_path: str) -> AnalysisReport:
+    """audio_analysis.analyze_recording 的异步版本"""
+    st = os.stat(audio_path)
+    tracker = SilenceTracker()
+    stderr = await _decode_into_async(analysis_cmd(audio_path), tracker)
+    return build_report(audio_path, st, tracker, stderr)
+
+
+async def _probe(job: Job, options: PipelineOptions) -> None:
+    """读取录屏信息、查找封面和故事、查询构建缓存"""
+    info = await asyncio.to_thread(probe, str(job.recording))
+    if info.error:
+        raise RuntimeError(info.error)
+    job.cover_path = await asyncio.to_thread(find_cover_image, str(job.recording))
+    job.story_path = await asyncio.to_thread(find_story_file, str(job.recording))
+    if job.story_path and os.path.exists(job.story_path):
+        job.story_title, job.story_content = await asyncio.to_thread(read_story_content,
+                                                                     job.story_path)
+
+    cache = options.cache
+    if cache is None:
+        return
+    job.keys = await asyncio.to_thread(
+        cache_keys, str(job.recording), job.cover_path, job.story_path,
+        options.min_start_padding, options.min_end_padding, options.fade_in_duration,
+        True, options.edges_only, options.target_lufs, options.chapters, options.sylt)
+    _, encode_key, final_key = job.keys
+    job.tagged = await asyncio.to_thread(cache.read_bytes, 'final', final_key, '.mp3')
+    if job.tagged is not None:
+        print(f"  ✓ {job.name}: 命中缓存，录屏、封面和故事均未变化")
+        return
+    job.encoded = await asyncio.to_thread(cache.read_bytes, 'encode', encode_key, '.mp3')
+    if job.encoded is not None:
+        print(f"  ✓ {job.name}: 命中编码缓存，跳过分析和编码")
+
+
+async def _analyze(job: Job, options: PipelineOptions) -> None:
+    """计算裁剪量和响度增益，规则与 process_video 的单次编码相同"""
+    if job.encoded is not None or job.tagged is not None:
+        return
+    recording = str(job.recording)
+    report_path = str(report_path_for(str(job.output_path)))
+    report = await asyncio.to_thread(load_report, recording, report_path)
+    need_full = options.target_lufs is not None or not options.edges_only or options.chapters
+    if report is None and need_full and NUMPY_AVAILABLE:
+        print(f"正在分析静音和响度: {job.name}")
+        report = await analyze_recording_async(recording)
+        await asyncio.to_thread(report.save, report_path)
+    if report is not None:
+        job.trims = trims_from_report(report, options.min_start_padding,
+                                      options.min_end_padding, options.target_lufs,
+                                      label=f"{job.name}: 分析报告")
+        return
+
+    cache = options.cache
+    analysis = await asyncio.to_thread(cache.get_json, 'analysis', job.keys[0]) \
+        if cache is not None else None
+    if analysis:
+        job.trims = (analysis['start_trim'], analysis['end_trim'],
+                     analysis['total_duration'], 0.0)
+        return
+    # 只解码首尾窗口的分析由若干次很短的解码组成，放在线程中执行
+    start_trim, end_trim, total_duration = await asyncio.to_thread(
+        analyze_trims, recording, options.min_start_padding, options.min_end_padding,
+        options.edges_only)
+    if total_duration <= 0:
+        raise RuntimeError("无法检测静音")
+    if cache is not None:
+        await asyncio.to_thread(cache.put_json, 'analysis', job.keys[0], {
+            'start_trim': start_trim,
+            'end_trim': end_trim,
+            'total_duration': total_duration,
+        })
+    job.trims = (start_trim, end_trim, total_duration, 0.0)
+
+
+async def _encode(job: Job, options: PipelineOptions) -> None:
+    """一次编码完成裁剪、响度调整、淡入和重采样，MP3 数据留在内存中"""
+    if job.encoded is not None or job.tagged is not None:
+        return
+    start_trim, end_trim, total_duration, gain_db = job.trims
+    audio_filter = build_audio_filter(start_trim, end_trim, total_duration,
+                                      options.fade_in_duration, gain_db=gain_db)
+    print(f"正在编码: {job.name}")
+    proc = await asyncio.create_subprocess_exec(*mp3_pipe_cmd(str(job.recording), audio_filter),
+                                                stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"音频编码失败: {stderr.decode('utf-8', errors='replace')[-500:]}")
+    job.encoded = stdout
+    if options.cache is not None:
+        await asyncio.to_thread(options.cache.put_bytes, 'encode', job.keys[1], stdout, '.mp3')
+
+
+async def _tag(job: Job, options: PipelineOptions) -> None:
+    """在内存中写入标签（以及可选的章节）"""
+    if job.tagged is not None:
+        return
+    chapter_map = None
+    if options.chapters and job.story_content:
+        chapter_map = await asyncio.to_thread(
+            plan_chapters, str(job.recording), str(report_path_for(str(job.output_path))),
+            job.story_content, options.min_start_padding, options.min_end_padding, options.sylt)
+    buffer = io.BytesIO(job.encoded)
+    await asyncio.to_thread(add_metadata, buffer, job.cover_path, job.story_title,
+                            job.story_content, chapters=chapter_map)
+    job.tagged = buffer.getvalue()
+    job.encoded = None
+    if options.cache is not None:
+        await asyncio.to_thread(options.cache.put_bytes, 'final', job.keys[2], job.tagged, '.mp3')
+
+
+async def _publish(job: Job, options: PipelineOptions) -> None:
+    """原子写入输出路径"""
+    await asyncio.to_thread(publish_bytes, job.tagged, str(job.output_path))
+    job.tagged = None
+    print(f"✓ 处理完成: {job.output_path}")
+
+
+STAGES: Tuple[Tuple[str, Callable], ...] = tuple(zip(
+    STAGE_NAMES, (_probe, _analyze, _encode, _tag, _publish)))
+
+
+def default_workers(jobs: Optional[int] = None) -> Dict[str, int]:
+    """各阶段的并发数：分析和编码各占满 CPU（每个 ffmpeg 编码基本是单线程），其余阶段以 I/O 为主"""
+    jobs = jobs or os.cpu_count() or 1
+    return {'probe': 4, 'analyze': jobs, 'encode': jobs, 'tag': 2, 'publish': 2}
+
+
+async def run_pipeline(jobs: List[Job], options: PipelineOptions,
+                       workers: Optional[Dict[str, int]] = None) -> List[Job]:
+    """让所有任务流过各阶段，返回结束的任务（失败的任务 error 不为 None，之后的阶段会跳过）"""
+    workers = workers or default_workers()
+    inboxes = [asyncio.Queue(maxsize=QUEUE_DEPTH * workers[name]) for name, _ in STAGES]
+    finished: List[Job] = []
+
+    async def feed():
+        for job in jobs:
+            await inboxes[0].put(job)
+        for _ in range(workers[STAGES[0][0]]):
+            await inboxes[0].put(None)
+
+    async def run_stage(index: int):
+        name, handler = STAGES[index]
+        outbox = inboxes[index + 1] if index + 1 < len(STAGES) else None
+
+        async def worker():
+            while True:
+                job = await inboxes[index].get()
+                if job is None:
+                    return
+                if job.error is None:
+                    try:
+                        with span(job.tracer, name):
+                            await handler(job, options)
+                    except Exception as e:
+                        job.error = f"{name}: {e}"
+                        print(f"✗ {job.name}: {job.error}")
+                if outbox is None:
+                    finished.append(job)
+                else:
+                    await outbox.put(job)
+
+        await asyncio.gather(*(worker() for _ in range(workers[name])))
+        if outbox is not None:
+            # 本阶段全部结束后通知下一阶段的每个 worker
+            for _ in range(workers[STAGES[index + 1][0]]):
+                await outbox.put(None)
+
+    await asyncio.gather(feed(), *(run_stage(i) for i in range(len(STAGES))))
+    return finished
+
+
+def make_jobs(recordings: List[Path], output_dir: Optional[str] = None) -> List[Job]:
+    """为每个录屏创建任务；输出到同一个文件的录屏（如 foo.mov 和 foo.m4a）直接标记为失败"""
+    conflicts = {recording: output
+                 for output, group in find_output_conflicts(recordings, output_dir).items()
+                 for recording in group}
+    jobs = []
+    for recording in recordings:
+        job = Job(recording=recording, output_path=batch_output_path(recording, output_dir),
+                  tracer=Tracer(recording.name))
+        if recording in conflicts:
+            job.error = f"与其他录屏都会输出到 {conflicts[recording].name}，请重命名后再处理"
+            print(f"✗ {job.name}: {job.error}")
+        jobs.append(job)
+    return jobs
+
+
+def print_utilization(stats: Dict[str, dict], workers: Dict[str, int], elapsed: float) -> None:
+    """各阶段的忙碌时间占 (总耗时 × 并发数) 的比例；编码阶段接近 100% 时已达到编码器的上限"""
+    for name in STAGE_NAMES:
+        busy = stats.get(name, {}).get('total', 0.0)
+        share = busy / (elapsed * workers[name]) if elapsed > 0 else 0.0
+        print(f"  {name:<10}并发 {workers[name]:>2}  忙碌 {busy:>8.1f} 秒  占用率 {share:>6.1%}")
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='用异步流水线批量处理录屏（分析、编码、写标签、发布同时进行）',
+        epilog='示例: python scripts/async_pipeline.py recordings/ --output-dir audio --jobs 4',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sources', nargs='+', help='录屏文件目录或通配符（如 "recordings/*.mov"）')
+    parser.add_argument('--output-dir', help='输出目录（默认与录屏文件同目录）')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='同时分析和编码的录屏数（默认: CPU 核心数）')
+    parser.add_argument('--full-scan', action='store_true',
+                        help='静音检测解码整段音频，而不是只分析开头和结尾')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用构建缓存，总是重新处理')
+    parser.add_argument('--loudnorm', nargs='?', type=float, const=DEFAULT_TARGET_LUFS,
+                        default=None, metavar='LUFS',
+                        help=f'把综合响度标准化到目标值（默认 {DEFAULT_TARGET_LUFS:.0f} LUFS）')
+    parser.add_argument('--chapters', action='store_true',
+                        help='按停顿把故事段落对齐到音频，写入 ID3 章节')
+    parser.add_argument('--sylt', action='store_true',
+                        help='同时写入每段一条的同步歌词（SYLT），包含 --chapters')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+
+    if not check_ffmpeg():
+        sys.exit(1)
+    recordings = collect_recordings(args.sources)
+    if not recordings:
+        print("未找到录屏文件")
+        sys.exit(1)
+    if args.output_dir:
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+
+    cache = None if args.no_cache else BuildCache(auto_evict=False)  # 全部完成后淘汰一次
+    options = PipelineOptions(edges_only=not args.full_scan,
+                              target_lufs=args.loudnorm,
+                              chapters=args.chapters or args.sylt,
+                              sylt=args.sylt,
+                              cache=cache)
+    workers = default_workers(args.jobs)
+    jobs = make_jobs(recordings, args.output_dir)
+    print(f"找到 {len(jobs)} 个录屏文件，同时编码 {workers['encode']} 个")
+
+    started = time.monotonic()
+    with profiled(args.profile, args.profiler):
+        finished = asyncio.run(run_pipeline(jobs, options, workers))
+    elapsed = time.monotonic() - started
+    if cache is not None:
+        cache.evict()
+
+    failed = [job for job in finished if job.error]
+    print(f"\n{'='*60}")
+    print(f"总计: {len(finished)} 个文件，耗时 {elapsed:.1f} 秒")
+    print(f"成功: {len(finished) - len(failed)} 个")
+    if failed:
+        print(f"失败: {len(failed)} 个")
+        for job in failed:
+            print(f"  - {job.recording}: {job.error}")
+    print(f"{'='*60}\n")
+
+    traces = [job.tracer.to_dict() for job in finished]
+    print("各阶段占用:")
+    print_utilization(aggregate(traces), workers, elapsed)
+    if args.trace_json:
+        print("\n各阶段耗时分布:")
+        print(format_histogram(aggregate(traces)))
+        save_traces(args.trace_json, [job.tracer for job in finished])
+        print(f"\n耗时记录: {args.trace_json}")
+    sys.exit(0 if not failed else 1)
+
+
+if __name__ == '__main__':
+    main()
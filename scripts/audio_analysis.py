@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一音频分析
+只解码一次录音，同时得到静音区间、精确到采样点的时长、峰值，
+以及 EBU R128 综合响度、响度范围和真峰值。
+分析报告保存在输出文件旁边（`<输出文件名>.analysis.json`），
+录音没有变化时后续步骤直接读取报告，不再解码源文件
+"""
+
+import json
+import math
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from silence_analyzer import (NUMPY_AVAILABLE, SAMPLE_RATE, SilenceReport, SilenceTracker,
+                              _decode_into)
+
+
+REPORT_VERSION = 1
+REPORT_SUFFIX = '.analysis.json'
+DEFAULT_TARGET_LUFS = -16.0  # 播客常用的响度目标
+MAX_TRUE_PEAK_DB = -1.0  # 响度标准化后允许的最大真峰值（dBTP）
+
+_LOUDNESS_RE = re.compile(r'^\s*I:\s+(-?[\d.]+|-?inf) LUFS', re.MULTILINE)
+_RANGE_RE = re.compile(r'^\s*LRA:\s+(-?[\d.]+|-?inf) LU\b', re.MULTILINE)
+_TRUE_PEAK_RE = re.compile(r'^\s*Peak:\s+(-?[\d.]+|-?inf) dBFS', re.MULTILINE)
+
+
+@dataclass
+class AnalysisReport:
+    """一次解码得到的全部分析结果"""
+    silence: SilenceReport
+    integrated_lufs: Optional[float] = None  # 综合响度（LUFS），全片静音时为 None
+    loudness_range: Optional[float] = None  # 响度范围（LU）
+    true_peak_db: Optional[float] = None  # 真峰值（dBTP）
+    source: Optional[str] = None
+    source_size: int = 0
+    source_mtime_ns: int = 0
+    noise_db: float = -30.0
+    min_duration: float = 0.5
+    version: int = REPORT_VERSION
+
+    @property
+    def duration(self) -> float:
+        return self.silence.duration
+
+    @property
+    def total_samples(self) -> int:
+        return self.silence.total_samples
+
+    def matches(self, source: str, noise_db: float = -30.0, min_duration: float = 0.5) -> bool:
+        """报告是否对应当前的源文件和分析参数（按文件大小和修改时间判断）"""
+        try:
+            st = os.stat(source)
+        except OSError:
+            return False
+        return (self.version == REPORT_VERSION
+                and self.source_size == st.st_size
+                and self.source_mtime_ns == st.st_mtime_ns
+                and self.noise_db == noise_db
+                and self.min_duration == min_duration)
+
+    def normalization_gain(self, target_lufs: float = DEFAULT_TARGET_LUFS,
+                           max_true_peak: float = MAX_TRUE_PEAK_DB) -> float:
+        """把综合响度调整到目标值所需的增益（dB），并保证真峰值不超过上限"""
+        if self.integrated_lufs is None:
+            return 0.0
+        gain = target_lufs - self.integrated_lufs
+        if self.true_peak_db is not None and self.true_peak_db + gain > max_true_peak:
+            gain = max_true_peak - self.true_peak_db
+        return gain
+
+    def to_dict(self) -> dict:
+        return {
+            'version': self.version,
+            'source': self.source,
+            'source_size': self.source_size,
+            'source_mtime_ns': self.source_mtime_ns,
+            'noise_db': self.noise_db,
+            'min_duration': self.min_duration,
+            'integrated_lufs': self.integrated_lufs,
+            'loudness_range': self.loudness_range,
+            'true_peak_db': self.true_peak_db,
+            'silence': self.silence.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'AnalysisReport':
+        return cls(
+            silence=SilenceReport.from_dict(data['silence']),
+            integrated_lufs=data.get('integrated_lufs'),
+            loudness_range=data.get('loudness_range'),
+            true_peak_db=data.get('true_peak_db'),
+            source=data.get('source'),
+            source_size=data.get('source_size', 0),
+            source_mtime_ns=data.get('source_mtime_ns', 0),
+            noise_db=data.get('noise_db', -30.0),
+            min_duration=data.get('min_duration', 0.5),
+            version=data.get('version', 0),
+        )
+
+    def save(self, path: str) -> None:
+        """原子地写入报告"""
+        path = Path(path)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}-")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['AnalysisReport']:
+        """读取报告，文件不存在或格式不对时返回 None"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+
+def report_path_for(output_path: str) -> Path:
+    """输出文件对应的分析报告路径，如 `audio/01-标题.mp3` -> `audio/01-标题.analysis.json`"""
+    output_path = Path(output_path)
+    return output_path.with_name(output_path.stem + REPORT_SUFFIX)
+
+
+def analysis_cmd(audio_path: str, sample_rate: int = SAMPLE_RATE,
+                 loudness: bool = True) -> List[str]:
+    """构建分析用的 ffmpeg 命令
+
+    ebur128 滤镜在原始声道上测量响度并把音频原样传下去，
+    之后再混成单声道 16 位 PCM 输出到管道供静音检测使用，响度摘要写在 stderr 中
+    """
+    cmd = ['ffmpeg', '-nostdin', '-hide_banner', '-nostats',
+           '-v', 'info' if loudness else 'error',
+           '-i', audio_path, '-vn']
+    if loudness:
+        cmd += ['-af', 'ebur128=peak=true:framelog=quiet']
+    cmd += [
+        '-ac', '1',
+        '-ar', str(sample_rate),
+        '-f', 's16le', '-acodec', 'pcm_s16le',
+        'pipe:1'
+    ]
+    return cmd
+
+
+def _parse_db(pattern: 're.Pattern', text: str) -> Optional[float]:
+    """取 ebur128 摘要中最后一次出现的数值，-inf 或全片静音（-70 LUFS）记为 None"""
+    matches = pattern.findall(text)
+    if not matches:
+        return None
+    value = float(matches[-1])
+    if math.isinf(value) or value <= -70.0:
+        return None
+    return value
+
+
+def analyze_recording(audio_path: str,
+                      noise_db: float = -30.0,
+                      min_duration: float = 0.5,
+                      sample_rate: int = SAMPLE_RATE,
+                      loudness: bool = True) -> AnalysisReport:
+    """解码一次音频，返回静音区间、时长、峰值和响度
+
+    Raises:
+        RuntimeError: 未安装 NumPy
+        subprocess.CalledProcessError: ffmpeg 解码失败
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("需要安装 numpy 库: pip install numpy")
+
+    st = os.stat(audio_path)
+    tracker = SilenceTracker(sample_rate, noise_db, min_duration)
+    stderr = _decode_into(analysis_cmd(audio_path, sample_rate, loudness), tracker)
+    return build_report(audio_path, st, tracker, stderr, noise_db, min_duration, loudness)
+
+
+def build_report(audio_path: str, st: os.stat_result, tracker: SilenceTracker, stderr: str,
+                 noise_db: float = -30.0, min_duration: float = 0.5,
+                 loudness: bool = True) -> AnalysisReport:
+    """由解码结束后的 tracker 和 ffmpeg 的 stderr 生成报告
+
+    st 是解码开始前的文件状态，用于之后判断报告是否仍然对应源文件
+    """
+    report = AnalysisReport(
+        silence=tracker.finish(),
+        source=str(audio_path),
+        source_size=st.st_size,
+        source_mtime_ns=st.st_mtime_ns,
+        noise_db=noise_db,
+        min_duration=min_duration,
+    )
+    if loudness:
+        report.integrated_lufs = _parse_db(_LOUDNESS_RE, stderr)
+        lra = _RANGE_RE.findall(stderr)
+        report.loudness_range = float(lra[-1]) if lra and not math.isinf(float(lra[-1])) else None
+        report.true_peak_db = _parse_db(_TRUE_PEAK_RE, stderr)
+    return report
+
+
+def load_report(audio_path: str, report_path: str,
+                noise_db: float = -30.0, min_duration: float = 0.5) -> Optional[AnalysisReport]:
+    """读取已保存的报告，源文件或参数变化时返回 None"""
+    report = AnalysisReport.load(report_path)
+    if report is not None and report.matches(audio_path, noise_db, min_duration):
+        return report
+    return None
+
+
+def load_or_analyze(audio_path: str, report_path: Optional[str] = None,
+                    noise_db: float = -30.0, min_duration: float = 0.5,
+                    sample_rate: int = SAMPLE_RATE) -> AnalysisReport:
+    """优先复用已保存的报告，否则分析并保存"""
+    if report_path:
+        report = load_report(audio_path, report_path, noise_db, min_duration)
+        if report is not None:
+            return report
+    report = analyze_recording(audio_path, noise_db, min_duration, sample_rate)
+    if report_path:
+        report.save(report_path)
+    return report
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='一次解码分析静音、响度和峰值')
+    parser.add_argument('audio', help='音频或录屏文件')
+    parser.add_argument('--save', default=None, help='把报告保存为 JSON 文件')
+    args = parser.parse_args()
+
+    report = load_or_analyze(args.audio, args.save)
+    silence = report.silence
+    print(f"总时长: {report.duration:.3f} 秒 ({report.total_samples} 采样点)")
+    if report.integrated_lufs is not None:
+        print(f"综合响度: {report.integrated_lufs:.1f} LUFS")
+    if report.loudness_range is not None:
+        print(f"响度范围: {report.loudness_range:.1f} LU")
+    if report.true_peak_db is not None:
+        print(f"真峰值: {report.true_peak_db:.1f} dBTP")
+        print(f"标准化到 {DEFAULT_TARGET_LUFS:.0f} LUFS 需要增益: "
+              f"{report.normalization_gain():+.2f} dB")
+    print(f"峰值: {silence.peak:.4f}  均方根: {silence.rms:.4f}")
+    for start, end in silence.spans:
+        print(f"  静音 {start / silence.sample_rate:.3f} - {end / silence.sample_rate:.3f} 秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,40 +7,42 @@
 import sys
 import os
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 # 添加 scripts 目录到路径，以便导入其他模块
 script_dir = Path(__file__).parent
 sys.path.insert(0, str(script_dir))
 
-from process_audio import find_cover_image, find_story_file, read_story_content, add_metadata
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3
+from process_audio import (find_cover_image, find_story_file, read_story_content, add_metadata,
+                           add_trace_arguments, TagWrite)
+from probe_cache import probe, probe_many
+from asset_index import build_asset_index, index_report
+from tracing import Tracer, aggregate, format_histogram, profiled, save_traces, span
 
 
 def has_complete_metadata(audio_path: str) -> bool:
-    """检查 MP3 文件是否有完整的元数据"""
-    try:
-        audio_file = MP3(audio_path, ID3=ID3)
-        
-        # 检查是否有标题
-        has_title = 'TIT2' in audio_file
-        
-        # 检查是否有封面
-        has_cover = any(k.startswith('APIC') for k in audio_file.keys())
-        
-        # 检查是否有简介
-        has_intro = any(k.startswith('COMM') for k in audio_file.keys())
-        
-        # 检查是否有全文
-        has_content = any(k.startswith('USLT') for k in audio_file.keys())
-        
-        return has_title and has_cover and has_intro and has_content
-    except:
-        return False
+    """检查 MP3 文件是否有完整的元数据（标题、封面、简介、全文）
+    
+    结果来自媒体信息缓存（见 probe_cache.py），未缓存时只读取 ID3 标签头和帧目录
+    """
+    return probe(audio_path).tags['complete']
 
 
-def process_audio_file(audio_path: str, dry_run: bool = False) -> bool:
-    """处理单个音频文件"""
+def process_audio_file(audio_path: str, dry_run: bool = False,
+                       check_existing: bool = True,
+                       tracer: Optional[Tracer] = None,
+                       writes: Optional[List[Tuple[Path, TagWrite]]] = None) -> bool:
+    """处理单个音频文件
+    
+    Args:
+        check_existing: 是否先检查已有元数据；调用方已经扫描过时可以关闭
+        tracer: 记录各步骤的耗时（可选，见 tracing.py）
+        writes: 传入列表时追加 (文件, TagWrite)，用于统计哪些文件被整体重写
+    
+    Returns:
+        是否写入（或已有）元数据；未找到封面和故事文件时为 False。
+        保存失败时抛出 RuntimeError，由调用方计入失败
+    """
     audio_path = Path(audio_path).resolve()
     
     print(f"\n{'='*60}")
@@ -48,7 +50,7 @@ def process_audio_file(audio_path: str, dry_run: bool = False) -> bool:
     print(f"{'='*60}")
     
     # 检查是否已有完整元数据
-    if has_complete_metadata(str(audio_path)):
+    if check_existing and has_complete_metadata(str(audio_path)):
         print("  ✓ 已有完整元数据，跳过")
         return True
     
@@ -56,27 +58,33 @@ def process_audio_file(audio_path: str, dry_run: bool = False) -> bool:
         print("  [模拟运行] 将添加元数据")
         return True
     
-    # 查找封面
-    print("\n查找封面图片...")
-    cover_path = find_cover_image(str(audio_path))
-    
-    # 查找故事文件
-    print("\n查找故事文件...")
-    story_path = find_story_file(str(audio_path))
-    
-    story_title = None
-    story_content = None
-    if story_path and os.path.exists(story_path):
-        print(f"  读取故事内容...")
-        story_title, story_content = read_story_content(story_path)
-        print(f"  ✓ 标题: {story_title}")
-        print(f"  ✓ 内容长度: {len(story_content)} 字符")
-    else:
-        print("  ⚠ 未找到故事文件")
+    with span(tracer, 'find_assets'):
+        # 查找封面
+        print("\n查找封面图片...")
+        cover_path = find_cover_image(str(audio_path))
+        
+        # 查找故事文件
+        print("\n查找故事文件...")
+        story_path = find_story_file(str(audio_path))
+        
+        story_title = None
+        story_content = None
+        if story_path and os.path.exists(story_path):
+            print(f"  读取故事内容...")
+            story_title, story_content = read_story_content(story_path)
+            print(f"  ✓ 标题: {story_title}")
+            print(f"  ✓ 内容长度: {len(story_content)} 字符")
+        else:
+            print("  ⚠ 未找到故事文件")
     
     # 添加元数据
     if cover_path or story_title:
-        add_metadata(str(audio_path), cover_path, story_title, story_content)
+        with span(tracer, 'add_metadata'):
+            result = add_metadata(str(audio_path), cover_path, story_title, story_content)
+        if result is None:
+            raise RuntimeError("保存元数据失败")
+        if writes is not None:
+            writes.append((audio_path, result))
         return True
     else:
         print("  ⚠ 未找到封面和故事文件，跳过")
@@ -90,6 +98,10 @@ def main():
     parser = argparse.ArgumentParser(description='批量为 audio 目录中的 MP3 文件添加元数据')
     parser.add_argument('--dry-run', action='store_true', help='模拟运行，不实际修改文件')
     parser.add_argument('--dir', default='audio', help='要处理的目录（默认: audio）')
+    parser.add_argument('--retag', action='store_true',
+                        help='重新写入所有文件的标签（修改文稿或封面后使用），'
+                             '新标签放得下时只覆盖文件开头的标签区域')
+    add_trace_arguments(parser)
     args = parser.parse_args()
     
     audio_dir = Path(args.dir).resolve()
@@ -109,29 +121,55 @@ def main():
     if args.dry_run:
         print("【模拟运行模式】")
     
+    # 检查故事文稿、封面和缩略图是否一一对应
+    problems = index_report(build_asset_index(str(audio_dir.parent)))
+    if problems:
+        print(f"⚠ 资源检查发现 {len(problems)} 个问题:")
+        for problem in problems:
+            print(f"  - {problem}")
+    
+    tracers = [] if args.trace_json else None
+    scan_tracer = Tracer('scan') if tracers is not None else None
+    
+    # 一次并行扫描所有文件的标签，得到完整性报告
+    with span(scan_tracer, 'scan_tags', files=len(mp3_files)):
+        report = {path: info.tags for path, info in probe_many(mp3_files).items()}
+    if scan_tracer is not None:
+        tracers.append(scan_tracer)
+    incomplete = [f for f in mp3_files if not report[str(f)]['complete']]
+    print(f"元数据完整: {len(mp3_files) - len(incomplete)} 个，需要处理: {len(incomplete)} 个")
+    for mp3_file in incomplete:
+        summary = report[str(mp3_file)]
+        reason = summary['error'] or f"缺少 {', '.join(summary['missing'])}"
+        print(f"  - {mp3_file.name}: {reason}")
+    
+    # --retag 时重新写入所有文件
+    targets = mp3_files if args.retag else incomplete
+    
     # 统计
     processed = 0
-    skipped = 0
+    skipped = len(mp3_files) - len(targets)
     failed = 0
+    writes: List[Tuple[Path, TagWrite]] = []
     
-    # 处理每个文件
-    for mp3_file in mp3_files:
-        try:
-            # 先检查是否已有完整元数据
-            if has_complete_metadata(str(mp3_file)):
-                skipped += 1
-                continue
-            
-            # 处理文件
-            if process_audio_file(str(mp3_file), args.dry_run):
-                processed += 1
-            else:
-                skipped += 1
-        except Exception as e:
-            print(f"  ✗ 处理失败: {e}")
-            failed += 1
-            import traceback
-            traceback.print_exc()
+    # 处理每个缺少元数据的文件
+    with profiled(args.profile, args.profiler):
+        for mp3_file in targets:
+            tracer = None
+            if tracers is not None:
+                tracer = Tracer(mp3_file.name)
+                tracers.append(tracer)
+            try:
+                if process_audio_file(str(mp3_file), args.dry_run, check_existing=False,
+                                      tracer=tracer, writes=writes):
+                    processed += 1
+                else:
+                    skipped += 1
+            except Exception as e:
+                print(f"  ✗ 处理失败: {e}")
+                failed += 1
+                import traceback
+                traceback.print_exc()
     
     # 输出统计
     print(f"\n{'='*60}")
@@ -141,8 +179,22 @@ def main():
     print(f"已处理: {processed} 个")
     print(f"已跳过: {skipped} 个（已有完整元数据或未找到对应文件）")
     if failed > 0:
-        print(f"失败: {failed} 个")
+        print(f"✗ 失败: {failed} 个")
+    if writes:
+        rewritten = [(path, w) for path, w in writes if w.rewritten]
+        print(f"原地更新标签: {len(writes) - len(rewritten)} 个，整体重写: {len(rewritten)} 个")
+        for path, w in rewritten:
+            reason = '原来没有标签' if not w.old_size else \
+                f'标签 {w.old_size/1024:.0f} KB -> {w.new_size/1024:.0f} KB'
+            print(f"  - {path.name}: {reason}（已预留 {w.padding/1024:.0f} KB 空白）")
     print(f"{'='*60}\n")
+    if tracers:
+        print("各步骤耗时分布:")
+        print(format_histogram(aggregate(t.to_dict() for t in tracers)))
+        save_traces(args.trace_json, tracers)
+        print(f"\n耗时记录: {args.trace_json}")
+    if failed > 0:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
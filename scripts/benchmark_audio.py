@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音频处理性能基准
+用 ffmpeg 在本地生成确定性的合成录音（类似语音的音调和噪声，开头和结尾注入已知长度的静音，
+可带或不带视频轨），分别计时提取、静音检测、裁剪、淡入、写入标签各步骤以及完整的 process_video，
+记录墙钟时间、CPU 时间（含 ffmpeg 子进程）和峰值内存，并与保存的基线比较。
+同时检查检测到的裁剪量与注入的静音是否一致
+
+用法：
+    python scripts/benchmark_audio.py [--sizes short,medium,long] [--repeat 3]
+    python scripts/benchmark_audio.py --save-baseline
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import dataclass
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from asset_index import build_asset_index
+from build_cache import default_cache_dir
+from mp3_header import read_mp3_info
+from process_audio import (add_metadata, apply_fade_in_effect, check_ffmpeg, compute_trims,
+                           detect_silence, extract_audio, process_video, read_story_content,
+                           trim_audio)
+
+
+BASELINE_VERSION = 1
+SAMPLE_RATE = 44100
+DEFAULT_THRESHOLD = 0.2  # 比基线慢 20% 以上视为性能回退
+MIN_REGRESSION_SECONDS = 0.05  # 差值小于此值时忽略（短步骤的计时抖动）
+DEFAULT_TOLERANCE = 0.05  # 裁剪量与注入静音的允许误差（秒），包含编码器延迟
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """一个合成录音：有声部分时长、开头和结尾注入的静音时长、是否带视频轨"""
+    name: str
+    speech_seconds: float
+    lead_silence: float
+    tail_silence: float
+    video: bool
+
+    @property
+    def total_seconds(self) -> float:
+        return self.lead_silence + self.speech_seconds + self.tail_silence
+
+    @property
+    def suffix(self) -> str:
+        return '.mov' if self.video else '.m4a'
+
+    def expected_trims(self, min_start_padding: float = 0.5,
+                       min_end_padding: float = 0.5) -> Tuple[float, float]:
+        """按注入的静音区间计算应得的裁剪量"""
+        speech_end = self.lead_silence + self.speech_seconds
+        return compute_trims([0.0, speech_end], [self.lead_silence, self.total_seconds],
+                             self.total_seconds, min_start_padding, min_end_padding)
+
+
+# 结尾静音需在 2 秒以内才会被裁剪（见 compute_trims）
+SIZES = {
+    'short': (30.0, 1.5, 1.2),
+    'medium': (600.0, 4.0, 1.8),
+    'long': (7200.0, 3.0, 1.0),
+}
+DEFAULT_SIZES = ('short', 'medium')
+
+STAGES = ('extract_audio', 'detect_silence', 'trim_audio', 'apply_fade_in_effect',
+          'add_metadata', 'process_video')
+
+
+def scenarios_for(sizes) -> List[Scenario]:
+    result = []
+    for size in sizes:
+        speech, lead, tail = SIZES[size]
+        for video in (False, True):
+            name = f"{size}-{'video' if video else 'audio'}"
+            result.append(Scenario(name, speech, lead, tail, video))
+    return result
+
+
+def synth_cmd(scenario: Scenario, output_path: str) -> List[str]:
+    """生成合成录音的 ffmpeg 命令
+
+    音调叠加固定种子的粉红噪声，再用慢速颤音调制出类似说话的起伏（包络始终高于静音阈值），
+    开头用 adelay、结尾用 apad 注入精确的数字静音
+    """
+    speech = f'{scenario.speech_seconds:g}'
+    graph = (
+        f'sine=frequency=180:sample_rate={SAMPLE_RATE}:duration={speech}[tone];'
+        f'anoisesrc=color=pink:seed=42:amplitude=0.2:sample_rate={SAMPLE_RATE}:duration={speech}[noise];'
+        '[tone][noise]amix=inputs=2,tremolo=f=2.7:d=0.5,volume=2,'
+        f'adelay={scenario.lead_silence * 1000:g},apad=pad_dur={scenario.tail_silence:g}[a]'
+    )
+    cmd = ['ffmpeg', '-nostdin', '-v', 'error', '-y', '-filter_complex', graph]
+    if scenario.video:
+        cmd += ['-f', 'lavfi', '-i', f'color=c=black:s=320x240:r=5:d={scenario.total_seconds:g}',
+                '-map', '0:v', '-c:v', 'mpeg4', '-q:v', '10']
+    cmd += ['-map', '[a]', '-c:a', 'aac', '-b:a', '128k', '-ac', '1',
+            '-t', f'{scenario.total_seconds:g}', output_path]
+    return cmd
+
+
+def ensure_input(scenario: Scenario, inputs_dir: Path) -> Path:
+    """生成（或复用已生成的）合成录音"""
+    path = inputs_dir / (f'{scenario.name}-{scenario.speech_seconds:g}-'
+                         f'{scenario.lead_silence:g}-{scenario.tail_silence:g}{scenario.suffix}')
+    if not path.exists():
+        inputs_dir.mkdir(parents=True, exist_ok=True)
+        print(f"生成合成录音: {path.name} ({scenario.total_seconds:.0f} 秒)")
+        partial = path.with_name(f'.{path.name}.partial{scenario.suffix}')
+        subprocess.run(synth_cmd(scenario, str(partial)), check=True, capture_output=True)
+        os.replace(partial, path)
+    return path
+
+
+def _cpu_seconds(usage) -> float:
+    return usage.ru_utime + usage.ru_stime
+
+
+def _measure(stage: str, args: tuple) -> Tuple[object, dict]:
+    """在独立进程中执行一个步骤，返回 (结果, 指标)
+
+    每个步骤使用新进程，峰值内存（本进程和 ffmpeg 子进程中的较大者）只反映这一步
+    """
+    func = {
+        'extract_audio': extract_audio,
+        'detect_silence': detect_silence,
+        'trim_audio': trim_audio,
+        'apply_fade_in_effect': apply_fade_in_effect,
+        'add_metadata': add_metadata,
+        'process_video': process_video,
+    }[stage]
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        self_before = resource.getrusage(resource.RUSAGE_SELF)
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        started = time.perf_counter()
+        value = func(*args)
+        wall = time.perf_counter() - started
+        self_after = resource.getrusage(resource.RUSAGE_SELF)
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (_cpu_seconds(self_after) - _cpu_seconds(self_before)
+           + _cpu_seconds(children_after) - _cpu_seconds(children_before))
+    peak = max(self_after.ru_maxrss, children_after.ru_maxrss)
+    peak_mb = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # macOS 上单位为字节
+    return value, {'wall': wall, 'cpu': cpu, 'peak_rss_mb': peak_mb}
+
+
+def _best(runs: List[dict]) -> dict:
+    """多次运行取最小的时间，峰值内存取最大值"""
+    return {
+        'wall': min(r['wall'] for r in runs),
+        'cpu': min(r['cpu'] for r in runs),
+        'peak_rss_mb': max(r['peak_rss_mb'] for r in runs),
+    }
+
+
+def _sample_assets() -> Tuple[Optional[str], Optional[str]]:
+    """取一个同时有封面和文稿的故事，让写入标签的耗时接近真实情况"""
+    for entry in build_asset_index().values():
+        if entry.cover and entry.story:
+            return entry.cover, entry.story
+    return None, None
+
+
+def run_scenario(scenario: Scenario, source: Path, work_dir: Path, repeat: int,
+                 tolerance: float) -> dict:
+    """对一个合成录音计时所有步骤，并检查裁剪量"""
+    cover_path, story_path = _sample_assets()
+    story_title, story_content = read_story_content(story_path) if story_path else (None, None)
+    extracted = work_dir / f'{scenario.name}_temp.mp3'
+    trimmed = work_dir / f'{scenario.name}_trimmed.mp3'
+    faded = work_dir / f'{scenario.name}_with_fade.mp3'
+    final = work_dir / f'{scenario.name}.mp3'
+
+    metrics: Dict[str, dict] = {}
+
+    def timed(stage, *args):
+        runs = []
+        for _ in range(repeat):
+            # 每次都用新进程，ru_maxrss 是进程生命周期内的峰值，不能复用
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                value, run = executor.submit(_measure, stage, args).result()
+            runs.append(run)
+        metrics[stage] = _best(runs)
+        return value
+
+    problems = []
+    if not timed('extract_audio', str(source), str(extracted)):
+        return {'metrics': metrics, 'problems': ['提取音频失败']}
+    start_trim, end_trim = timed('detect_silence', str(extracted))
+    timed('trim_audio', str(extracted), str(trimmed), start_trim, end_trim)
+    timed('apply_fade_in_effect', str(trimmed), str(faded))
+    timed('add_metadata', str(faded), cover_path, story_title, story_content)
+    if not timed('process_video', str(source), str(final), cover_path, story_path):
+        problems.append('process_video 失败')
+
+    # 检测到的裁剪量应与注入的静音一致
+    expected_start, expected_end = scenario.expected_trims()
+    if abs(start_trim - expected_start) > tolerance:
+        problems.append(f'开头裁剪 {start_trim:.3f} 秒，应为 {expected_start:.3f} 秒')
+    if abs(end_trim - expected_end) > tolerance:
+        problems.append(f'结尾裁剪 {end_trim:.3f} 秒，应为 {expected_end:.3f} 秒')
+    expected_duration = scenario.total_seconds - expected_start - expected_end
+    if final.exists():
+        duration = read_mp3_info(str(final)).duration
+        if abs(duration - expected_duration) > 2 * tolerance:
+            problems.append(f'输出时长 {duration:.3f} 秒，应为 {expected_duration:.3f} 秒')
+    for path in (extracted, trimmed, faded, final):
+        if path.exists():
+            path.unlink()
+    return {
+        'metrics': metrics,
+        'trims': {'start': start_trim, 'end': end_trim,
+                  'expected_start': expected_start, 'expected_end': expected_end},
+        'problems': problems,
+    }
+
+
+def compare_to_baseline(results: Dict[str, dict], baseline: dict,
+                        threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """返回比基线慢（或峰值内存更高）超过阈值的步骤"""
+    regressions = []
+    for name, result in results.items():
+        for stage, current in result['metrics'].items():
+            previous = baseline.get(name, {}).get(stage)
+            if not previous:
+                continue
+            if current['wall'] > previous['wall'] * (1 + threshold) \
+                    and current['wall'] - previous['wall'] > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{name} / {stage}: 耗时 {previous['wall']:.3f} -> "
+                                   f"{current['wall']:.3f} 秒")
+            if current['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + threshold):
+                regressions.append(f"{name} / {stage}: 峰值内存 {previous['peak_rss_mb']:.0f} -> "
+                                   f"{current['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def load_baseline(path: Path) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data.get('results', {}) if data.get('version') == BASELINE_VERSION else {}
+
+
+def save_baseline(path: Path, results: Dict[str, dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {'version': BASELINE_VERSION,
+            'results': {name: r['metrics'] for name, r in results.items()}}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def print_results(results: Dict[str, dict]) -> None:
+    print(f"\n{'场景':<14}{'步骤':<22}{'墙钟(秒)':>10}{'CPU(秒)':>10}{'峰值内存(MB)':>14}")
+    for name, result in results.items():
+        for stage in STAGES:
+            m = result['metrics'].get(stage)
+            if m:
+                print(f"{name:<14}{stage:<22}{m['wall']:>10.3f}{m['cpu']:>10.3f}"
+                      f"{m['peak_rss_mb']:>14.1f}")
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    bench_dir = default_cache_dir() / 'bench'
+    parser = argparse.ArgumentParser(description='用合成录音测试音频处理各步骤的性能')
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help=f"录音长度，逗号分隔: {', '.join(SIZES)}（默认: {','.join(DEFAULT_SIZES)}；"
+                             f"long 为 2 小时）")
+    parser.add_argument('--repeat', type=int, default=1, help='每个步骤重复次数，取最快的一次（默认: 1）')
+    parser.add_argument('--baseline', default=str(bench_dir / 'baseline.json'),
+                        help='基线文件路径（默认: .cache/bench/baseline.json）')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'回退阈值（相对基线，默认: {DEFAULT_THRESHOLD:g}）')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'裁剪量允许误差（秒，默认: {DEFAULT_TOLERANCE:g}）')
+    parser.add_argument('--json', default=None, help='把结果保存为 JSON 文件')
+    args = parser.parse_args()
+
+    if not check_ffmpeg():
+        sys.exit(1)
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"未知的长度: {', '.join(unknown)}")
+
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory(prefix='wuwunv-bench-') as work_dir:
+        for scenario in scenarios_for(sizes):
+            source = ensure_input(scenario, bench_dir / 'inputs')
+            print(f"测试: {scenario.name} ({scenario.total_seconds:.0f} 秒)")
+            results[scenario.name] = run_scenario(scenario, source, Path(work_dir), args.repeat,
+                                                  args.tolerance)
+
+    print_results(results)
+    failed = False
+    for name, result in results.items():
+        for problem in result['problems']:
+            print(f"  ✗ {name}: {problem}")
+            failed = True
+
+    baseline_path = Path(args.baseline)
+    baseline = load_baseline(baseline_path)
+    if baseline:
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"  ✗ 性能回退 {regression}")
+        if regressions:
+            failed = True
+        else:
+            print(f"\n✓ 与基线相比没有超过 {args.threshold:.0%} 的回退")
+    elif not args.save_baseline:
+        print(f"\n⚠ 没有基线，可以用 --save-baseline 保存本次结果")
+    if args.save_baseline:
+        save_baseline(baseline_path, results)
+        print(f"✓ 基线已保存: {baseline_path}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
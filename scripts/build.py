@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按依赖关系更新整个故事目录
+把各脚本的工作当作规则，由资源布局（见 asset_index.py）得到依赖图：
+
+- mp3:<故事名>      录屏 + 文稿 + 封面 -> audio/<故事名>.mp3（没有录屏时只根据文稿和封面重写标签）
+- thumbnail:<故事名> 封面 -> audio/thumbnails/ 下的缩略图
+- catalog           全部文稿、封面、缩略图和 MP3 -> catalog.json、feed.xml、README 表格
+
+每个目标成功后把输入和输出的 (大小, 修改时间, 哈希) 以及参数记录在缓存目录的 build_state.json 中，
+下次只重建记录不一致的目标和依赖它们的目标，互不依赖的目标并行执行。
+MP3 只有文稿或封面变化时原地重写标签，不重新编码
+
+用法：
+    python scripts/build.py                          # 录屏默认在项目根目录的 recordings/
+    python scripts/build.py --dry-run                # 只列出需要重建的目标和原因
+    python scripts/build.py --recordings ~/录屏 --jobs 4
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from asset_index import AssetEntry, build_asset_index, invalidate, project_root, story_key
+from audio_analysis import DEFAULT_TARGET_LUFS
+from build_cache import BuildCache, default_cache_dir, file_hash
+from cover_art import PIL_AVAILABLE
+from process_audio import add_metadata, collect_recordings, process_video, read_story_content
+
+
+STATE_NAME = 'build_state.json'
+STATE_VERSION = 1  # 记录格式或规则变化时加一，所有目标重新检查
+
+
+@dataclass
+class Target:
+    """依赖图中的一个目标
+
+    inputs 在检查和记录时调用，得到当时的输入文件列表（目录的输入会随上游目标的输出变化）；
+    action(target, 上次的记录) 返回是否成功
+    """
+    name: str
+    inputs: Callable[[], List[str]]
+    outputs: List[str]
+    action: Callable[['Target', Optional[dict]], bool]
+    deps: List[str] = field(default_factory=list)
+    settings: dict = field(default_factory=dict)
+
+
+def _signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _unchanged(path: str, recorded: List) -> bool:
+    """文件与记录一致；只有修改时间变化时（例如重新检出）比较内容哈希"""
+    signature = _signature(path)
+    if signature is None:
+        return False
+    if tuple(recorded[:2]) == signature:
+        return True
+    return signature[0] == recorded[0] and len(recorded) > 2 and file_hash(path) == recorded[2]
+
+
+class BuildState:
+    """每个目标上次成功时的输入、输出和参数，保存在缓存目录的 build_state.json 中"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or default_cache_dir() / STATE_NAME
+        self.targets: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == STATE_VERSION:
+                self.targets = data.get('targets', {})
+        except (OSError, ValueError):
+            pass
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            return self.targets.get(name)
+
+    def stale_reason(self, target: Target) -> Optional[str]:
+        """目标需要重建的原因，已是最新时返回 None"""
+        stamp = self.get(target.name)
+        if stamp is None:
+            return '没有构建记录'
+        if stamp['settings'] != target.settings:
+            return '参数变化'
+        for path in target.outputs:
+            recorded = stamp['outputs'].get(path)
+            if recorded is None or _signature(path) is None:
+                return f'缺少输出 {Path(path).name}'
+            if not _unchanged(path, recorded):
+                return f'输出被修改 {Path(path).name}'
+        inputs = target.inputs()
+        if set(inputs) != set(stamp['inputs']):
+            return '输入文件增减'
+        for path in inputs:
+            if not _unchanged(path, stamp['inputs'][path]):
+                return f'输入变化 {Path(path).name}'
+        return None
+
+    def record(self, target: Target) -> None:
+        """目标成功后记录当前的输入和输出；未变化的文件沿用上次的哈希"""
+        previous = self.get(target.name) or {'inputs': {}, 'outputs': {}}
+
+        def describe(paths: List[str], recorded: Dict[str, List]) -> Dict[str, List]:
+            result = {}
+            for path in paths:
+                signature = _signature(path)
+                if signature is None:
+                    continue
+                old = recorded.get(path)
+                if old and tuple(old[:2]) == signature and len(old) > 2:
+                    digest = old[2]
+                else:
+                    digest = file_hash(path)
+                result[path] = [signature[0], signature[1], digest]
+            return result
+
+        stamp = {'settings': target.settings,
+                 'inputs': describe(target.inputs(), previous['inputs']),
+                 'outputs': describe(target.outputs, previous['outputs'])}
+        with self._lock:
+            self.targets[target.name] = stamp
+            self._save()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'.{self.path.name}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': STATE_VERSION, 'targets': self.targets}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+# ---- 规则 ----
+
+def _files(*paths: Optional[str]) -> List[str]:
+    return [p for p in paths if p]
+
+
+def _tags_current(mp3_path: str, index: Dict[str, AssetEntry],
+                  cache: Optional[BuildCache]) -> bool:
+    """MP3 中的标签是否已经与当前的文稿和封面一致（与 verify_audio 相同的比较，只读）"""
+    from verify_audio import check_audio
+
+    result = check_audio(mp3_path, index, cache)
+    return bool(result['ok']) and all(v is not False for v in result['matches'].values())
+
+
+def mp3_target(entry: AssetEntry, recording: Optional[str], root: Path,
+               index: Dict[str, AssetEntry], options: dict) -> Target:
+    """录屏 -> MP3；文稿或封面变化而录屏未变时只重写标签"""
+    output = entry.audio or str(root / 'audio' / f'{entry.key}.mp3')
+
+    def inputs() -> List[str]:
+        return _files(recording, entry.story, entry.cover)
+
+    def action(target: Target, stamp: Optional[dict]) -> bool:
+        if stamp is None and os.path.exists(output) and (
+                recording is None or _signature(output)[1] >= _signature(recording)[1]):
+            # 第一次构建时，已有的 MP3 比录屏新且标签与源文件一致，直接记录
+            if _tags_current(output, index, options.get('cache')):
+                print(f"  ✓ {entry.key}: MP3 已是最新")
+                return True
+        retag = (recording is None or (
+            stamp is not None and stamp['settings'] == target.settings
+            and not options.get('chapters')  # 章节由文稿和静音位置计算，需要完整流程
+            and recording in stamp['inputs'] and _unchanged(recording, stamp['inputs'][recording])
+            and output in stamp['outputs'] and _unchanged(output, stamp['outputs'][output])))
+        if retag:
+            if not os.path.exists(output):
+                print(f"  ✗ {entry.key}: 没有录屏，也没有已发布的 MP3")
+                return False
+            title, content = read_story_content(entry.story) if entry.story else (None, None)
+            return add_metadata(output, entry.cover, title, content) is not None
+        return bool(process_video(recording, output, cover_path=entry.cover,
+                                  story_path=entry.story, **options))
+
+    settings = {'recording': recording is not None,
+                'loudnorm': options.get('target_lufs'),
+                'chapters': options.get('chapters', False),
+                'sylt': options.get('sylt', False)}
+    return Target(f'mp3:{entry.key}', inputs, [output], action, settings=settings)
+
+
+class ThumbnailRule:
+    """封面 -> 缩略图，调用 generate_thumbnails 的单张处理函数，结果同样记在它的清单中"""
+
+    def __init__(self, root: Path):
+        import generate_thumbnails  # 需要 Pillow，调用方已检查
+
+        self.module = generate_thumbnails
+        self.thumb_dir = root / 'audio' / 'thumbnails'
+        self.sizes = tuple(generate_thumbnails.DEFAULT_SIZES)
+        self.formats = tuple(generate_thumbnails.DEFAULT_FORMATS)
+        self.manifest = generate_thumbnails.load_manifest(self.thumb_dir)
+        self._lock = threading.Lock()
+
+    def target(self, entry: AssetEntry) -> Target:
+        cover = Path(entry.cover)
+        outputs = [str(out) for _, _, out in
+                   self.module.thumbnail_outputs(cover, self.thumb_dir, self.sizes, self.formats)]
+
+        def action(target: Target, stamp: Optional[dict]) -> bool:
+            self.thumb_dir.mkdir(parents=True, exist_ok=True)
+            with self._lock:
+                record = self.manifest.get(cover.name)
+            # 有构建记录时已确认过期，直接生成；第一次构建时沿用 generate_thumbnails 的检查
+            result = self.module.process_cover(cover, self.thumb_dir, self.sizes, self.formats,
+                                               record=record, force=stamp is not None)
+            with self._lock:
+                if result['record'] is not None:
+                    self.manifest[cover.name] = result['record']
+                self.module.save_manifest(self.thumb_dir, self.manifest)
+            if result['status'] == 'failed':
+                print(f"  ✗ {entry.key}: 生成缩略图失败: {result['error']}")
+                return False
+            return True
+
+        settings = {'sizes': list(self.sizes), 'formats': list(self.formats)}
+        return Target(f'thumbnail:{entry.key}', lambda: [str(cover)], outputs, action,
+                      settings=settings)
+
+
+def catalog_target(root: Path, deps: List[str], base_url: str, readme: bool) -> Target:
+    """全部资源 -> catalog.json、feed.xml 和 README 表格（README 允许手工编辑，不作为输出检查）"""
+
+    def inputs() -> List[str]:
+        invalidate()  # 上游目标可能刚生成了新文件
+        return sorted(path for entry in build_asset_index(str(root)).values()
+                      for path in _files(entry.story, entry.cover, entry.thumbnail, entry.audio))
+
+    def action(target: Target, stamp: Optional[dict]) -> bool:
+        from build_catalog import update_catalog
+
+        invalidate()
+        _, changed = update_catalog(root, base_url, readme=readme)
+        print(f"  已更新: {', '.join(changed) if changed else '无变化'}")
+        return True
+
+    return Target('catalog', inputs, [str(root / 'catalog.json'), str(root / 'feed.xml')],
+                  action, deps=deps, settings={'base_url': base_url, 'readme': readme})
+
+
+def match_recordings(recordings: List[Path],
+                     index: Dict[str, AssetEntry]) -> Tuple[Dict[str, str], List[str]]:
+    """按故事名匹配录屏，返回 ({故事名: 录屏}, 问题列表)"""
+    matched: Dict[str, str] = {}
+    problems = []
+    for recording in recordings:
+        key = story_key(str(recording))
+        entry = index.get(key)
+        if entry is None or not entry.story:
+            problems.append(f"{recording.name}: 找不到对应的故事文稿，跳过")
+        elif key in matched:
+            problems.append(f"{recording.name}: {key} 已有录屏 {Path(matched[key]).name}，跳过")
+        else:
+            matched[key] = str(recording)
+    return matched, problems
+
+
+def build_graph(root: Path, recordings: List[Path], options: dict, base_url: str = '',
+                readme: bool = True) -> Tuple[Dict[str, Target], List[str]]:
+    """由资源布局得到全部目标，返回 ({目标名: Target}, 问题列表)"""
+    invalidate()
+    index = build_asset_index(str(root))
+    matched, problems = match_recordings(recordings, index)
+    thumbnails = ThumbnailRule(root) if PIL_AVAILABLE else None
+    if thumbnails is None:
+        problems.append("未安装 Pillow，跳过缩略图")
+
+    targets: Dict[str, Target] = {}
+    for entry in index.values():
+        recording = matched.get(entry.key)
+        if recording or (entry.audio and (entry.story or entry.cover)):
+            target = mp3_target(entry, recording, root, index, options)
+            targets[target.name] = target
+        if entry.cover and thumbnails is not None:
+            target = thumbnails.target(entry)
+            targets[target.name] = target
+    catalog = catalog_target(root, list(targets), base_url, readme)
+    targets[catalog.name] = catalog
+    return targets, problems
+
+
+# ---- 执行 ----
+
+def topological_order(targets: Dict[str, Target]) -> List[str]:
+    """依赖在前的目标顺序，有环时抛出 ValueError"""
+    order: List[str] = []
+    state: Dict[str, int] = {}  # 1 = 访问中，2 = 完成
+
+    def visit(name: str) -> None:
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f"依赖有环: {name}")
+        state[name] = 1
+        for dep in targets[name].deps:
+            visit(dep)
+        state[name] = 2
+        order.append(name)
+
+    for name in targets:
+        visit(name)
+    return order
+
+
+def plan(targets: Dict[str, Target], state: BuildState, force: bool = False) -> Dict[str, str]:
+    """需要重建的目标及原因（按依赖顺序），依赖需要重建的目标也要重建"""
+    stale: Dict[str, str] = {}
+    for name in topological_order(targets):
+        target = targets[name]
+        reason = '强制重建' if force else state.stale_reason(target)
+        if reason is None:
+            rebuilt = [dep for dep in target.deps if dep in stale]
+            if rebuilt:
+                reason = f'依赖需要重建（{len(rebuilt)} 个）'
+        if reason is not None:
+            stale[name] = reason
+    return stale
+
+
+def execute(targets: Dict[str, Target], stale: Dict[str, str], state: BuildState,
+            jobs: int) -> Dict[str, str]:
+    """并行执行需要重建的目标，返回 {目标名: 'built' | 'failed' | 'skipped'}
+
+    目标失败时依赖它的目标跳过，其余目标继续执行
+    """
+    results: Dict[str, str] = {}
+    waiting = {name: {dep for dep in targets[name].deps if dep in stale} for name in stale}
+
+    def run(name: str) -> bool:
+        target = targets[name]
+        print(f"▶ {name}（{stale[name]}）")
+        started = time.perf_counter()
+        try:
+            ok = target.action(target, state.get(name))
+        except Exception as e:
+            print(f"  ✗ {name}: {e}")
+            ok = False
+        if ok:
+            state.record(target)
+            print(f"✓ {name}（{time.perf_counter() - started:.1f} 秒）")
+        else:
+            print(f"✗ {name} 失败")
+        return ok
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while waiting or running:
+            for name in [n for n, deps in waiting.items() if not deps]:
+                del waiting[name]
+                running[executor.submit(run, name)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = 'built' if future.result() else 'failed'
+                for other, deps in list(waiting.items()):
+                    if name not in deps:
+                        continue
+                    if results[name] == 'built':
+                        deps.discard(name)
+                    else:
+                        _skip(other, waiting, results)
+    return results
+
+
+def _skip(name: str, waiting: Dict[str, set], results: Dict[str, str]) -> None:
+    """依赖失败，跳过目标以及依赖它的目标"""
+    if name not in waiting:
+        return
+    del waiting[name]
+    results[name] = 'skipped'
+    print(f"  - {name}: 依赖失败，跳过")
+    for other, deps in list(waiting.items()):
+        if name in deps:
+            _skip(other, waiting, results)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='按依赖关系更新 MP3、缩略图和故事目录，只重建过期的目标')
+    parser.add_argument('--root', default=None, help='项目根目录（默认: 脚本所在项目）')
+    parser.add_argument('--recordings', action='append', default=None, metavar='DIR',
+                        help='录屏目录或通配符，可重复（默认: 项目根目录的 recordings/）')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='同时执行的目标数（默认: CPU 核心数）')
+    parser.add_argument('--dry-run', '-n', action='store_true', help='只列出需要重建的目标和原因')
+    parser.add_argument('--force', action='store_true', help='忽略构建记录，全部重建')
+    parser.add_argument('--base-url', default=os.environ.get('WUWUNV_BASE_URL', ''),
+                        help='RSS 中的网址前缀（默认读取 WUWUNV_BASE_URL）')
+    parser.add_argument('--no-readme', action='store_true', help='不更新 README.md')
+    parser.add_argument('--no-cache', action='store_true', help='不使用构建缓存')
+    parser.add_argument('--loudnorm', nargs='?', type=float, const=DEFAULT_TARGET_LUFS,
+                        default=None, metavar='LUFS',
+                        help=f'响度标准化（默认目标 {DEFAULT_TARGET_LUFS} LUFS）')
+    parser.add_argument('--chapters', action='store_true', help='写入 ID3 章节（见 chapters.py）')
+    parser.add_argument('--sylt', action='store_true', help='同时写入同步歌词，隐含 --chapters')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    root = Path(args.root).resolve() if args.root else project_root()
+    base_url = args.base_url
+    if base_url and not base_url.endswith('/'):
+        base_url += '/'
+    sources = args.recordings or ([str(root / 'recordings')] if (root / 'recordings').is_dir() else [])
+    recordings = collect_recordings(sources)
+
+    cache = None if args.no_cache else BuildCache(auto_evict=False)  # 全部完成后淘汰一次
+    options = {'cache': cache,
+               'target_lufs': args.loudnorm,
+               'chapters': args.chapters or args.sylt,
+               'sylt': args.sylt}
+    targets, problems = build_graph(root, recordings, options, base_url, not args.no_readme)
+    for problem in problems:
+        print(f"⚠ {problem}")
+
+    state = BuildState()
+    stale = plan(targets, state, force=args.force)
+    print(f"共 {len(targets)} 个目标（录屏 {len(recordings)} 个），需要重建 {len(stale)} 个")
+    if args.dry_run:
+        for name, reason in stale.items():
+            deps = [dep for dep in targets[name].deps if dep in stale]
+            after = f"，在 {len(deps)} 个目标之后" if deps else ''
+            print(f"  {name}: {reason}{after}")
+        return
+    if not stale:
+        print("✓ 全部是最新的")
+        return
+
+    results = execute(targets, stale, state, args.jobs or os.cpu_count() or 1)
+    if cache is not None:
+        cache.evict()
+    counts = {status: sum(1 for r in results.values() if r == status)
+              for status in ('built', 'failed', 'skipped')}
+    print(f"\n完成：重建 {counts['built']} 个，失败 {counts['failed']} 个，"
+          f"跳过 {counts['skipped']} 个，耗时 {time.perf_counter() - started:.1f} 秒")
+    if counts['failed'] or counts['skipped']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
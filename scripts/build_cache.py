@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按内容寻址的构建缓存
+以输入文件内容哈希和处理参数作为键，保存分析结果、编码后的音频和最终的 MP3，
+总大小超过上限时按最近最少使用（LRU）的顺序淘汰
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 默认缓存上限 2 GB
+# 超过上限时淘汰到上限的 90%，缓存写满后不会每次写入都扫描一遍目录
+EVICT_TARGET = 0.9
+TMP_PREFIX = '.tmp-'  # 写入中的临时文件，淘汰时跳过
+
+
+def default_cache_dir() -> Path:
+    """缓存根目录：优先使用环境变量 WUWUNV_CACHE_DIR，否则为项目根目录下的 .cache"""
+    env_dir = os.environ.get('WUWUNV_CACHE_DIR')
+    if env_dir:
+        return Path(env_dir).expanduser()
+    return Path(__file__).resolve().parents[1] / '.cache'
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts) -> str:
+    """把若干可 JSON 序列化的部分组合成缓存键"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class BuildCache:
+    """构建缓存
+
+    文件保存在 <root>/build/<类别>/<键前两位>/<键><扩展名>，
+    每次命中都会刷新文件的修改时间，淘汰时按修改时间从旧到新删除。
+    写入时累加估计的总大小，只有估计值超过上限时才扫描目录淘汰；
+    批量处理可以关闭 auto_evict，全部完成后调用一次 evict()。
+    其他线程或进程可能随时淘汰文件，get_file 返回的路径读取失败时应当作未命中。
+    """
+
+    # 各缓存目录估计的总大小，进程内所有实例共用（很多地方临时创建 BuildCache()），
+    # 第一次写入时扫描一次得到
+    _sizes: Dict[Path, int] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, root: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 auto_evict: bool = True):
+        self.root = (Path(root) if root else default_cache_dir()) / 'build'
+        self.max_bytes = max_bytes
+        self.auto_evict = auto_evict
+
+    def _path(self, kind: str, key: str, suffix: str) -> Path:
+        return self.root / kind / key[:2] / f"{key}{suffix}"
+
+    @staticmethod
+    def _touch(path: Path) -> None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def get_file(self, kind: str, key: str, suffix: str = '') -> Optional[Path]:
+        """查找缓存文件，命中时返回路径"""
+        path = self._path(kind, key, suffix)
+        if path.is_file():
+            self._touch(path)
+            return path
+        return None
+
+    def read_bytes(self, kind: str, key: str, suffix: str = '') -> Optional[bytes]:
+        """读取缓存文件的内容，未命中或查找后刚被淘汰时返回 None"""
+        path = self.get_file(kind, key, suffix)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _stored(self, path: Path) -> None:
+        """记录新写入的文件，估计的总大小超过上限时淘汰"""
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+        with self._lock:
+            if self.root in self._sizes:
+                self._sizes[self.root] += size
+            else:
+                self._sizes[self.root] = sum(entry[1] for entry in self._entries())
+            over = self._sizes[self.root] > self.max_bytes
+        if over and self.auto_evict:
+            self.evict()
+
+    def put_file(self, kind: str, key: str, source: str, suffix: str = '') -> Path:
+        """把文件复制进缓存（先写临时文件再原子替换，可安全并发）"""
+        path = self._path(kind, key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=TMP_PREFIX)
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        self._stored(path)
+        return path
+
+    def put_bytes(self, kind: str, key: str, data: bytes, suffix: str = '') -> Path:
+        """把内存中的数据写入缓存"""
+        path = self._path(kind, key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=TMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        self._stored(path)
+        return path
+
+    def get_json(self, kind: str, key: str) -> Optional[dict]:
+        """读取缓存的 JSON 数据"""
+        path = self.get_file(kind, key, '.json')
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put_json(self, kind: str, key: str, data: dict) -> Path:
+        """写入 JSON 数据"""
+        path = self._path(kind, key, '.json')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=TMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        self._stored(path)
+        return path
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """列出缓存文件 (修改时间, 大小, 路径)，跳过写入中的临时文件"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.startswith(TMP_PREFIX):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # 已被其他进程删除
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self) -> int:
+        """总大小超过上限时删除最久未使用的文件，直到低于上限的 90%，返回删除的文件数"""
+        if not self.root.exists():
+            return 0
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * EVICT_TARGET:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                    removed += 1
+                except OSError:
+                    pass
+        with self._lock:
+            self._sizes[self.root] = total
+        return removed
+
+    def clear(self) -> None:
+        """清空缓存"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        with self._lock:
+            self._sizes[self.root] = 0
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='管理构建缓存')
+    parser.add_argument('--clear', action='store_true', help='清空缓存')
+    parser.add_argument('--max-mb', type=int, default=None, help='按指定上限（MB）执行一次淘汰')
+    args = parser.parse_args()
+
+    max_bytes = args.max_mb * 1024 ** 2 if args.max_mb else DEFAULT_MAX_BYTES
+    cache = BuildCache(max_bytes=max_bytes)
+    if args.clear:
+        cache.clear()
+        print(f"✓ 已清空缓存: {cache.root}")
+        sys.exit(0)
+
+    removed = cache.evict()
+    size = sum(p.stat().st_size for p in cache.root.rglob('*') if p.is_file()) if cache.root.exists() else 0
+    print(f"缓存目录: {cache.root}")
+    print(f"  当前大小: {size / 1024 ** 2:.1f} MB (上限 {max_bytes / 1024 ** 2:.0f} MB)")
+    print(f"  本次淘汰: {removed} 个文件")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成故事目录
+扫描故事文稿、audio/ 中的封面和 MP3，只读取 MP3 的帧头、Xing 头和 ID3 标签目录，
+输出 JSON 目录、播客 RSS 订阅源，并更新 README.md 中的故事目录表格。
+文稿解析结果和媒体信息分别缓存（见 story_corpus.py、probe_cache.py），未变化的文件不会重新读取
+
+用法：
+    python scripts/build_catalog.py [--base-url https://example.com/wuwunv/] [--no-readme]
+"""
+
+import json
+import os
+import time
+from email.utils import formatdate
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+from xml.sax.saxutils import escape, quoteattr
+
+from asset_index import AssetEntry, build_asset_index, index_report, project_root
+from mp3_header import format_duration
+from probe_cache import probe
+from renditions import ALBUM, ARTIST
+from story_corpus import load_story
+
+
+CHANNEL_DESCRIPTION = '围绕「巫巫女」展开的睡前与静心故事合集，适合大人和小朋友一起听。'
+CHANNEL_LANGUAGE = 'zh-cn'
+CHANNEL_CATEGORY = 'Kids & Family'
+
+README_START = '<!-- catalog:start -->'
+README_END = '<!-- catalog:end -->'
+
+
+def _read_audio(path: str) -> dict:
+    """从媒体信息缓存得到时长、大小、标题和内嵌封面信息（见 probe_cache.py）"""
+    info = probe(path)
+    tags = info.tags
+    return {
+        'bytes': info.size,
+        'duration': round(info.duration, 3),
+        'bitrate': info.bitrate,
+        'sample_rate': info.sample_rate,
+        'title': tags['title'],
+        'embedded_cover_bytes': tags['frames'].get('APIC', 0),
+        'error': info.error or tags['error'],
+    }
+
+
+def _relative(path: Optional[str], root: Path) -> Optional[str]:
+    return Path(path).resolve().relative_to(root).as_posix() if path else None
+
+
+def load_published(catalog_path: Path) -> Dict[str, str]:
+    """从已有的 JSON 目录读取每个故事的发布时间 {故事名: RFC 2822 时间}，没有目录时为空"""
+    try:
+        catalog = json.loads(catalog_path.read_text(encoding='utf-8'))
+        return {e['key']: e['published'] for e in catalog.get('episodes', []) if e.get('published')}
+    except (OSError, ValueError, AttributeError, TypeError, KeyError):
+        return {}
+
+
+def build_catalog(root: Optional[str] = None,
+                  published: Optional[Dict[str, str]] = None) -> List[dict]:
+    """生成按编号排序的故事列表
+
+    Args:
+        published: 已发布故事的发布时间（见 load_published），沿用不变；
+            第一次出现的 MP3 以本次生成的时间为发布时间
+    """
+    root = Path(root).resolve() if root else project_root()
+    index = build_asset_index(str(root))
+    published = dict(published or {})
+    now = formatdate(time.time(), usegmt=True)
+    episodes = []
+    for entry in index.values():
+        if not entry.story and not entry.audio:
+            continue  # 只有封面或缩略图的名称不一致项，由 asset_index 报告
+        episodes.append(_episode(entry, root, published.get(entry.key, now)))
+    return episodes
+
+
+def _episode(entry: AssetEntry, root: Path, published: str) -> dict:
+    # 文稿和媒体信息都从各自的缓存读取，未变化的文件不会重新解析
+    story = load_story(entry.story) if entry.story else None
+    audio = _read_audio(entry.audio) if entry.audio else {}
+    title = audio.get('title') or (story and story.title) or entry.key.split('-', 1)[-1]
+    episode = {
+        'number': entry.number,
+        'key': entry.key,
+        'title': title,
+        'story': _relative(entry.story, root),
+        'cover': _relative(entry.cover, root),
+        'thumbnail': _relative(entry.thumbnail, root),
+        'audio': _relative(entry.audio, root),
+    }
+    if story:
+        episode.update({'description': story.intro_text, 'chars': story.chars})
+    if entry.audio:
+        episode.update({
+            'bytes': audio['bytes'],
+            'duration': audio['duration'],
+            'duration_text': format_duration(audio['duration']),
+            'bitrate': audio['bitrate'],
+            'sample_rate': audio['sample_rate'],
+            'embedded_cover_bytes': audio['embedded_cover_bytes'],
+            'mime': 'audio/mpeg',
+            # 不用 MP3 的修改时间：重新写入标签会改变它，订阅客户端会把旧故事当成新的
+            'published': published,
+        })
+        if audio.get('error'):
+            episode['error'] = audio['error']
+    return episode
+
+
+def render_json(episodes: List[dict]) -> str:
+    catalog = {'title': ALBUM, 'author': ARTIST, 'episodes': episodes}
+    return json.dumps(catalog, ensure_ascii=False, indent=2) + '\n'
+
+
+def _url(base_url: str, relpath: str) -> str:
+    return base_url + quote(relpath)
+
+
+def render_rss(episodes: List[dict], base_url: str = '') -> str:
+    """生成播客 RSS，只包含有 MP3 的故事"""
+    with_audio = [e for e in episodes if e.get('audio')]
+    image = next((e['cover'] for e in episodes if e.get('cover')), None)
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">',
+        '<channel>',
+        f'  <title>{escape(ALBUM)}</title>',
+        f'  <link>{escape(base_url)}</link>',
+        f'  <description>{escape(CHANNEL_DESCRIPTION)}</description>',
+        f'  <language>{CHANNEL_LANGUAGE}</language>',
+        f'  <itunes:author>{escape(ARTIST)}</itunes:author>',
+        f'  <itunes:category text={quoteattr(CHANNEL_CATEGORY)} />',
+        '  <itunes:explicit>false</itunes:explicit>',
+    ]
+    if image:
+        lines.append(f'  <itunes:image href={quoteattr(_url(base_url, image))} />')
+    for episode in reversed(with_audio):  # 最新的在前
+        lines += [
+            '  <item>',
+            f'    <title>{escape(episode["title"])}</title>',
+            f'    <guid isPermaLink="false">{escape(episode["key"])}</guid>',
+            f'    <pubDate>{episode["published"]}</pubDate>',
+            f'    <enclosure url={quoteattr(_url(base_url, episode["audio"]))} '
+            f'length="{episode["bytes"]}" type="{episode["mime"]}" />',
+            f'    <itunes:duration>{episode["duration_text"]}</itunes:duration>',
+        ]
+        if episode.get('description'):
+            lines.append(f'    <description>{escape(episode["description"])}</description>')
+        if episode.get('number'):
+            lines.append(f'    <itunes:episode>{int(episode["number"])}</itunes:episode>')
+        if episode.get('cover'):
+            lines.append(f'    <itunes:image href={quoteattr(_url(base_url, episode["cover"]))} />')
+        lines.append('  </item>')
+    lines += ['</channel>', '</rss>']
+    return '\n'.join(lines) + '\n'
+
+
+def render_readme_table(episodes: List[dict]) -> str:
+    """生成 README 中的故事目录表格，没有缩略图时使用原始封面，文稿链接显示文件名中的标题"""
+    lines = ['| 编号 | 封面 | 文稿 | 音频 |', '| ---- | ---- | ---- | ---- |']
+    for episode in episodes:
+        if not episode.get('story'):
+            continue
+        image = episode.get('thumbnail') or episode.get('cover')
+        cover = f'<img src="{image}" width="80" />' if image else ''
+        audio = episode.get('audio') or f"audio/{episode['key']}.mp3"
+        name = episode['key'].split('-', 1)[-1]
+        lines.append(f"| {episode['number']} | {cover} | [{name}]({episode['story']}) "
+                     f"| [{audio}]({audio}) |")
+    return '\n'.join(lines)
+
+
+def update_readme(readme_path: Path, table: str) -> bool:
+    """替换 README 中两个标记之间的表格，返回是否有变化"""
+    text = readme_path.read_text(encoding='utf-8')
+    start = text.find(README_START)
+    end = text.find(README_END)
+    if start < 0 or end < start:
+        print(f"⚠ {readme_path.name} 中没有 {README_START} / {README_END} 标记，跳过")
+        return False
+    new_text = text[:start + len(README_START)] + '\n' + table + '\n' + text[end:]
+    return _write_if_changed(readme_path, new_text)
+
+
+def _write_if_changed(path: Path, content: str) -> bool:
+    """内容不变时不写文件（保留修改时间），变化时原子替换"""
+    try:
+        if path.read_text(encoding='utf-8') == content:
+            return False
+    except OSError:
+        pass
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    tmp_path.write_text(content, encoding='utf-8')
+    os.replace(tmp_path, path)
+    return True
+
+
+def update_catalog(root: Path, base_url: str = '', json_name: str = 'catalog.json',
+                   rss_name: str = 'feed.xml', readme: bool = True) -> Tuple[List[dict], List[str]]:
+    """重新生成 JSON 目录、RSS 和 README 表格，返回 (故事列表, 内容有变化的文件名)
+
+    发布时间保存在 JSON 目录中，已发布的故事重新生成时保持不变
+    """
+    episodes = build_catalog(str(root), load_published(root / json_name))
+
+    outputs = [(root / json_name, render_json(episodes)),
+               (root / rss_name, render_rss(episodes, base_url))]
+    changed = [path.name for path, content in outputs if _write_if_changed(path, content)]
+    if readme and update_readme(root / 'README.md', render_readme_table(episodes)):
+        changed.append('README.md')
+    return episodes, changed
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='生成 JSON 目录、播客 RSS 和 README 故事目录')
+    parser.add_argument('--root', default=None, help='项目根目录（默认: 脚本所在项目）')
+    parser.add_argument('--base-url', default=os.environ.get('WUWUNV_BASE_URL', ''),
+                        help='音频和封面的网址前缀，RSS 中的链接需要（默认读取 WUWUNV_BASE_URL）')
+    parser.add_argument('--json', default='catalog.json', help='JSON 目录输出路径（相对项目根目录）')
+    parser.add_argument('--rss', default='feed.xml', help='RSS 输出路径（相对项目根目录）')
+    parser.add_argument('--no-readme', action='store_true', help='不更新 README.md')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    root = Path(args.root).resolve() if args.root else project_root()
+    base_url = args.base_url
+    if base_url and not base_url.endswith('/'):
+        base_url += '/'
+
+    episodes, changed = update_catalog(root, base_url, args.json, args.rss,
+                                       readme=not args.no_readme)
+
+    with_audio = sum(1 for e in episodes if e.get('audio'))
+    print(f"共 {len(episodes)} 个故事，其中 {with_audio} 个有 MP3")
+    if not base_url and with_audio:
+        print("⚠ 未指定 --base-url，RSS 中的链接是相对路径")
+    for episode in episodes:
+        if episode.get('error'):
+            print(f"  ✗ {episode['key']}: {episode['error']}")
+    for problem in index_report(build_asset_index(str(root))):
+        print(f"  ⚠ {problem}")
+    print(f"已更新: {', '.join(changed) if changed else '无变化'}")
+    print(f"耗时 {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
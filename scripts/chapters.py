@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按停顿生成 ID3 章节
+把故事文稿按段落切分，用字数估计每段的朗读时长，再对齐到静音分析找到的停顿上，
+生成 ID3v2 章节（CHAP/CTOC），可选同步歌词（SYLT，每段一条）。
+播放器可以直接跳到某一章，并显示当前正在朗读的段落。
+
+静音区间来自处理流程已有的分析报告（`.analysis.json`），不需要再次解码。
+朗读速度（每秒字数）可以用已有的故事和 MP3 校准，用于决定对齐停顿时的搜索范围
+
+用法：
+    python scripts/chapters.py --calibrate                  # 用已有的故事校准朗读速度
+    python scripts/chapters.py <MP3文件> [故事文件]           # 按 MP3 旁边的分析报告预览章节
+"""
+
+import json
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    from mutagen.id3 import CHAP, CTOC, CTOCFlags, SYLT, TIT2
+except ImportError:
+    print("错误: 需要安装 mutagen 库")
+    print("请运行: pip install mutagen")
+    sys.exit(1)
+
+from build_cache import default_cache_dir
+
+
+DEFAULT_CHARS_PER_SECOND = 4.5  # 未校准时的朗读速度（中文每秒字数）
+RATE_FILE = 'chapter_rate.json'  # 校准结果，保存在缓存目录中
+MIN_CHAPTER_SECONDS = 45.0  # 每章至少的时长，较短的段落会合并到同一章
+MIN_SNAP_WINDOW = 2.0  # 段落边界向停顿对齐时的最小搜索范围（秒）
+SNAP_FRACTION = 0.3  # 搜索范围占上一段预计时长的比例
+PRE_ROLL = 0.2  # 段落起点放在停顿结束前多少秒，跳转后不会切掉第一个字
+# 本次录音的整体朗读速度（含停顿）与校准值相差超过此比例时提示文稿可能不一致
+RATE_WARNING = 0.35
+
+_WORD_RE = re.compile(r'\w')
+_SENTENCE_END_RE = re.compile(r'[。！？!?…]')
+
+
+@dataclass
+class Paragraph:
+    text: str
+    start: float = 0.0  # 在输出音频中的开始时间（秒）
+
+    @property
+    def weight(self) -> int:
+        """朗读时长按字数估计，不计空白和标点"""
+        return len(_WORD_RE.findall(self.text))
+
+
+@dataclass
+class Chapter:
+    title: str
+    start: float
+    end: float
+    first_paragraph: int
+
+
+@dataclass
+class ChapterMap:
+    """一个故事的章节和各段落的时间"""
+    chapters: List[Chapter]
+    paragraphs: List[Paragraph]
+    duration: float  # 输出音频时长（秒）
+    chars_per_second: float  # 本次录音的实际朗读速度
+    snapped: int = 0  # 对齐到停顿的段落边界数
+    sylt: bool = False  # 是否写入同步歌词
+    warnings: List[str] = field(default_factory=list)
+
+
+def split_paragraphs(story_content: str) -> List[str]:
+    """按空行切分正文段落，跳过第一行标题和 Markdown 标题行"""
+    lines = story_content.split('\n')[1:]
+    paragraphs = []
+    current: List[str] = []
+    for line in lines + ['']:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            if current:
+                paragraphs.append(''.join(current))
+                current = []
+            continue
+        current.append(line)
+    return [p for p in paragraphs if _WORD_RE.search(p)]
+
+
+def load_catalog_rate() -> float:
+    """已校准的朗读速度，没有校准过时返回默认值"""
+    try:
+        with open(default_cache_dir() / RATE_FILE, 'r', encoding='utf-8') as f:
+            return float(json.load(f)['chars_per_second'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return DEFAULT_CHARS_PER_SECOND
+
+
+def calibrate_rate(root: Optional[str] = None) -> Optional[Tuple[float, int]]:
+    """用已有故事的字数和 MP3 时长校准朗读速度，结果保存到缓存目录
+
+    时长是整个 MP3 的时长，包含停顿，与 build_chapter_map 中的整体朗读速度对应
+
+    Returns:
+        (每秒字数, 使用的故事数)，没有可用的故事时返回 None
+    """
+    from asset_index import build_asset_index
+    from probe_cache import probe
+    from process_audio import read_story_content
+
+    total_chars = 0
+    total_seconds = 0.0
+    count = 0
+    for entry in build_asset_index(root).values():
+        if not (entry.audio and entry.story):
+            continue
+        info = probe(entry.audio)
+        if info.error or info.duration <= 0:
+            continue
+        _, content = read_story_content(entry.story)
+        total_chars += sum(Paragraph(p).weight for p in split_paragraphs(content))
+        total_seconds += info.duration
+        count += 1
+    if not count or total_seconds <= 0:
+        return None
+    rate = total_chars / total_seconds
+    path = default_cache_dir() / RATE_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'chars_per_second': rate, 'stories': count}, f, ensure_ascii=False, indent=2)
+    return rate, count
+
+
+def _speech_to_time(speech_seconds: float, start: float,
+                    pauses: Sequence[Tuple[float, float]]) -> float:
+    """把 "去掉停顿后的朗读时间" 换算为音频中的时间"""
+    t = start
+    remaining = speech_seconds
+    for pause_start, pause_end in pauses:
+        if t + remaining <= pause_start:
+            break
+        remaining -= max(pause_start - t, 0.0)
+        t = pause_end
+    return t + remaining
+
+
+def align_paragraphs(weights: Sequence[int], pauses: Sequence[Tuple[float, float]],
+                     start: float, end: float,
+                     catalog_rate: float = DEFAULT_CHARS_PER_SECOND
+                     ) -> Tuple[List[float], float, int]:
+    """估计每个段落的开始时间
+
+    先按字数比例在去掉停顿后的朗读时间中分配各段，再把每个边界对齐到附近最合适的停顿
+    （搜索范围随上一段的长度增大，边界保持递增，每个停顿最多使用一次）。
+
+    Returns:
+        (各段开始时间, 本次录音的朗读速度, 对齐到停顿的边界数)
+    """
+    speech_total = (end - start) - sum(e - s for s, e in pauses)
+    total_weight = sum(weights)
+    if speech_total <= 0 or total_weight <= 0:
+        return [start] * len(weights), 0.0, 0
+    rate = total_weight / speech_total
+
+    starts = [start]
+    snapped = 0
+    cumulative = 0
+    next_pause = 0
+    for k in range(1, len(weights)):
+        cumulative += weights[k - 1]
+        expected = _speech_to_time(cumulative / rate, start, pauses)
+        window = max(MIN_SNAP_WINDOW, SNAP_FRACTION * weights[k - 1] / catalog_rate)
+        best = None
+        for i in range(next_pause, len(pauses)):
+            pause_start, pause_end = pauses[i]
+            if pause_start - expected > window:
+                break
+            distance = abs((pause_start + pause_end) / 2 - expected)
+            if distance <= window and (best is None or distance < best[0]):
+                best = (distance, i)
+        if best is not None:
+            pause_start, pause_end = pauses[best[1]]
+            boundary = max(pause_end - PRE_ROLL, (pause_start + pause_end) / 2)
+            next_pause = best[1] + 1
+            snapped += 1
+        else:
+            boundary = expected
+        starts.append(max(boundary, starts[-1]))
+    return starts, rate, snapped
+
+
+def _chapter_title(index: int, text: str, max_chars: int = 16) -> str:
+    match = _SENTENCE_END_RE.search(text)
+    sentence = text[:match.start()] if match else text
+    sentence = sentence.strip('“”"「」 ')
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars] + '…'
+    return f"{index}. {sentence}"
+
+
+def build_chapter_map(story_content: str,
+                      silence_starts: Sequence[float], silence_ends: Sequence[float],
+                      total_duration: float, start_trim: float = 0.0, end_trim: float = 0.0,
+                      catalog_rate: Optional[float] = None,
+                      min_chapter_seconds: float = MIN_CHAPTER_SECONDS,
+                      sylt: bool = False) -> Optional[ChapterMap]:
+    """根据静音区间和故事文稿生成章节
+
+    静音区间和时长都是源文件中的时间，结果换算为裁剪后输出音频中的时间。
+
+    Returns:
+        ChapterMap，没有正文段落或有效时长时返回 None
+    """
+    texts = split_paragraphs(story_content or '')
+    start = start_trim
+    end = total_duration - end_trim
+    if not texts or end <= start:
+        return None
+    catalog_rate = catalog_rate or load_catalog_rate()
+    pauses = [(s, e) for s, e in zip(silence_starts, silence_ends) if s > start and e < end]
+
+    paragraphs = [Paragraph(text) for text in texts]
+    starts, rate, snapped = align_paragraphs([p.weight for p in paragraphs], pauses,
+                                             start, end, catalog_rate)
+    duration = end - start
+    for paragraph, t in zip(paragraphs, starts):
+        paragraph.start = min(max(t - start, 0.0), duration)
+
+    # 段落合并为章节：每章至少 min_chapter_seconds，太短的最后一章并入上一章
+    chapters: List[Chapter] = []
+    for i, paragraph in enumerate(paragraphs):
+        if not chapters or paragraph.start - chapters[-1].start >= min_chapter_seconds:
+            chapters.append(Chapter('', paragraph.start, duration, i))
+    if len(chapters) > 1 and duration - chapters[-1].start < min_chapter_seconds / 2:
+        chapters.pop()
+    for i, chapter in enumerate(chapters):
+        chapter.end = chapters[i + 1].start if i + 1 < len(chapters) else duration
+        chapter.title = _chapter_title(i + 1, paragraphs[chapter.first_paragraph].text)
+
+    chapter_map = ChapterMap(chapters, paragraphs, duration, rate, snapped, sylt)
+    # rate 不计停顿，校准值按整个 MP3 的时长计算，比较时同样用含停顿的整体速度
+    overall_rate = sum(p.weight for p in paragraphs) / duration
+    if overall_rate and abs(overall_rate / catalog_rate - 1) > RATE_WARNING:
+        chapter_map.warnings.append(
+            f"整体朗读速度 {overall_rate:.1f} 字/秒（含停顿），与校准值 {catalog_rate:.1f} 字/秒"
+            f"相差较大，文稿可能与录音不一致")
+    return chapter_map
+
+
+def write_chapter_frames(tags, chapter_map: ChapterMap) -> None:
+    """把章节写入 ID3 标签（替换已有的 CHAP/CTOC/SYLT）"""
+    for frame_id in ('CHAP', 'CTOC', 'SYLT'):
+        tags.delall(frame_id)
+    element_ids = []
+    for i, chapter in enumerate(chapter_map.chapters):
+        element_id = f'chp{i}'
+        element_ids.append(element_id)
+        tags.add(CHAP(element_id=element_id,
+                      start_time=int(round(chapter.start * 1000)),
+                      end_time=int(round(chapter.end * 1000)),
+                      sub_frames=[TIT2(encoding=3, text=[chapter.title])]))
+    tags.add(CTOC(element_id='toc', flags=CTOCFlags.TOP_LEVEL | CTOCFlags.ORDERED,
+                  child_element_ids=element_ids,
+                  sub_frames=[TIT2(encoding=3, text=['目录'])]))
+    if chapter_map.sylt:
+        tags.add(SYLT(encoding=3, lang='chi', format=2, type=1, desc='段落',
+                      text=[(p.text, int(round(p.start * 1000))) for p in chapter_map.paragraphs]))
+
+
+def format_time(seconds: float) -> str:
+    total = int(seconds)
+    return f"{total // 60:02d}:{total % 60:02d}"
+
+
+def print_chapter_map(chapter_map: ChapterMap) -> None:
+    print(f"  朗读速度 {chapter_map.chars_per_second:.1f} 字/秒，"
+          f"{chapter_map.snapped}/{max(len(chapter_map.paragraphs) - 1, 0)} 个段落边界对齐到停顿")
+    for chapter in chapter_map.chapters:
+        print(f"  {format_time(chapter.start)} - {format_time(chapter.end)}  {chapter.title}")
+    for warning in chapter_map.warnings:
+        print(f"  ⚠ {warning}")
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='按停顿生成 ID3 章节')
+    parser.add_argument('audio', nargs='?', help='处理后的 MP3（旁边需要有 .analysis.json 分析报告）')
+    parser.add_argument('story', nargs='?', help='故事文件（默认按 MP3 文件名查找）')
+    parser.add_argument('--calibrate', action='store_true', help='用已有的故事和 MP3 校准朗读速度')
+    parser.add_argument('--min-chapter', type=float, default=MIN_CHAPTER_SECONDS,
+                        help=f'每章最短时长（秒，默认: {MIN_CHAPTER_SECONDS:g}）')
+    args = parser.parse_args()
+
+    if args.calibrate:
+        result = calibrate_rate()
+        if result is None:
+            print("✗ 没有同时有故事文稿和 MP3 的故事，无法校准")
+            sys.exit(1)
+        rate, count = result
+        print(f"✓ 朗读速度: {rate:.2f} 字/秒（{count} 个故事）")
+        if not args.audio:
+            return
+    if not args.audio:
+        parser.print_usage()
+        sys.exit(1)
+
+    from audio_analysis import AnalysisReport, report_path_for
+    from process_audio import compute_trims, find_story_file, read_story_content
+
+    report_path = report_path_for(args.audio)
+    report = AnalysisReport.load(str(report_path))
+    if report is None:
+        print(f"✗ 无法读取分析报告: {report_path}")
+        print("  使用 process_audio.py --chapters 处理录屏时会生成分析报告")
+        sys.exit(1)
+    story_path = args.story or find_story_file(args.audio)
+    if not story_path:
+        sys.exit(1)
+    _, content = read_story_content(story_path)
+    silence = report.silence
+    start_trim, end_trim = compute_trims(silence.silence_starts, silence.silence_ends,
+                                         report.duration)
+    chapter_map = build_chapter_map(content, silence.silence_starts, silence.silence_ends,
+                                    report.duration, start_trim, end_trim,
+                                    min_chapter_seconds=args.min_chapter)
+    if chapter_map is None:
+        print("✗ 文稿没有正文段落")
+        sys.exit(1)
+    print_chapter_map(chapter_map)
+
+
+if __name__ == '__main__':
+    main()
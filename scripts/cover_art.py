@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+封面图片优化
+在嵌入 MP3 之前把封面缩小并重新编码到指定的尺寸和字节预算内，
+按文件头识别图片格式，结果按源文件哈希缓存
+"""
+
+import hashlib
+import io
+import sys
+from pathlib import Path
+from typing import Optional, Tuple
+
+from build_cache import BuildCache, make_key
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = None
+    PIL_AVAILABLE = False
+
+
+MAX_DIMENSION = 600  # 封面最长边（像素）
+MAX_BYTES = 150 * 1024  # 封面字节预算
+JPEG_QUALITIES = (88, 82, 76, 70, 64, 58, 52)  # 超出预算时依次降低的 JPEG 质量
+
+# 文件头 -> MIME 类型
+_MAGIC_NUMBERS = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+]
+
+
+def detect_image_mime(data: bytes) -> Optional[str]:
+    """根据文件头识别图片的 MIME 类型，无法识别时返回 None"""
+    for magic, mime in _MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mime
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def _fits(data: bytes, size: Tuple[int, int], max_dimension: int, max_bytes: int) -> bool:
+    return len(data) <= max_bytes and max(size) <= max_dimension
+
+
+def _reencode(data: bytes, max_dimension: int, max_bytes: int) -> bytes:
+    """缩小并重新编码为 JPEG，逐步降低质量直到满足字节预算"""
+    with Image.open(io.BytesIO(data)) as im:
+        if im.format == 'JPEG':
+            im.draft('RGB', (max_dimension, max_dimension))  # JPEG 解码时直接按比例缩小
+        if im.mode in ('RGBA', 'LA', 'P'):
+            im = im.convert('RGBA')
+            background = Image.new('RGB', im.size, (255, 255, 255))
+            background.paste(im, mask=im.split()[-1])
+            im = background
+        elif im.mode != 'RGB':
+            im = im.convert('RGB')
+        im.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        encoded = b''
+        for quality in JPEG_QUALITIES:
+            buffer = io.BytesIO()
+            im.save(buffer, format='JPEG', quality=quality, optimize=True)
+            encoded = buffer.getvalue()
+            if len(encoded) <= max_bytes:
+                break
+        return encoded
+
+
+def prepare_cover(cover_path: str,
+                  max_dimension: int = MAX_DIMENSION,
+                  max_bytes: int = MAX_BYTES,
+                  cache: Optional[BuildCache] = None,
+                  store: bool = True) -> Tuple[bytes, str]:
+    """生成用于嵌入的封面
+
+    已经满足尺寸和字节预算的封面原样返回；否则缩小并重新编码为 JPEG。
+    未安装 Pillow 时返回原图。
+
+    Args:
+        store: 缓存中没有时把结果写入缓存；只读的检查（如 verify_audio）传 False
+
+    Returns:
+        (data, mime): 封面数据和 MIME 类型
+    """
+    with open(cover_path, 'rb') as f:
+        data = f.read()
+    mime = detect_image_mime(data) or 'image/jpeg'
+
+    if not PIL_AVAILABLE:
+        print("  ⚠ 未安装 Pillow，嵌入原始封面 (pip install pillow)")
+        return data, mime
+
+    # 封面已经读入内存，直接对这些字节求哈希，不再从磁盘读第二遍
+    key = make_key('cover', hashlib.sha256(data).hexdigest(), max_dimension, max_bytes)
+    if cache is not None:
+        cached_data = cache.read_bytes('cover', key, '.img')
+        if cached_data is not None:
+            return cached_data, detect_image_mime(cached_data) or mime
+
+    with Image.open(io.BytesIO(data)) as im:
+        size = im.size
+    if mime in ('image/jpeg', 'image/png') and _fits(data, size, max_dimension, max_bytes):
+        result = data
+    else:
+        result = _reencode(data, max_dimension, max_bytes)
+        if len(result) >= len(data) and mime in ('image/jpeg', 'image/png') \
+                and max(size) <= max_dimension:
+            result = data  # 重新编码没有变小，保留原图
+
+    if cache is not None and store:
+        cache.put_bytes('cover', key, result, '.img')
+    return result, detect_image_mime(result) or mime
+
+
+def main():
+    """主函数"""
+    if len(sys.argv) < 2:
+        print("用法:")
+        print("  python scripts/cover_art.py <封面图片> [输出文件]")
+        sys.exit(1)
+
+    cover_path = sys.argv[1]
+    data, mime = prepare_cover(cover_path, cache=BuildCache())
+    original_size = Path(cover_path).stat().st_size
+    print(f"原始: {original_size / 1024:.2f} KB -> 嵌入: {len(data) / 1024:.2f} KB ({mime})")
+    if len(sys.argv) > 2:
+        Path(sys.argv[2]).write_bytes(data)
+        print(f"✓ 已保存到: {sys.argv[2]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,18 +4,31 @@
 为音频封面批量生成缩略图
 
 用法：
-    python scripts/generate_thumbnails.py
+    python scripts/generate_thumbnails.py [--sizes 400,200,800] [--formats source,webp] [--force]
 
 说明：
 - 扫描项目根目录下的 audio/ 目录
-- 查找其中的 .jpg / .jpeg 封面文件
-- 在 audio/thumbnails/ 下生成最长边不超过 400 像素的缩略图
-- 缩略图命名为：原文件名去扩展名后加 `_thumb`，再加原扩展名
+- 查找其中的 .jpg / .jpeg / .png 封面文件
+- 在 audio/thumbnails/ 下生成最长边不超过指定像素的缩略图，默认 400、200、800 三种尺寸
+- 第一个尺寸的缩略图命名为：原文件名去扩展名后加 `_thumb`，再加原扩展名
   例如：`01-巫巫女的心变了.jpeg` -> `01-巫巫女的心变了_thumb.jpeg`
+  其他尺寸在 `_thumb` 后加尺寸，例如 `01-巫巫女的心变了_thumb_200.jpeg`
+- 同时输出 WebP 版本（如 `01-巫巫女的心变了_thumb.webp`），供网页按需选用
+- 每张封面只解码一次，JPEG 使用 draft 模式在解码时直接缩小
+- 封面没有变化（输出比封面新，或封面哈希与记录一致）时跳过，多张封面并行处理
+- 封面哈希记录在缓存目录的 thumbnails.json 中；没有记录时（例如刚检出）已有的缩略图视为最新，
+  只生成缺少的尺寸和格式
 """
 
+import argparse
+import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from build_cache import default_cache_dir, file_hash
 
 try:
     from PIL import Image
@@ -25,12 +38,153 @@ except ImportError:
     sys.exit(1)
 
 
+DEFAULT_SIZES = (400, 200, 800)
+DEFAULT_FORMATS = ("source", "webp")
+MANIFEST_NAME = "thumbnails.json"  # 在缓存目录下，记录每张封面的哈希和生成设置
+
+
+def thumbnail_outputs(img_path: Path, thumb_dir: Path,
+                      sizes: Sequence[int], formats: Sequence[str]) -> List[Tuple[int, str, Path]]:
+    """列出一张封面需要生成的所有缩略图：(尺寸, 格式, 输出路径)"""
+    outputs = []
+    for i, size in enumerate(sizes):
+        base = img_path.stem + ("_thumb" if i == 0 else f"_thumb_{size}")
+        for fmt in formats:
+            suffix = img_path.suffix if fmt == "source" else f".{fmt}"
+            outputs.append((size, fmt, thumb_dir / (base + suffix)))
+    return outputs
+
+
+def _stale_outputs(img_path: Path, outputs: List[Tuple[int, str, Path]],
+                   record: Optional[dict], settings: dict) -> List[Tuple[int, str, Path]]:
+    """返回需要重新生成的缩略图
+
+    没有记录时（例如刚检出，仓库中已有缩略图）已有的缩略图视为最新，只生成缺少的，
+    不会改写仓库中的文件
+    """
+    missing = [output for output in outputs if not output[2].exists()]
+    if record is None:
+        return missing
+    if record.get("settings") != settings:
+        return outputs
+    existing = [out for _, _, out in outputs if out.exists()]
+    if not existing or min(out.stat().st_mtime_ns for out in existing) >= img_path.stat().st_mtime_ns:
+        return missing
+    # 封面修改时间更新（例如重新检出），再用哈希确认内容是否真的变了
+    return missing if record.get("hash") == file_hash(str(img_path)) else outputs
+
+
+def _render(img_path: Path, outputs: List[Tuple[int, str, Path]]) -> None:
+    """解码一次封面，依次输出所有尺寸和格式"""
+    max_size = max(size for size, _, _ in outputs)
+    with Image.open(img_path) as im:
+        if im.format == "JPEG":
+            # draft 会选择不小于目标尺寸的 1/2、1/4、1/8 缩放，大幅减少解码量
+            im.draft("RGB", (max_size, max_size))
+        im.load()
+        source_format = im.format
+        for size in sorted({size for size, _, _ in outputs}, reverse=True):
+            resized = im.copy()
+            resized.thumbnail((size, size))
+            for out_size, fmt, out_path in outputs:
+                if out_size != size:
+                    continue
+                if fmt == "webp":
+                    resized.save(out_path, format="WEBP", quality=80, method=6)
+                else:
+                    resized.save(out_path, format=source_format, optimize=True, quality=85)
+
+
+def process_cover(img_path: Path, thumb_dir: Path, sizes: Sequence[int], formats: Sequence[str],
+                  record: Optional[dict] = None, force: bool = False) -> dict:
+    """为一张封面生成缩略图
+
+    Args:
+        record: 清单中该封面的记录（见 load_manifest），没有时为 None
+        force: 不检查已有结果，全部重新生成
+
+    Returns:
+        {"name", "outputs", "status": generated/skipped/failed, "record", 失败时还有 "error"}，
+        "record" 应写回清单
+    """
+    img_path = Path(img_path)
+    thumb_dir = Path(thumb_dir)
+    settings = {"sizes": list(sizes), "formats": list(formats)}
+    outputs = thumbnail_outputs(img_path, thumb_dir, sizes, formats)
+    result = {"name": img_path.name, "outputs": [str(out) for _, _, out in outputs]}
+    try:
+        stale = outputs if force else _stale_outputs(img_path, outputs, record, settings)
+        if stale:
+            _render(img_path, stale)
+            result["status"] = "generated"
+        else:
+            result["status"] = "skipped"
+        if stale or record is None:
+            # 第一次处理时记下封面的哈希，之后修改时间变化也能判断内容是否变了
+            result["record"] = {"hash": file_hash(str(img_path)), "settings": settings}
+        else:
+            result["record"] = record
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+        result["record"] = record
+    return result
+
+
+def _process_one(args: Tuple[str, str, Tuple[int, ...], Tuple[str, ...], Optional[dict], bool]) -> dict:
+    """进程池中执行的任务，参数见 process_cover"""
+    return process_cover(*args)
+
+
+def _manifest_path() -> Path:
+    return default_cache_dir() / MANIFEST_NAME
+
+
+def load_manifest(thumb_dir: Path) -> Dict[str, dict]:
+    """读取 thumb_dir 对应的清单 {封面文件名: 记录}"""
+    try:
+        with open(_manifest_path(), "r", encoding="utf-8") as f:
+            return json.load(f).get(str(thumb_dir.resolve()), {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def save_manifest(thumb_dir: Path, manifest: Dict[str, dict]) -> None:
+    """保存到缓存目录（不放在 audio/thumbnails/ 中，以免混进仓库），按缩略图目录分开记录"""
+    path = _manifest_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifests = json.load(f)
+        if not isinstance(manifests, dict):
+            manifests = {}
+    except (OSError, ValueError):
+        manifests = {}
+    manifests[str(thumb_dir.resolve())] = manifest
+    tmp_path = path.with_name(f".{MANIFEST_NAME}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifests, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
 def generate_thumbnails(
     audio_dir: Path,
     thumb_dir: Path,
     max_size: int = 400,
+    sizes: Optional[Sequence[int]] = None,
+    formats: Sequence[str] = DEFAULT_FORMATS,
+    force: bool = False,
+    jobs: Optional[int] = None,
 ) -> None:
-    """在 audio_dir 中为所有封面图片生成缩略图到 thumb_dir"""
+    """在 audio_dir 中为所有封面图片生成缩略图到 thumb_dir
+
+    Args:
+        max_size: 主缩略图（`_thumb` 命名）的最长边，未指定 sizes 时使用
+        sizes: 要生成的所有尺寸，第一个为主缩略图
+        formats: 输出格式，"source" 表示与封面相同的格式
+        force: 忽略已有结果，全部重新生成
+        jobs: 并行进程数，默认为 CPU 核心数
+    """
     if not audio_dir.exists():
         print(f"错误：目录不存在：{audio_dir}")
         return
@@ -38,36 +192,55 @@ def generate_thumbnails(
     thumb_dir.mkdir(parents=True, exist_ok=True)
 
     exts = {".jpg", ".jpeg", ".png"}
-    images = [p for p in audio_dir.iterdir() if p.suffix.lower() in exts]
+    images = sorted(p for p in audio_dir.iterdir() if p.suffix.lower() in exts)
 
     if not images:
         print(f"在 {audio_dir} 下没有找到封面图片。")
         return
 
+    sizes = tuple(sizes) if sizes else (max_size,)
+    formats = tuple(formats)
     print(f"在 {audio_dir} 下找到 {len(images)} 张封面，将生成缩略图到 {thumb_dir}。")
+    print(f"尺寸：{', '.join(str(s) for s in sizes)}；格式：{', '.join(formats)}")
 
-    for img_path in images:
-        try:
-            rel_name = img_path.stem + "_thumb" + img_path.suffix
-            out_path = thumb_dir / rel_name
+    manifest = load_manifest(thumb_dir)
+    tasks = [(str(p), str(thumb_dir), sizes, formats, manifest.get(p.name), force) for p in images]
 
-            with Image.open(img_path) as im:
-                im.thumbnail((max_size, max_size))
-                im.save(out_path, optimize=True, quality=85)
+    counts = {"generated": 0, "skipped": 0, "failed": 0}
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        for result in executor.map(_process_one, tasks):
+            counts[result["status"]] += 1
+            if result["record"] is not None:
+                manifest[result["name"]] = result["record"]
+            if result["status"] == "generated":
+                print(f"✓ 生成缩略图：{result['name']} ({len(result['outputs'])} 个文件)")
+            elif result["status"] == "failed":
+                print(f"✗ 生成缩略图失败：{result['name']} -> {result['error']}")
 
-            print(f"✓ 生成缩略图：{out_path}")
-        except Exception as e:
-            print(f"✗ 生成缩略图失败：{img_path} -> {e}")
+    save_manifest(thumb_dir, manifest)
+    print(f"完成：生成 {counts['generated']} 张，跳过 {counts['skipped']} 张（未变化），"
+          f"失败 {counts['failed']} 张。")
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="为 audio/ 中的封面生成缩略图")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="缩略图最长边，逗号分隔，第一个为主缩略图（默认: 400,200,800）")
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS),
+                        help="输出格式，逗号分隔，source 表示与封面相同（默认: source,webp）")
+    parser.add_argument("--force", action="store_true", help="忽略已有结果，全部重新生成")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="并行进程数（默认: CPU 核心数）")
+    args = parser.parse_args()
+
     project_root = Path(__file__).resolve().parents[1]
     audio_dir = project_root / "audio"
     thumb_dir = audio_dir / "thumbnails"
 
-    generate_thumbnails(audio_dir, thumb_dir)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    generate_thumbnails(audio_dir, thumb_dir, sizes=sizes, formats=formats,
+                        force=args.force, jobs=args.jobs)
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快速扫描 MP3 的 ID3v2 标签
+只读取标签头和各帧的帧头，跳过帧内容和 MPEG 音频数据，
+用于批量检查元数据是否完整
+"""
+
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+
+# 判断“元数据完整”所需的帧：标题、封面、简介、全文
+REQUIRED_FRAMES = ('TIT2', 'APIC', 'COMM', 'USLT')
+
+# ID3v2.2 使用三字符帧名
+V22_FRAME_NAMES = {'TT2': 'TIT2', 'PIC': 'APIC', 'COM': 'COMM', 'ULT': 'USLT',
+                   'TP1': 'TPE1', 'TAL': 'TALB', 'TCO': 'TCON'}
+
+
+@dataclass
+class TagSummary:
+    """单个文件的标签摘要"""
+    path: str
+    version: Optional[Tuple[int, int]] = None  # 例如 (4, 0) 表示 ID3v2.4.0
+    tag_size: int = 0  # 标签总字节数（含 10 字节标签头）
+    frames: Dict[str, int] = field(default_factory=dict)  # 帧名 -> 帧内容字节数（同名帧累加）
+    texts: Dict[str, str] = field(default_factory=dict)  # 按需读取的文本帧内容，如 TIT2
+    error: Optional[str] = None
+
+    @property
+    def missing(self) -> List[str]:
+        return [name for name in REQUIRED_FRAMES if name not in self.frames]
+
+    @property
+    def complete(self) -> bool:
+        return self.error is None and not self.missing
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _remove_unsync(data: bytes) -> bytes:
+    return data.replace(b'\xff\x00', b'\xff')
+
+
+def _decode_text_frame(data: bytes) -> str:
+    """解码文本帧（T*** 帧）内容，有多个值时取第一个"""
+    if not data:
+        return ''
+    encoding, payload = data[0], data[1:]
+    if encoding == 1:
+        text = payload.decode('utf-16', errors='replace')
+    elif encoding == 2:
+        text = payload.decode('utf-16-be', errors='replace')
+    elif encoding == 3:
+        text = payload.decode('utf-8', errors='replace')
+    else:
+        text = payload.decode('latin-1')
+    return text.split('\x00', 1)[0]
+
+
+def _frame_payload(raw: bytes, data: bytes, major: int) -> Optional[bytes]:
+    """去掉 ID3v2.4 帧级的数据长度指示和反同步，压缩或加密的帧返回 None"""
+    if major < 4:
+        return None if raw[9] & 0xC0 else data
+    flags = raw[9]
+    if flags & 0x0C:
+        return None
+    if flags & 0x01:
+        data = data[4:]
+    if flags & 0x02:
+        data = _remove_unsync(data)
+    return data
+
+
+def _record_frame(raw: bytes, name: str, data: bytes, major: int, summary: TagSummary) -> None:
+    payload = data if major == 2 else _frame_payload(raw, data, major)
+    if payload is not None and name.startswith('T') and name not in summary.texts:
+        summary.texts[name] = _decode_text_frame(payload)
+
+
+def scan_tags(path: str, read_text: Collection[str] = ()) -> TagSummary:
+    """读取 ID3v2 标签头和帧目录，不解析帧内容
+
+    Args:
+        read_text: 需要读取内容的文本帧（如 ('TIT2',)），只读取这些帧，其余帧仍然跳过
+    """
+    summary = TagSummary(path=str(path))
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(10)
+            if len(header) < 10 or header[:3] != b'ID3':
+                summary.error = '没有 ID3v2 标签'
+                return summary
+            major, revision, flags = header[3], header[4], header[5]
+            if major not in (2, 3, 4):
+                summary.error = f'不支持的 ID3v2.{major} 标签'
+                return summary
+            size = _syncsafe(header[6:10])
+            summary.version = (major, revision)
+            summary.tag_size = size + 10
+
+            if flags & 0x80 and major < 4:
+                # 整个标签做了反同步处理，帧头位置会偏移，只能读入整个标签再还原
+                _scan_frames_in_buffer(_remove_unsync(f.read(size)), major, summary, read_text)
+            else:
+                _scan_frames_in_file(f, size, major, flags, summary, read_text)
+    except OSError as e:
+        summary.error = str(e)
+    return summary
+
+
+def _frame_header_layout(major: int) -> Tuple[int, int]:
+    """返回 (帧头长度, 帧名长度)"""
+    return (6, 3) if major == 2 else (10, 4)
+
+
+def _parse_frame_header(raw: bytes, major: int) -> Tuple[str, int]:
+    if major == 2:
+        name = raw[:3].decode('latin-1')
+        return V22_FRAME_NAMES.get(name, name), struct.unpack('>I', b'\x00' + raw[3:6])[0]
+    name = raw[:4].decode('latin-1')
+    frame_size = _syncsafe(raw[4:8]) if major == 4 else struct.unpack('>I', raw[4:8])[0]
+    return name, frame_size
+
+
+def _valid_frame_name(raw: bytes) -> bool:
+    return all(48 <= b <= 57 or 65 <= b <= 90 for b in raw)
+
+
+def _scan_frames_in_file(f, size: int, major: int, flags: int, summary: TagSummary,
+                         read_text: Collection[str] = ()) -> None:
+    end = 10 + size
+    pos = 10
+    if flags & 0x40:
+        # 跳过扩展头
+        raw = f.read(4)
+        ext_size = _syncsafe(raw) if major == 4 else struct.unpack('>I', raw)[0] + 4
+        pos += ext_size
+        f.seek(pos)
+
+    header_len, name_len = _frame_header_layout(major)
+    while pos + header_len <= end:
+        raw = f.read(header_len)
+        if len(raw) < header_len or not _valid_frame_name(raw[:name_len]):
+            break  # 到达填充区
+        name, frame_size = _parse_frame_header(raw, major)
+        pos += header_len + frame_size
+        if pos > end:
+            summary.error = f'帧 {name} 的长度超出标签范围'
+            break
+        summary.frames[name] = summary.frames.get(name, 0) + frame_size
+        if name in read_text:
+            _record_frame(raw, name, f.read(frame_size), major, summary)
+        f.seek(pos)
+
+
+def _scan_frames_in_buffer(data: bytes, major: int, summary: TagSummary,
+                           read_text: Collection[str] = ()) -> None:
+    pos = 0
+    header_len, name_len = _frame_header_layout(major)
+    while pos + header_len <= len(data):
+        raw = data[pos:pos + header_len]
+        if not _valid_frame_name(raw[:name_len]):
+            break
+        name, frame_size = _parse_frame_header(raw, major)
+        pos += header_len + frame_size
+        if pos > len(data):
+            summary.error = f'帧 {name} 的长度超出标签范围'
+            break
+        summary.frames[name] = summary.frames.get(name, 0) + frame_size
+        if name in read_text:
+            _record_frame(raw, name, data[pos - frame_size:pos], major, summary)
+
+
+def scan_directory(paths: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, TagSummary]:
+    """用线程池并行扫描多个文件，返回 路径 -> 标签摘要"""
+    paths = [str(p) for p in paths]
+    max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(paths, executor.map(scan_tags, paths)))
+
+
+def main():
+    """主函数"""
+    from pathlib import Path
+
+    target = Path(sys.argv[1]) if len(sys.argv) > 1 else Path('audio')
+    if target.is_dir():
+        files = sorted(list(target.glob('*.mp3')) + list(target.glob('*.MP3')))
+    else:
+        files = [target]
+
+    report = scan_directory(files)
+    complete = 0
+    for path, summary in report.items():
+        if summary.complete:
+            complete += 1
+            print(f"  ✓ {Path(path).name}")
+        elif summary.error:
+            print(f"  ✗ {Path(path).name}: {summary.error}")
+        else:
+            print(f"  ⚠ {Path(path).name}: 缺少 {', '.join(summary.missing)}")
+    print(f"\n完整: {complete}/{len(report)}")
+    sys.exit(0 if complete == len(report) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+只读文件头获取 MP3 时长
+跳过 ID3v2 标签后读取第一个 MPEG 帧头，再读取 Xing/Info 或 VBRI 头中的总帧数，
+没有这些头时（CBR）按码率和音频字节数计算。每个文件只读取几百字节
+"""
+
+import os
+import struct
+import sys
+from dataclasses import dataclass
+from typing import Optional
+
+
+# MPEG 版本位 -> 版本（2.5 记为 25）
+_VERSIONS = {0: 25, 2: 2, 3: 1}
+_LAYERS = {1: 3, 2: 2, 3: 1}
+# 码率表（kbps），按 (版本是否为 MPEG1, 层) 索引
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 25: [11025, 12000, 8000]}
+
+SYNC_SEARCH_BYTES = 64 * 1024  # 在标签之后最多向后查找第一个帧头的字节数
+
+
+@dataclass
+class Mp3Info:
+    """从文件头得到的 MP3 信息"""
+    path: str
+    file_size: int = 0  # 整个文件的字节数（即 RSS enclosure 的 length）
+    audio_offset: int = 0  # 第一个 MPEG 帧的位置（ID3v2 标签之后）
+    version: int = 1
+    layer: int = 3
+    bitrate: int = 0  # 第一帧的码率（bit/s）
+    sample_rate: int = 0
+    channels: int = 2
+    frames: Optional[int] = None  # Xing/Info/VBRI 头中的总帧数
+    vbr_header: Optional[str] = None  # 'Xing'、'Info'、'VBRI' 或 None（按 CBR 估算）
+    duration: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def samples_per_frame(self) -> int:
+        if self.layer == 1:
+            return 384
+        if self.layer == 3 and self.version != 1:
+            return 576
+        return 1152
+
+
+def _id3v2_size(header: bytes) -> int:
+    """ID3v2 标签总长度（含标签头和标签尾），没有标签时为 0"""
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _parse_frame_header(word: int) -> Optional[tuple]:
+    """解析 4 字节帧头，返回 (版本, 层, 码率, 采样率, 声道数, 帧长度)，无效时返回 None"""
+    if (word >> 21) & 0x7FF != 0x7FF:
+        return None
+    version = _VERSIONS.get((word >> 19) & 0x3)
+    layer = _LAYERS.get((word >> 17) & 0x3)
+    bitrate_index = (word >> 12) & 0xF
+    rate_index = (word >> 10) & 0x3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _BITRATES[(version == 1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (word >> 9) & 0x1
+    channels = 1 if (word >> 6) & 0x3 == 3 else 2
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and version != 1:
+        length = 72 * bitrate // sample_rate + padding
+    else:
+        length = 144 * bitrate // sample_rate + padding
+    return version, layer, bitrate, sample_rate, channels, length
+
+
+def _find_first_frame(data: bytes) -> Optional[tuple]:
+    """查找第一个有效帧头（下一帧位置也是帧头，避免把数据误认为同步字）"""
+    pos = data.find(b'\xff')
+    while 0 <= pos <= len(data) - 4:
+        word = struct.unpack('>I', data[pos:pos + 4])[0]
+        parsed = _parse_frame_header(word)
+        if parsed:
+            nxt = pos + parsed[5]
+            if nxt + 4 > len(data) or _parse_frame_header(struct.unpack('>I', data[nxt:nxt + 4])[0]):
+                return pos, parsed
+        pos = data.find(b'\xff', pos + 1)
+    return None
+
+
+def read_mp3_info(path: str) -> Mp3Info:
+    """读取 MP3 时长、码率等信息，不解码音频"""
+    info = Mp3Info(path=str(path))
+    try:
+        info.file_size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            tag_size = _id3v2_size(f.read(10))
+            f.seek(tag_size)
+            data = f.read(SYNC_SEARCH_BYTES)
+            has_id3v1 = False
+            if info.file_size >= 128:
+                f.seek(-128, os.SEEK_END)
+                has_id3v1 = f.read(3) == b'TAG'
+    except OSError as e:
+        info.error = str(e)
+        return info
+
+    found = _find_first_frame(data)
+    if found is None:
+        info.error = '找不到 MPEG 帧头'
+        return info
+    pos, (version, layer, bitrate, sample_rate, channels, _) = found
+    info.audio_offset = tag_size + pos
+    info.version, info.layer = version, layer
+    info.bitrate, info.sample_rate, info.channels = bitrate, sample_rate, channels
+
+    # Xing/Info 头位于第一帧的边信息之后
+    if version == 1:
+        side_info = 17 if channels == 1 else 32
+    else:
+        side_info = 9 if channels == 1 else 17
+    xing = pos + 4 + side_info
+    tag = data[xing:xing + 4]
+    if tag in (b'Xing', b'Info') and len(data) >= xing + 12:
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if flags & 0x1:
+            info.frames = struct.unpack('>I', data[xing + 8:xing + 12])[0]
+            info.vbr_header = tag.decode('ascii')
+    elif data[pos + 36:pos + 40] == b'VBRI' and len(data) >= pos + 54:
+        info.frames = struct.unpack('>I', data[pos + 50:pos + 54])[0]
+        info.vbr_header = 'VBRI'
+
+    if info.frames:
+        info.duration = info.frames * info.samples_per_frame / sample_rate
+    else:
+        audio_bytes = info.file_size - info.audio_offset - (128 if has_id3v1 else 0)
+        info.duration = max(audio_bytes, 0) * 8 / bitrate
+    return info
+
+
+def format_duration(seconds: float) -> str:
+    """格式化为 HH:MM:SS（itunes:duration 使用的格式）"""
+    total = int(round(seconds))
+    return f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}"
+
+
+def main():
+    """主函数"""
+    if len(sys.argv) < 2:
+        print("用法:")
+        print("  python scripts/mp3_header.py <MP3文件> [...]")
+        sys.exit(1)
+
+    for path in sys.argv[1:]:
+        info = read_mp3_info(path)
+        if info.error:
+            print(f"✗ {path}: {info.error}")
+            continue
+        source = info.vbr_header or 'CBR 估算'
+        print(f"{path}: {format_duration(info.duration)} ({info.duration:.2f} 秒, {source}), "
+              f"{info.bitrate // 1000} kbps, {info.sample_rate} Hz, {info.file_size} 字节")
+
+
+if __name__ == '__main__':
+    main()
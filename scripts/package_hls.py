@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HLS 分段打包
+把已编码的 MP3（以及同名的 AAC 版本）直接复制码流切成几秒一段的小文件，
+为每个故事生成 `audio/hls/<文件名>/index.m3u8`，播放器下载第一段即可开始播放，
+拖动进度时也能准确定位到分段。分段中不含封面和全文等大标签，也不会重新编码
+
+用法：
+    python scripts/package_hls.py [MP3文件或目录 ...] [--segment 6] [--force]
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+
+HLS_DIRNAME = 'hls'
+SEGMENT_SECONDS = 6.0
+MASTER_PLAYLIST = 'index.m3u8'
+VARIANT_PLAYLIST = 'playlist.m3u8'
+SOURCE_RECORD = '.source.json'  # 记录打包时各来源文件的大小和修改时间
+
+_EXTINF_RE = re.compile(r'^#EXTINF:([\d.]+),\s*\n(.+)$', re.MULTILINE)
+
+
+@dataclass(frozen=True)
+class Variant:
+    """一个码流版本：来源文件扩展名和分段格式"""
+    name: str
+    suffix: str
+    segment_type: str  # 'mpegts' 或 'fmp4'
+    codecs: str  # 主播放列表中的 CODECS 属性
+
+    @property
+    def segment_ext(self) -> str:
+        return '.m4s' if self.segment_type == 'fmp4' else '.ts'
+
+
+# 按主播放列表中的顺序排列，低码率在前，播放器通常从第一个开始
+VARIANTS = (
+    Variant('aac', '.m4a', 'fmp4', 'mp4a.40.2'),
+    Variant('mp3', '.mp3', 'mpegts', 'mp4a.40.34'),
+)
+
+
+def hls_dir_for(audio_path: str) -> Path:
+    """故事的 HLS 目录：与 MP3 同级的 hls/<文件名>/"""
+    audio_path = Path(audio_path)
+    return audio_path.parent / HLS_DIRNAME / audio_path.stem
+
+
+def _sources(audio_path: Path) -> List[tuple]:
+    """找出已有的各版本来源文件：[(版本, 路径)]"""
+    found = []
+    for variant in VARIANTS:
+        path = audio_path.with_suffix(variant.suffix)
+        if path.is_file():
+            found.append((variant, path))
+    return found
+
+
+def _source_record(sources) -> dict:
+    record = {}
+    for variant, path in sources:
+        st = path.stat()
+        record[variant.name] = {'name': path.name, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    return record
+
+
+def _is_fresh(out_dir: Path, record: dict, segment_seconds: float) -> bool:
+    try:
+        with open(out_dir / SOURCE_RECORD, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (saved.get('sources') == record
+            and saved.get('segment_seconds') == segment_seconds
+            and (out_dir / MASTER_PLAYLIST).is_file())
+
+
+def segment_cmd(source: Path, variant: Variant, out_dir: Path,
+                segment_seconds: float = SEGMENT_SECONDS) -> List[str]:
+    """构建复制码流、切分为 HLS 分段的 ffmpeg 命令"""
+    cmd = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-y',
+        '-i', str(source),
+        '-map', '0:a:0',  # 只要音频，不要 MP3 中作为视频流的封面
+        '-c:a', 'copy',
+        '-map_metadata', '-1',  # 分段中不带标题、全文等标签
+        '-f', 'hls',
+        '-hls_time', f'{segment_seconds:g}',
+        '-hls_playlist_type', 'vod',
+        '-hls_list_size', '0',
+        '-hls_flags', 'independent_segments',
+        '-hls_segment_type', variant.segment_type,
+    ]
+    if variant.segment_type == 'fmp4':
+        cmd += ['-hls_fmp4_init_filename', 'init.mp4']
+    cmd += [
+        '-hls_segment_filename', str(out_dir / f'seg_%04d{variant.segment_ext}'),
+        str(out_dir / VARIANT_PLAYLIST),
+    ]
+    return cmd
+
+
+def _bandwidth(variant_dir: Path) -> tuple:
+    """按实际分段大小计算 (峰值码率, 平均码率)，单位 bit/s"""
+    text = (variant_dir / VARIANT_PLAYLIST).read_text(encoding='utf-8')
+    peak = 0
+    total_bits = 0
+    total_seconds = 0.0
+    for duration, name in _EXTINF_RE.findall(text):
+        seconds = float(duration)
+        bits = (variant_dir / name.strip()).stat().st_size * 8
+        total_bits += bits
+        total_seconds += seconds
+        if seconds > 0:
+            peak = max(peak, int(bits / seconds))
+    average = int(total_bits / total_seconds) if total_seconds else 0
+    return peak or average, average
+
+
+def _write_master(out_dir: Path, packaged: Sequence[Variant]) -> None:
+    version = 7 if any(v.segment_type == 'fmp4' for v in packaged) else 3
+    lines = ['#EXTM3U', f'#EXT-X-VERSION:{version}', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for variant in packaged:
+        peak, average = _bandwidth(out_dir / variant.name)
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={peak},AVERAGE-BANDWIDTH={average},'
+                     f'CODECS="{variant.codecs}"')
+        lines.append(f'{variant.name}/{VARIANT_PLAYLIST}')
+    (out_dir / MASTER_PLAYLIST).write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def package_story(audio_path: str, segment_seconds: float = SEGMENT_SECONDS,
+                  force: bool = False) -> Optional[Path]:
+    """为一个故事生成 HLS 分段和播放列表
+
+    来源文件没有变化时跳过。先在临时目录中生成，完成后整体替换旧目录，
+    打包中途失败不会破坏已有的播放列表。
+
+    Returns:
+        主播放列表路径，失败时返回 None
+    """
+    audio_path = Path(audio_path).resolve()
+    sources = _sources(audio_path)
+    if not sources:
+        print(f"✗ 没有可打包的音频: {audio_path}")
+        return None
+
+    out_dir = hls_dir_for(str(audio_path))
+    record = _source_record(sources)
+    if not force and _is_fresh(out_dir, record, segment_seconds):
+        print(f"  - HLS 已是最新: {out_dir / MASTER_PLAYLIST}")
+        return out_dir / MASTER_PLAYLIST
+
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=out_dir.parent, prefix=f'.{out_dir.name}-'))
+    try:
+        packaged = []
+        for variant, source in sources:
+            variant_dir = tmp_dir / variant.name
+            variant_dir.mkdir()
+            try:
+                subprocess.run(segment_cmd(source, variant, variant_dir, segment_seconds),
+                               check=True, capture_output=True)
+            except subprocess.CalledProcessError as e:
+                print(f"✗ {variant.name} 分段失败: {e.stderr.decode(errors='replace')}")
+                return None
+            packaged.append(variant)
+
+        _write_master(tmp_dir, packaged)
+        with open(tmp_dir / SOURCE_RECORD, 'w', encoding='utf-8') as f:
+            json.dump({'sources': record, 'segment_seconds': segment_seconds}, f,
+                      ensure_ascii=False, indent=2)
+
+        # 整体替换旧目录
+        old_dir = None
+        if out_dir.exists():
+            old_dir = Path(tempfile.mkdtemp(dir=out_dir.parent, prefix=f'.{out_dir.name}-old-'))
+            os.replace(out_dir, old_dir / out_dir.name)
+        os.replace(tmp_dir, out_dir)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+    finally:
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    names = '、'.join(v.name for v in packaged)
+    print(f"  ✓ HLS ({names}): {out_dir / MASTER_PLAYLIST}")
+    return out_dir / MASTER_PLAYLIST
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='把已编码的音频打包为 HLS 分段和播放列表')
+    parser.add_argument('paths', nargs='*', default=['audio'],
+                        help='MP3 文件或目录（默认: audio）')
+    parser.add_argument('--segment', type=float, default=SEGMENT_SECONDS,
+                        help=f'分段时长（秒，默认: {SEGMENT_SECONDS:g}）')
+    parser.add_argument('--force', action='store_true', help='忽略已有结果，全部重新打包')
+    args = parser.parse_args()
+
+    files = []
+    for path in map(Path, args.paths):
+        if path.is_dir():
+            files.extend(sorted(p for p in path.iterdir() if p.suffix.lower() == '.mp3'))
+        else:
+            files.append(path)
+    if not files:
+        print("未找到 MP3 文件")
+        sys.exit(1)
+
+    failed = 0
+    for path in files:
+        print(f"打包: {path.name}")
+        if package_story(str(path), args.segment, args.force) is None:
+            failed += 1
+    print(f"\n完成: {len(files) - failed}/{len(files)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
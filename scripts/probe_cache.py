@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+媒体文件信息缓存
+时长、编码、码率、采样率、声道布局和标签摘要保存在缓存目录下的 SQLite 数据库中，
+以 (路径, 大小, 修改时间) 为键，文件未变化时直接返回，不再启动 ffprobe 或解析标签。
+MP3 只读取帧头和 ID3 帧目录（见 mp3_header.py、id3_scan.py），其他格式调用 ffprobe
+
+修改时间变了但大小不变时（例如重新检出），如果之前记录过内容哈希，会比较哈希后沿用旧结果
+
+用法：
+    python scripts/probe_cache.py audio/01-巫巫女的心变了.mp3 [...]
+    python scripts/probe_cache.py audio --hashes       # 同时计算嵌入封面和全文的哈希
+    python scripts/probe_cache.py --prune              # 删除已不存在的文件的记录
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from build_cache import default_cache_dir, file_hash
+from id3_scan import scan_tags
+from mp3_header import format_duration, read_mp3_info
+
+try:
+    from mutagen.id3 import ID3, ID3NoHeaderError
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MUTAGEN_AVAILABLE = False
+
+
+PROBE_VERSION = 1  # 记录格式变化时加一，旧记录全部作废
+DB_NAME = 'probe.sqlite'
+# 记录数超过此值时，打开缓存时顺带删除已不存在的文件（主要是处理过程中的临时文件）
+PRUNE_THRESHOLD = 5000
+# 命令行按目录读取时包含的文件类型
+MEDIA_EXTENSIONS = {'.mp3', '.m4a', '.aac', '.wav', '.flac', '.ogg', '.mov', '.mp4', '.mkv'}
+
+
+@dataclass
+class MediaInfo:
+    """一个媒体文件的基本信息"""
+    path: str
+    size: int = 0
+    mtime_ns: int = 0
+    content_sha256: Optional[str] = None  # 整个文件的哈希，按需计算
+    format_name: Optional[str] = None
+    duration: float = 0.0
+    codec: Optional[str] = None  # 第一条音频流的编码
+    bitrate: int = 0  # bit/s
+    sample_rate: int = 0
+    channels: int = 0
+    channel_layout: Optional[str] = None
+    has_video: bool = False
+    # MP3 的标签摘要：version、frames（帧名 -> 字节数）、title、missing、complete、error，
+    # 按需计算的 cover_mime、cover_bytes、cover_sha256、text_chars、text_sha256
+    tags: Optional[dict] = None
+    error: Optional[str] = None
+
+    @property
+    def has_hashes(self) -> bool:
+        return self.tags is not None and 'text_sha256' in self.tags
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _probe_mp3(path: str, info: MediaInfo) -> None:
+    """只读帧头和 ID3 帧目录"""
+    header = read_mp3_info(path)
+    info.format_name = 'mp3'
+    info.codec = 'mp3'
+    info.duration = header.duration
+    info.bitrate = header.bitrate
+    info.sample_rate = header.sample_rate
+    info.channels = header.channels
+    info.channel_layout = 'mono' if header.channels == 1 else 'stereo'
+    info.error = header.error
+
+    summary = scan_tags(path, read_text=('TIT2',))
+    info.tags = {
+        'version': '.'.join(map(str, summary.version)) if summary.version else None,
+        'frames': summary.frames,
+        'title': summary.texts.get('TIT2'),
+        'missing': summary.missing,
+        'complete': summary.complete,
+        'error': summary.error,
+    }
+
+
+def _hash_tags(path: str, tags: dict) -> None:
+    """读取封面和全文帧的内容，记录大小和哈希（需要 mutagen，只解析标签不读音频）"""
+    if not MUTAGEN_AVAILABLE:
+        raise RuntimeError("需要安装 mutagen 库: pip install mutagen")
+    try:
+        id3 = ID3(path)
+    except ID3NoHeaderError:
+        id3 = None
+    apic = next(iter(id3.getall('APIC')), None) if id3 is not None else None
+    uslt = next(iter(id3.getall('USLT')), None) if id3 is not None else None
+    text = str(uslt.text) if uslt is not None else None
+    tags.update({
+        'cover_mime': apic.mime if apic is not None else None,
+        'cover_bytes': len(apic.data) if apic is not None else 0,
+        'cover_sha256': _sha256(apic.data) if apic is not None else None,
+        'text_chars': len(text) if text is not None else 0,
+        'text_sha256': _sha256(text.encode('utf-8')) if text is not None else None,
+    })
+
+
+def _ffprobe(path: str, info: MediaInfo) -> None:
+    """非 MP3 文件：读取容器和流信息"""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=format_name,duration,bit_rate:'
+                         'stream=codec_type,codec_name,sample_rate,channels,channel_layout,bit_rate',
+        '-of', 'json', path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        info.error = result.stderr.strip() or f'ffprobe 返回 {result.returncode}'
+        return
+    data = json.loads(result.stdout or '{}')
+    fmt = data.get('format', {})
+    streams = data.get('streams', [])
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    info.format_name = fmt.get('format_name')
+    info.duration = float(fmt.get('duration') or 0.0)
+    info.has_video = any(s.get('codec_type') == 'video' for s in streams)
+    if audio is None:
+        info.error = '没有音频流'
+        info.bitrate = int(fmt.get('bit_rate') or 0)
+        return
+    info.codec = audio.get('codec_name')
+    info.bitrate = int(audio.get('bit_rate') or fmt.get('bit_rate') or 0)
+    info.sample_rate = int(audio.get('sample_rate') or 0)
+    info.channels = int(audio.get('channels') or 0)
+    info.channel_layout = audio.get('channel_layout')
+
+
+class ProbeCache:
+    """SQLite 中的媒体信息缓存，可在多个线程中共用
+
+    stats 记录命中、未命中以及为读取信息启动的子进程数
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        directory = Path(root) if root else default_cache_dir()
+        self.path = directory / DB_NAME
+        self.stats = {'hits': 0, 'misses': 0, 'spawns': 0}
+        self._lock = threading.Lock()
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._db = self._open(str(self.path))
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠ 无法打开媒体信息缓存 {self.path}: {e}，本次只在内存中缓存")
+            self._db = self._open(':memory:')
+        count = self._db.execute('SELECT COUNT(*) FROM media').fetchone()[0]
+        if count > PRUNE_THRESHOLD:
+            self.prune()
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        if db.execute('PRAGMA user_version').fetchone()[0] != PROBE_VERSION:
+            db.execute('DROP TABLE IF EXISTS media')
+            db.execute(f'PRAGMA user_version = {PROBE_VERSION}')
+        if path != ':memory:':
+            db.execute('PRAGMA journal_mode = WAL')  # 多个进程同时读写
+        db.execute('CREATE TABLE IF NOT EXISTS media ('
+                   'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+                   'sha256 TEXT, info TEXT)')
+        db.commit()
+        return db
+
+    def _load(self, path: str) -> Optional[MediaInfo]:
+        with self._lock:
+            row = self._db.execute('SELECT info FROM media WHERE path = ?', (path,)).fetchone()
+        return MediaInfo(**json.loads(row[0])) if row else None
+
+    def _store(self, info: MediaInfo) -> None:
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?)',
+                             (info.path, info.size, info.mtime_ns, info.content_sha256,
+                              json.dumps(asdict(info), ensure_ascii=False)))
+            self._db.commit()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def probe(self, path: str, hashes: bool = False, content_hash: bool = False) -> MediaInfo:
+        """返回文件信息，缓存中没有或文件已变化时重新读取
+
+        Args:
+            hashes: MP3 需要嵌入封面和全文的哈希（verify_audio 用来和源文件比较）
+            content_hash: 需要整个文件的 SHA-256，记录后修改时间变化也能识别出内容未变
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        cached = self._load(path)
+        dirty = False
+        if cached is not None and (cached.size, cached.mtime_ns) != (st.st_size, st.st_mtime_ns):
+            if (cached.content_sha256 and cached.size == st.st_size
+                    and file_hash(path) == cached.content_sha256):
+                cached.mtime_ns = st.st_mtime_ns
+                dirty = True
+            else:
+                cached = None
+
+        if cached is None:
+            self._count('misses')
+            info = MediaInfo(path=path, size=st.st_size, mtime_ns=st.st_mtime_ns)
+            if path.lower().endswith('.mp3'):
+                _probe_mp3(path, info)
+            else:
+                self._count('spawns')
+                try:
+                    _ffprobe(path, info)
+                except FileNotFoundError:
+                    raise RuntimeError("未找到 ffprobe，请安装 ffmpeg")
+            dirty = True
+        else:
+            self._count('hits')
+            info = cached
+
+        if hashes and info.tags is not None and not info.has_hashes:
+            _hash_tags(path, info.tags)
+            dirty = True
+        if content_hash and not info.content_sha256:
+            info.content_sha256 = file_hash(path)
+            dirty = True
+        if dirty:
+            self._store(info)
+        return info
+
+    def probe_many(self, paths: Iterable[str], jobs: Optional[int] = None,
+                   **options) -> Dict[str, MediaInfo]:
+        """并行读取多个文件，返回 {传入的路径: MediaInfo}"""
+        paths = [str(p) for p in paths]
+        jobs = jobs or min(32, (os.cpu_count() or 1) * 2)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(lambda p: self.probe(p, **options), paths)
+            return dict(zip(paths, results))
+
+    def prune(self) -> int:
+        """删除已不存在的文件的记录，返回删除的条数"""
+        with self._lock:
+            paths = [row[0] for row in self._db.execute('SELECT path FROM media')]
+            missing = [(p,) for p in paths if not os.path.exists(p)]
+            self._db.executemany('DELETE FROM media WHERE path = ?', missing)
+            self._db.commit()
+        return len(missing)
+
+
+_default_cache: Optional[ProbeCache] = None
+_default_lock = threading.Lock()
+
+
+def default_probe_cache() -> ProbeCache:
+    """进程内共用的缓存实例"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ProbeCache()
+        return _default_cache
+
+
+def probe(path: str, hashes: bool = False, content_hash: bool = False) -> MediaInfo:
+    """用共用的缓存读取文件信息，见 ProbeCache.probe"""
+    return default_probe_cache().probe(path, hashes=hashes, content_hash=content_hash)
+
+
+def probe_many(paths: Iterable[str], jobs: Optional[int] = None, **options) -> Dict[str, MediaInfo]:
+    return default_probe_cache().probe_many(paths, jobs, **options)
+
+
+def probe_duration(path: str) -> float:
+    """读取时长（秒），无法读取时抛出 ValueError"""
+    info = probe(path)
+    if info.error or info.duration <= 0:
+        raise ValueError(f"无法读取时长: {path}: {info.error or '时长为 0'}")
+    return info.duration
+
+
+def _collect(targets: List[str]) -> List[str]:
+    files = []
+    for target in targets:
+        if os.path.isdir(target):
+            files.extend(sorted(str(p) for p in Path(target).iterdir()
+                                if p.suffix.lower() in MEDIA_EXTENSIONS))
+        else:
+            files.append(target)
+    return files
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='读取并缓存媒体文件信息')
+    parser.add_argument('paths', nargs='*', help='媒体文件或目录')
+    parser.add_argument('--hashes', action='store_true', help='同时计算嵌入封面和全文的哈希')
+    parser.add_argument('--content-hash', action='store_true', help='同时计算整个文件的哈希')
+    parser.add_argument('--prune', action='store_true', help='删除已不存在的文件的记录')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出')
+    args = parser.parse_args()
+
+    if not args.paths and not args.prune:
+        parser.print_help()
+        sys.exit(1)
+
+    cache = default_probe_cache()
+    if args.prune:
+        print(f"已删除 {cache.prune()} 条记录")
+
+    try:
+        results = cache.probe_many(_collect(args.paths), hashes=args.hashes,
+                                   content_hash=args.content_hash)
+    except (OSError, RuntimeError) as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    if args.json:
+        print(json.dumps([asdict(info) for info in results.values()], ensure_ascii=False, indent=2))
+    else:
+        for path, info in results.items():
+            if info.error:
+                print(f"✗ {Path(path).name}: {info.error}")
+                continue
+            line = (f"✓ {Path(path).name}: {format_duration(info.duration)}  {info.codec}  "
+                    f"{info.bitrate // 1000} kbps  {info.sample_rate} Hz  {info.channel_layout}")
+            if info.tags is not None:
+                missing = info.tags['missing']
+                line += f"  标签{'缺少 ' + ', '.join(missing) if missing else '完整'}"
+            print(line)
+    if results:
+        stats = cache.stats
+        print(f"\n缓存命中 {stats['hits']} 个，重新读取 {stats['misses']} 个，"
+              f"启动 ffprobe {stats['spawns']} 次")
+
+
+if __name__ == '__main__':
+    main()
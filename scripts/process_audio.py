@@ -11,8 +11,10 @@ import sys
 import subprocess
 import json
 import re
+import functools
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
 try:
     from mutagen.mp3 import MP3
@@ -23,9 +25,32 @@ except ImportError:
     print("请运行: pip install mutagen")
     sys.exit(1)
 
+from silence_analyzer import NUMPY_AVAILABLE, analyze_edges, analyze_silence
+from renditions import (DEFAULT_RENDITIONS, RENDITIONS, Rendition, multi_output_cmd,
+                        parse_renditions, rendition_path, tag_rendition)
+from package_hls import package_story
+from audio_analysis import (DEFAULT_TARGET_LUFS, AnalysisReport, analyze_recording, load_report,
+                            report_path_for)
+from build_cache import BuildCache, file_hash, make_key
+from cover_art import MAX_BYTES as COVER_MAX_BYTES, MAX_DIMENSION as COVER_MAX_DIMENSION
+from cover_art import detect_image_mime, prepare_cover
+from asset_index import (IMAGE_EXTENSIONS, clean_asset_name, get_original_base_name,
+                         lookup, strip_temp_suffix)
+from chapters import ChapterMap, build_chapter_map, load_catalog_rate, print_chapter_map
+from chapters import write_chapter_frames
+from probe_cache import probe_duration
+# clean_markdown_title 原来定义在这里，外部脚本仍可以从 process_audio 导入
+from story_corpus import clean_markdown_title, load_story  # noqa: F401
+from tracing import Tracer, aggregate, format_histogram, profiled, save_traces, span
 
+
+# 处理流程版本号：修改编码或裁剪逻辑后递增，使旧的缓存结果失效
+PIPELINE_VERSION = '1'
+
+
+@functools.lru_cache(maxsize=None)
 def check_ffmpeg():
-    """检查 ffmpeg 是否安装"""
+    """检查 ffmpeg 是否安装（结果会被缓存，批量处理时只检查一次）"""
     try:
         subprocess.run(['ffmpeg', '-version'], 
                       capture_output=True, check=True)
@@ -57,119 +82,165 @@ def extract_audio(video_path: str, output_path: str) -> bool:
         return False
 
 
-def detect_silence(audio_path: str, 
-                   min_start_padding: float = 0.5,
-                   min_end_padding: float = 0.5) -> Tuple[float, float]:
-    """检测音频前后的静音部分
-    
-    Args:
-        audio_path: 音频文件路径
-        min_start_padding: 开头最小保留时长（秒），默认0.5秒
-        min_end_padding: 结尾最小保留时长（秒），默认0.5秒
+def run_silencedetect(audio_path: str) -> Tuple[List[float], List[float], float]:
+    """运行 ffmpeg silencedetect，返回 (静音开始列表, 静音结束列表, 总时长)
     
-    Returns:
-        (start_trim, end_trim): 需要去除的开头和结尾时长
+    未安装 NumPy 时的后备方案
     """
-    print("正在检测静音部分...")
     cmd = [
         'ffmpeg', '-i', audio_path,
+        '-vn',  # 只分析音频，不解码视频轨
         '-af', 'silencedetect=noise=-30dB:duration=0.5',
         '-f', 'null', '-'
     ]
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        output = result.stderr
-        
-        # 解析静音检测结果
-        silence_starts = []
-        silence_ends = []
-        
-        for line in output.split('\n'):
-            if 'silence_start' in line:
-                match = re.search(r'silence_start: ([\d.]+)', line)
-                if match:
-                    silence_starts.append(float(match.group(1)))
-            elif 'silence_end' in line:
-                match = re.search(r'silence_end: ([\d.]+)', line)
-                if match:
-                    silence_ends.append(float(match.group(1)))
-        
-        # 获取音频总时长
-        duration_match = re.search(r'Duration: (\d{2}):(\d{2}):(\d{2})\.(\d{2})', output)
-        if duration_match:
-            hours, minutes, seconds, centiseconds = map(int, duration_match.groups())
-            total_duration = hours * 3600 + minutes * 60 + seconds + centiseconds / 100
-        else:
-            total_duration = 0.0
-        
-        # 计算需要去除的前后空白
-        start_trim = 0.0
-        end_trim = 0.0
-        
-        if total_duration == 0:
-            return 0.0, 0.0
-        
-        # 改进的开头静音处理逻辑
-        # 检查开头是否有静音，但只在开头静音持续时间较长时才考虑裁剪
-        if silence_starts and silence_starts[0] < 1.0:  # 开头有静音
-            if silence_ends and len(silence_ends) > 0:
-                # 检查第一个静音段是否足够长（比如大于0.5秒）才考虑裁剪
-                first_silence_end = silence_ends[0]
-                if first_silence_end > 0.5:  # 只有当开头静音超过0.5秒才裁剪
-                    # 保留0.1秒的缓冲，但不能超过开头最小保留时间
-                    start_trim = min(max(first_silence_end - 0.1, min_start_padding), first_silence_end)
-                else:
-                    # 开头静音很短，不裁剪
-                    start_trim = min_start_padding
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    output = result.stderr
+    
+    # 解析静音检测结果
+    silence_starts = []
+    silence_ends = []
+    
+    for line in output.split('\n'):
+        if 'silence_start' in line:
+            match = re.search(r'silence_start: ([\d.]+)', line)
+            if match:
+                silence_starts.append(float(match.group(1)))
+        elif 'silence_end' in line:
+            match = re.search(r'silence_end: ([\d.]+)', line)
+            if match:
+                silence_ends.append(float(match.group(1)))
+    
+    # 总时长从媒体信息缓存读取（MP3 只读帧头），不再解析 ffmpeg 输出中精确到 0.01 秒的 Duration 行
+    total_duration = probe_duration(audio_path)
+    
+    return silence_starts, silence_ends, total_duration
+
+
+def compute_trims(silence_starts: List[float], silence_ends: List[float],
+                  total_duration: float,
+                  min_start_padding: float = 0.5,
+                  min_end_padding: float = 0.5) -> Tuple[float, float]:
+    """根据静音区间计算需要去除的开头和结尾时长"""
+    # 计算需要去除的前后空白
+    start_trim = 0.0
+    end_trim = 0.0
+    
+    if total_duration == 0:
+        return 0.0, 0.0
+    
+    # 改进的开头静音处理逻辑
+    # 检查开头是否有静音，但只在开头静音持续时间较长时才考虑裁剪
+    if silence_starts and silence_starts[0] < 1.0:  # 开头有静音
+        if silence_ends and len(silence_ends) > 0:
+            # 检查第一个静音段是否足够长（比如大于0.5秒）才考虑裁剪
+            first_silence_end = silence_ends[0]
+            if first_silence_end > 0.5:  # 只有当开头静音超过0.5秒才裁剪
+                # 保留0.1秒的缓冲，但不能超过开头最小保留时间
+                start_trim = min(max(first_silence_end - 0.1, min_start_padding), first_silence_end)
             else:
-                # 没有对应的静音结束时间，不裁剪
+                # 开头静音很短，不裁剪
                 start_trim = min_start_padding
         else:
-            # 开头没有静音，保留最小开头空白
+            # 没有对应的静音结束时间，不裁剪
             start_trim = min_start_padding
-        
-        # 处理结尾空白
-        if silence_starts:
-            # 寻找最后可能的结尾静音
-            for i in range(len(silence_starts)-1, -1, -1):
-                silence_start_time = silence_starts[i]
-                # 检查这个静音段是否接近音频结尾
-                if total_duration - silence_start_time <= 2.0:  # 静音开始时间距离结尾小于2秒
-                    if i < len(silence_ends):
-                        # 计算这个静音段的持续时间
-                        silence_duration = silence_ends[i] - silence_start_time
-                        if silence_duration > 0.5:  # 静音持续时间超过0.5秒才裁剪
-                            # 裁剪从静音开始时间到结尾的部分
-                            end_trim = min(max(total_duration - silence_start_time - 0.1, min_end_padding), 
-                                          total_duration - silence_start_time)
-                        break
-        
-        # 确保不会裁剪过度（剩余的有效音频时长不能为负）
-        remaining_duration = total_duration - start_trim - end_trim
-        if remaining_duration < 0:
-            # 如果音频太短，重新分配保留时长
-            if total_duration >= min_start_padding + min_end_padding:
-                # 音频足够长，分别保留最小空白
-                start_trim = min_start_padding
-                end_trim = min_end_padding
+    else:
+        # 开头没有静音，保留最小开头空白
+        start_trim = min_start_padding
+    
+    # 处理结尾空白
+    if silence_starts:
+        # 寻找最后可能的结尾静音
+        for i in range(len(silence_starts)-1, -1, -1):
+            silence_start_time = silence_starts[i]
+            # 检查这个静音段是否接近音频结尾
+            if total_duration - silence_start_time <= 2.0:  # 静音开始时间距离结尾小于2秒
+                if i < len(silence_ends):
+                    # 计算这个静音段的持续时间
+                    silence_duration = silence_ends[i] - silence_start_time
+                    if silence_duration > 0.5:  # 静音持续时间超过0.5秒才裁剪
+                        # 裁剪从静音开始时间到结尾的部分
+                        end_trim = min(max(total_duration - silence_start_time - 0.1, min_end_padding), 
+                                      total_duration - silence_start_time)
+                    break
+    
+    # 确保不会裁剪过度（剩余的有效音频时长不能为负）
+    remaining_duration = total_duration - start_trim - end_trim
+    if remaining_duration < 0:
+        # 如果音频太短，重新分配保留时长
+        if total_duration >= min_start_padding + min_end_padding:
+            # 音频足够长，分别保留最小空白
+            start_trim = min_start_padding
+            end_trim = min_end_padding
+        else:
+            # 音频太短，不进行裁剪，保留原样
+            start_trim = 0.0
+            end_trim = 0.0
+    
+    return start_trim, end_trim
+
+
+def analyze_trims(audio_path: str,
+                  min_start_padding: float = 0.5,
+                  min_end_padding: float = 0.5,
+                  edges_only: bool = False) -> Tuple[float, float, float]:
+    """检测静音并计算裁剪量，同时返回音频总时长
+    
+    Args:
+        edges_only: 只解码开头和结尾的窗口，分析耗时与音频长度无关
+    
+    Returns:
+        (start_trim, end_trim, total_duration)
+    """
+    print("正在检测静音部分...")
+    try:
+        if NUMPY_AVAILABLE:
+            if edges_only:
+                report = analyze_edges(audio_path)
             else:
-                # 音频太短，不进行裁剪，保留原样
-                start_trim = 0.0
-                end_trim = 0.0
+                report = analyze_silence(audio_path)
+            silence_starts = report.silence_starts
+            silence_ends = report.silence_ends
+            total_duration = report.duration
+        else:
+            silence_starts, silence_ends, total_duration = run_silencedetect(audio_path)
+        start_trim, end_trim = compute_trims(silence_starts, silence_ends, total_duration,
+                                             min_start_padding, min_end_padding)
         
         print(f"  检测到开头空白: {start_trim:.2f}秒 (将保留至少 {min_start_padding:.2f}秒)")
         print(f"  检测到结尾空白: {end_trim:.2f}秒 (将保留至少 {min_end_padding:.2f}秒)")
         
-        return start_trim, end_trim
+        return start_trim, end_trim, total_duration
         
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, ValueError) as e:
         print(f"✗ 静音检测失败: {e}")
-        return 0.0, 0.0
+        return 0.0, 0.0, 0.0
+
+
+def detect_silence(audio_path: str, 
+                   min_start_padding: float = 0.5,
+                   min_end_padding: float = 0.5) -> Tuple[float, float]:
+    """检测音频前后的静音部分
+    
+    Args:
+        audio_path: 音频文件路径
+        min_start_padding: 开头最小保留时长（秒），默认0.5秒
+        min_end_padding: 结尾最小保留时长（秒），默认0.5秒
+    
+    Returns:
+        (start_trim, end_trim): 需要去除的开头和结尾时长
+    """
+    start_trim, end_trim, _ = analyze_trims(audio_path, min_start_padding, min_end_padding)
+    return start_trim, end_trim
 
 
 def trim_audio(input_path: str, output_path: str, 
-               start_trim: float, end_trim: float) -> bool:
-    """去除音频前后的空白"""
+               start_trim: float, end_trim: float,
+               total_duration: Optional[float] = None) -> bool:
+    """去除音频前后的空白
+    
+    Args:
+        total_duration: 音频总时长（秒），未提供时从媒体信息缓存读取
+    """
     if start_trim == 0.0 and end_trim == 0.0:
         print("没有检测到需要去除的空白")
         # 直接复制文件
@@ -179,15 +250,9 @@ def trim_audio(input_path: str, output_path: str,
     
     print(f"正在去除空白 (开头: {start_trim:.2f}秒, 结尾: {end_trim:.2f}秒)...")
     
-    # 获取音频时长
-    cmd_duration = [
-        'ffprobe', '-v', 'error', '-show_entries',
-        'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1',
-        input_path
-    ]
     try:
-        result = subprocess.run(cmd_duration, capture_output=True, text=True, check=True)
-        total_duration = float(result.stdout.strip())
+        if total_duration is None:
+            total_duration = probe_duration(input_path)
         end_time = total_duration - end_trim
         
         # 使用正确的编码参数，确保后续可以应用滤镜
@@ -207,6 +272,9 @@ def trim_audio(input_path: str, output_path: str,
     except subprocess.CalledProcessError as e:
         print(f"✗ 空白去除失败: {e.stderr.decode()}")
         return False
+    except ValueError as e:
+        print(f"✗ 空白去除失败: {e}")
+        return False
 
 
 def apply_fade_in_effect(input_path: str, output_path: str, fade_duration: float = 0.2) -> bool:
@@ -238,32 +306,185 @@ def apply_fade_in_effect(input_path: str, output_path: str, fade_duration: float
         return False
 
 
-def get_original_base_name(original_path: str) -> str:
-    """获取原始文件的基本名称（去掉临时后缀）"""
-    original_name = Path(original_path).stem
-    # 去掉常见的临时后缀
-    suffixes_to_remove = ['_temp', '_trimmed', '_with_fade', '_processed']
-    for suffix in suffixes_to_remove:
-        if original_name.endswith(suffix):
-            original_name = original_name[:-len(suffix)]
-    return original_name
+def build_audio_filter(start_trim: float, end_trim: float, total_duration: float,
+                       fade_duration: float = 0.2,
+                       sample_rate: Optional[int] = 44100,
+                       gain_db: float = 0.0) -> str:
+    """构建单次编码用的滤镜链：裁剪 -> 响度增益 -> 淡入 -> 重采样
+    
+    sample_rate 为 None 时不重采样（多版本输出时由各版本自行设置采样率）
+    """
+    filters = []
+    if (start_trim > 0 or end_trim > 0) and total_duration > 0:
+        end_time = total_duration - end_trim
+        filters.append(f'atrim=start={start_trim:.3f}:end={end_time:.3f}')
+        filters.append('asetpts=PTS-STARTPTS')  # 裁剪后时间戳从0开始，淡入才能对准开头
+    if abs(gain_db) >= 0.01:
+        filters.append(f'volume={gain_db:.2f}dB')
+    if fade_duration > 0:
+        filters.append(f'afade=t=in:ss=0:d={fade_duration}')
+    if sample_rate:
+        filters.append(f'aresample={sample_rate}')
+    return ','.join(filters) or 'anull'
+
+
+def encode_single_pass(input_path: str, output_path: str,
+                       start_trim: float, end_trim: float, total_duration: float,
+                       fade_duration: float = 0.2, gain_db: float = 0.0) -> bool:
+    """一次解码、一次编码完成提取、裁剪、淡入和重采样
+    
+    Args:
+        input_path: 录屏或音频文件路径
+        output_path: 输出 MP3 文件路径
+        start_trim: 开头去除时长（秒）
+        end_trim: 结尾去除时长（秒）
+        total_duration: 音频总时长（秒）
+        fade_duration: 淡入时长（秒），默认0.2秒
+        gain_db: 响度标准化增益（dB），默认不调整
+    """
+    audio_filter = build_audio_filter(start_trim, end_trim, total_duration, fade_duration,
+                                      gain_db=gain_db)
+    print(f"正在单次编码音频 (滤镜: {audio_filter})...")
+    cmd = [
+        'ffmpeg', '-i', input_path,
+        '-vn',  # 不包含视频
+        '-af', audio_filter,
+        '-acodec', 'libmp3lame',  # 使用 MP3 编码
+        '-ab', '192k',  # 音频比特率
+        '-ar', '44100',  # 采样率
+        '-y',
+        output_path
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+        print(f"✓ 音频编码完成: {output_path}")
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"✗ 音频编码失败: {e.stderr.decode()}")
+        return False
+
+
+def encode_renditions(input_path: str, targets: Sequence[Tuple[Rendition, str]],
+                      start_trim: float, end_trim: float, total_duration: float,
+                      fade_duration: float = 0.2, gain_db: float = 0.0) -> Optional[bytes]:
+    """一次解码、共用一条滤镜链同时编码多个版本
+    
+    Args:
+        targets: (版本, 输出路径) 列表，输出路径为 'pipe:1' 的版本通过管道返回
+    
+    Returns:
+        管道输出的数据（没有管道输出时为 b''），失败时返回 None
+    """
+    audio_filter = build_audio_filter(start_trim, end_trim, total_duration, fade_duration,
+                                      sample_rate=None, gain_db=gain_db)
+    names = ', '.join(rendition.name for rendition, _ in targets)
+    print(f"正在单次编码 {names} (滤镜: {audio_filter})...")
+    cmd = multi_output_cmd(input_path, audio_filter, targets)
+    try:
+        result = subprocess.run(cmd, check=True, capture_output=True)
+        print(f"✓ 音频编码完成")
+        return result.stdout
+    except subprocess.CalledProcessError as e:
+        print(f"✗ 音频编码失败: {e.stderr.decode()}")
+        return None
+
+
+def mp3_pipe_cmd(input_path: str, audio_filter: str) -> List[str]:
+    """把 MP3 编码结果输出到标准输出的 ffmpeg 命令（encode_to_memory 和 async_pipeline 共用）"""
+    return [
+        'ffmpeg', '-i', input_path,
+        '-vn',  # 不包含视频
+        '-af', audio_filter,
+        '-acodec', 'libmp3lame',  # 使用 MP3 编码
+        '-ab', '192k',  # 音频比特率
+        '-ar', '44100',  # 采样率
+        '-write_xing', '0',
+        '-f', 'mp3',
+        'pipe:1'
+    ]
+
+
+def encode_to_memory(input_path: str, start_trim: float, end_trim: float,
+                     total_duration: float, fade_duration: float = 0.2,
+                     gain_db: float = 0.0) -> Optional[bytes]:
+    """与 encode_single_pass 相同的单次编码，但把 MP3 输出到管道并返回字节数据
+    
+    管道不能回写 Xing 头，因此关闭 Xing 头；输出为 CBR，播放器按比特率即可算出准确时长
+    """
+    audio_filter = build_audio_filter(start_trim, end_trim, total_duration, fade_duration,
+                                      gain_db=gain_db)
+    print(f"正在单次编码音频到内存 (滤镜: {audio_filter})...")
+    try:
+        result = subprocess.run(mp3_pipe_cmd(input_path, audio_filter),
+                                check=True, capture_output=True)
+        print(f"✓ 音频编码完成 ({len(result.stdout)/1024/1024:.2f} MB)")
+        return result.stdout
+    except subprocess.CalledProcessError as e:
+        print(f"✗ 音频编码失败: {e.stderr.decode()}")
+        return None
+
+
+def publish_bytes(data: bytes, output_path: str) -> None:
+    """先写入输出目录中的临时文件，再原子重命名到输出路径
+    
+    中途失败不会留下写了一半的输出文件
+    """
+    import tempfile
+    
+    output_path = Path(output_path)
+    fd, tmp_path = tempfile.mkstemp(dir=output_path.parent,
+                                    prefix=f".{output_path.stem}-", suffix='.partial')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def publish_file(source_path: str, output_path: str) -> None:
+    """把临时文件原子地移动到输出路径（临时目录可以在其他文件系统，如 tmpfs）"""
+    import shutil
+    import tempfile
+    
+    output_path = Path(output_path)
+    try:
+        os.replace(source_path, output_path)  # 同一文件系统时直接重命名
+        return
+    except OSError:
+        pass
+    fd, tmp_path = tempfile.mkstemp(dir=output_path.parent,
+                                    prefix=f".{output_path.stem}-", suffix='.partial')
+    os.close(fd)
+    try:
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, output_path)
+        os.unlink(source_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def default_scratch_dir() -> Optional[str]:
+    """临时文件目录：环境变量 WUWUNV_SCRATCH_DIR（如 /dev/shm 等 tmpfs），未设置时为 None"""
+    return os.environ.get('WUWUNV_SCRATCH_DIR') or None
 
 
 def find_cover_image(original_path: str) -> Optional[str]:
     """查找封面图片（同名或指定）
     查找顺序：audio目录 > 当前目录 > 项目根目录
+    
+    每个目录只列一次（结果由 asset_index 缓存），之后都是内存查找
     """
     # 获取原始文件名（不含临时后缀）
     original_base_name = get_original_base_name(original_path)
     audio_dir = Path(original_path).parent
     
     # 清理名称：去除括号内容和常见后缀
-    clean_name = re.sub(r'[（(].*?[）)]', '', original_base_name).strip()
-    # 去除 _processed, _temp, _trimmed 等后缀
-    clean_name = re.sub(r'_(processed|temp|trimmed|录屏).*$', '', clean_name).strip()
-    
-    # 可能的图片扩展名
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
+    clean_name = clean_asset_name(original_base_name)
+    # 完整匹配（只去除后缀）
+    temp_name = strip_temp_suffix(original_base_name)
     
     # 查找目录列表：优先 audio 目录，然后当前目录，最后项目根目录
     search_dirs = [
@@ -272,24 +493,14 @@ def find_cover_image(original_path: str) -> Optional[str]:
         audio_dir.parent,  # 项目根目录
     ]
     
-    # 只保留存在的目录
-    search_dirs = [d for d in search_dirs if d.exists()]
-    
     # 查找同名图片
     for search_dir in search_dirs:
-        for ext in image_extensions:
-            # 尝试清理后的名称
-            image_path = search_dir / f"{clean_name}{ext}"
-            if image_path.exists():
-                print(f"  找到封面: {image_path}")
-                return str(image_path)
-            
-            # 尝试完整匹配（去除后缀前）
-            temp_name = re.sub(r'_(processed|temp|trimmed).*$', '', original_base_name).strip()
-            image_path = search_dir / f"{temp_name}{ext}"
-            if image_path.exists():
-                print(f"  找到封面: {image_path}")
-                return str(image_path)
+        for ext in IMAGE_EXTENSIONS:
+            for name in (clean_name, temp_name):
+                image_path = lookup(search_dir, f"{name}{ext}")
+                if image_path:
+                    print(f"  找到封面: {image_path}")
+                    return image_path
     
     print(f"  未找到封面图片 (查找名称: {clean_name})")
     return None
@@ -304,9 +515,7 @@ def find_story_file(original_path: str) -> Optional[str]:
     audio_dir = Path(original_path).parent
     
     # 清理名称：去除括号内容和常见后缀
-    clean_name = re.sub(r'[（(].*?[）)]', '', original_base_name).strip()
-    # 去除 _processed, _temp, _trimmed 等后缀
-    clean_name = re.sub(r'_(processed|temp|trimmed|录屏).*$', '', clean_name).strip()
+    clean_name = clean_asset_name(original_base_name)
     
     # 查找目录列表：优先项目根目录，然后当前目录
     search_dirs = [
@@ -314,72 +523,94 @@ def find_story_file(original_path: str) -> Optional[str]:
         audio_dir,  # 当前目录
     ]
     
-    # 只保留存在的目录
-    search_dirs = [d for d in search_dirs if d.exists()]
-    
     # 查找 .md 文件
     for search_dir in search_dirs:
-        story_path = search_dir / f"{clean_name}.md"
-        if story_path.exists():
+        story_path = lookup(search_dir, f"{clean_name}.md")
+        if story_path:
             print(f"  找到故事文件: {story_path}")
-            return str(story_path)
+            return story_path
     
     print(f"  未找到故事文件 (查找名称: {clean_name}.md)")
     return None
 
 
-def clean_markdown_title(title: str) -> str:
-    """清理Markdown标题，去除标记符号"""
-    # 去除开头的 # 符号和空格
-    cleaned = re.sub(r'^#+\s*', '', title)
-    # 去除其他可能的Markdown格式
-    cleaned = re.sub(r'\*\*(.*?)\*\*', r'\1', cleaned)  # 去除粗体标记
-    cleaned = re.sub(r'\*(.*?)\*', r'\1', cleaned)      # 去除斜体标记
-    cleaned = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', cleaned)  # 去除链接标记
-    cleaned = re.sub(r'`(.*?)`', r'\1', cleaned)        # 去除代码标记
-    cleaned = cleaned.strip()
-    return cleaned
-
-
 def read_story_content(story_path: str) -> Tuple[str, str]:
-    """读取故事内容，返回标题和正文"""
+    """读取故事内容，返回标题和正文（解析结果缓存在 story_corpus 中）"""
     try:
-        with open(story_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        lines = content.split('\n')
-        raw_title = lines[0].strip() if lines else "未知故事"
-        # 清理标题
-        clean_title = clean_markdown_title(raw_title)
-        
-        # 提取简介（前几段）
-        intro_lines = []
-        for line in lines[1:]:
-            line = line.strip()
-            if line and not line.startswith('#'):
-                intro_lines.append(line)
-                if len(intro_lines) >= 3:  # 取前3段作为简介
-                    break
-        
-        intro = '\n'.join(intro_lines) if intro_lines else content[:500]
-        
-        return clean_title, content
+        record = load_story(story_path)
     except Exception as e:
         print(f"读取故事文件失败: {e}")
         return "未知故事", ""
+    return record.title, record.text
+
+
+# 首次写入标签时在标签后预留的空白：之后修改文稿或封面重新写标签时，只要新标签放得下，
+# 就原地覆盖标签区域，不需要移动后面几 MB 的音频数据
+TAG_PADDING_MIN = 16 * 1024
+TAG_PADDING_ALIGN = 4 * 1024  # 标签总大小按 4 KB 对齐
+
 
+@dataclass
+class TagWrite:
+    """一次标签写入的结果"""
+    old_size: int  # 写入前 ID3 标签的总字节数（没有标签时为 0）
+    new_size: int  # 写入后的总字节数（含预留空白）
+    padding: int
 
-def add_metadata(audio_path: str, cover_path: Optional[str] = None,
+    @property
+    def rewritten(self) -> bool:
+        """标签大小变化时，标签之后的全部音频数据都要移动，相当于重写整个文件"""
+        return self.new_size != self.old_size
+
+
+def tag_padding(old_size: int, budget: Optional[int] = None):
+    """返回传给 mutagen save(padding=...) 的函数
+    
+    新标签放得下时保留原来的总大小，原地覆盖；放不下（或原来没有标签）时按预算重新预留：
+    至少 TAG_PADDING_MIN，且不少于标签内容的 1/8，总大小按 TAG_PADDING_ALIGN 对齐
+    """
+    def choose(info) -> int:
+        if old_size and info.padding >= 0:
+            return info.padding
+        needed = old_size - info.padding  # 不含空白的标签大小
+        reserve = budget if budget is not None else max(TAG_PADDING_MIN, needed // 8)
+        total = -(-(needed + reserve) // TAG_PADDING_ALIGN) * TAG_PADDING_ALIGN
+        return total - needed
+    return choose
+
+
+def add_metadata(audio_path, cover_path: Optional[str] = None,
                  story_title: Optional[str] = None,
-                 story_content: Optional[str] = None):
-    """为 MP3 文件添加元数据和封面"""
+                 story_content: Optional[str] = None,
+                 optimize_cover: bool = True,
+                 chapters: Optional[ChapterMap] = None):
+    """为 MP3 文件添加元数据和封面
+    
+    Args:
+        audio_path: MP3 文件路径，或可读写、可 seek 的文件对象（如 io.BytesIO），
+            后者会在内存中直接写入标签
+        optimize_cover: 嵌入前把封面缩小并重新编码（见 cover_art.py），
+            关闭时嵌入原始图片
+        chapters: 章节（见 chapters.py），写入 CHAP/CTOC 帧，可选同步歌词 SYLT
+    
+    Returns:
+        TagWrite，保存失败时为 None。标签后预留空白（见 tag_padding），
+        再次写入时新标签放得下就只覆盖文件开头的标签区域
+    """
     print("\n正在添加元数据和封面...")
     
+    in_memory = hasattr(audio_path, 'read')
+    if in_memory:
+        audio_path.seek(0)
     try:
         audio_file = MP3(audio_path, ID3=ID3)
+        old_size = audio_file.tags.size if audio_file.tags is not None else 0
     except:
+        if in_memory:
+            audio_path.seek(0)
         audio_file = MP3(audio_path)
         audio_file.add_tags()
+        old_size = 0
     
     # 添加标题
     if story_title:
@@ -404,31 +635,22 @@ def add_metadata(audio_path: str, cover_path: Optional[str] = None,
     if cover_path:
         if os.path.exists(cover_path):
             try:
-                with open(cover_path, 'rb') as f:
-                    cover_data = f.read()
-                
-                # 确定 MIME 类型
-                ext = Path(cover_path).suffix.lower()
-                mime_types = {
-                    '.jpg': 'image/jpeg',
-                    '.jpeg': 'image/jpeg',
-                    '.png': 'image/png',
-                    '.gif': 'image/gif',
-                    '.bmp': 'image/bmp'
-                }
-                mime_type = mime_types.get(ext, 'image/jpeg')
-                
-                # 删除旧的封面（如果存在）
-                if 'APIC:' in audio_file:
-                    del audio_file['APIC:']
+                if optimize_cover:
+                    # 缩小并重新编码到字节预算内，MIME 类型按文件头识别
+                    cover_data, mime_type = prepare_cover(cover_path, cache=BuildCache())
+                else:
+                    with open(cover_path, 'rb') as f:
+                        cover_data = f.read()
+                    mime_type = detect_image_mime(cover_data) or 'image/jpeg'
                 
-                audio_file['APIC'] = APIC(
+                # 替换所有旧的封面（按帧名替换，重复写入时不会累积多份）
+                audio_file.tags.setall('APIC', [APIC(
                     encoding=3,
                     mime=mime_type,
                     type=3,  # 封面图片
                     desc='Cover',
                     data=cover_data
-                )
+                )])
                 print(f"  ✓ 添加封面: {cover_path} ({len(cover_data)/1024:.2f} KB)")
             except Exception as e:
                 print(f"  ✗ 添加封面失败: {e}")
@@ -444,40 +666,155 @@ def add_metadata(audio_path: str, cover_path: Optional[str] = None,
         # 简介（前500字符）
         intro = story_content[:500] + "..." if len(story_content) > 500 else story_content
         
-        # 删除旧的注释（如果存在）
-        if 'COMM::chi' in audio_file:
-            del audio_file['COMM::chi']
-        
-        audio_file['COMM'] = COMM(
+        # 替换旧的注释
+        audio_file.tags.setall('COMM', [COMM(
             encoding=3,
             lang='chi',
             desc='简介',
             text=intro
-        )
+        )])
         print(f"  ✓ 添加简介 ({len(intro)} 字符)")
         
-        # 全文（作为歌词/文本）
-        # 删除旧的歌词（如果存在）
-        if 'USLT::chi' in audio_file:
-            del audio_file['USLT::chi']
-        
-        audio_file['USLT'] = USLT(
+        # 全文（作为歌词/文本），替换旧的歌词
+        audio_file.tags.setall('USLT', [USLT(
             encoding=3,
             lang='chi',
             desc='全文',
             text=story_content
-        )
+        )])
         print(f"  ✓ 添加全文 ({len(story_content)} 字符)")
     else:
         print("  ⚠ 未提供故事内容")
     
+    # 章节
+    if chapters is not None:
+        write_chapter_frames(audio_file.tags, chapters)
+        synced = "，含同步歌词" if chapters.sylt else ""
+        print(f"  ✓ 添加章节 ({len(chapters.chapters)} 章{synced})")
+    
+    sizes = []  # (不含空白的标签大小, 空白)
+    choose_padding = tag_padding(old_size)
+    
+    def padding(info) -> int:
+        sizes.append((old_size - info.padding, choose_padding(info)))
+        return sizes[-1][1]
+    
     try:
-        audio_file.save()
-        print("✓ 元数据添加完成\n")
+        if in_memory:
+            audio_path.seek(0)
+            audio_file.save(audio_path, padding=padding)
+        else:
+            audio_file.save(padding=padding)
     except Exception as e:
         print(f"✗ 保存元数据失败: {e}")
         import traceback
         traceback.print_exc()
+        return None
+    
+    needed, reserved = sizes[-1]
+    result = TagWrite(old_size=old_size, new_size=needed + reserved, padding=reserved)
+    if not old_size:
+        print(f"✓ 元数据添加完成（标签 {result.new_size/1024:.0f} KB，"
+              f"预留 {reserved/1024:.0f} KB）\n")
+    elif result.rewritten:
+        print(f"✓ 元数据添加完成（标签从 {old_size/1024:.0f} KB 变为 {result.new_size/1024:.0f} KB，"
+              f"音频数据整体移动）\n")
+    else:
+        print(f"✓ 元数据添加完成（原地更新，剩余空白 {reserved/1024:.1f} KB）\n")
+    return result
+
+
+def _rendition_key(key: str, rendition: Rendition) -> str:
+    """其他版本的缓存键：在 MP3 的键上加入该版本的编码参数"""
+    return make_key(key, repr(rendition))
+
+
+def _optional_file_hash(path: Optional[str]) -> Optional[str]:
+    """文件存在时返回内容哈希，否则返回 None"""
+    if path and os.path.exists(path):
+        return file_hash(path)
+    return None
+
+
+def cache_keys(video_path: str, cover_path: Optional[str], story_path: Optional[str],
+               min_start_padding: float, min_end_padding: float, fade_in_duration: float,
+               single_pass: bool, edges_only: bool, target_lufs: Optional[float],
+               chapters: bool = False, sylt: bool = False) -> Tuple[str, str, str]:
+    """构建缓存的 (分析, 编码, 最终文件) 三个键
+    
+    编码结果只取决于录屏和处理参数，最终文件还取决于封面和故事
+    """
+    recording_hash = file_hash(video_path)
+    analysis_key = make_key(PIPELINE_VERSION, 'analysis', recording_hash,
+                            min_start_padding, min_end_padding, edges_only)
+    # 生成章节时裁剪量来自整段分析，最终文件也包含章节；只在开启时加入键中，
+    # 不影响已有的缓存
+    encode_extra = ('chapters',) if chapters else ()
+    final_extra = ('chapters', sylt, load_catalog_rate()) if chapters else ()
+    encode_key = make_key(PIPELINE_VERSION, 'encode', recording_hash,
+                          min_start_padding, min_end_padding, fade_in_duration,
+                          single_pass, edges_only, target_lufs, *encode_extra)
+    final_key = make_key(PIPELINE_VERSION, 'final', encode_key,
+                         _optional_file_hash(cover_path),
+                         _optional_file_hash(story_path),
+                         COVER_MAX_DIMENSION, COVER_MAX_BYTES, *final_extra)
+    return analysis_key, encode_key, final_key
+
+
+def trims_from_report(report: AnalysisReport, min_start_padding: float, min_end_padding: float,
+                      target_lufs: Optional[float] = None,
+                      label: str = '分析报告') -> Tuple[float, float, float, float]:
+    """由分析报告计算裁剪量和响度增益，返回 (start_trim, end_trim, total_duration, gain_db)"""
+    total_duration = report.duration
+    start_trim, end_trim = compute_trims(report.silence.silence_starts,
+                                         report.silence.silence_ends,
+                                         total_duration,
+                                         min_start_padding, min_end_padding)
+    print(f"  ✓ {label} (开头: {start_trim:.2f}秒, 结尾: {end_trim:.2f}秒)")
+    gain_db = 0.0
+    if target_lufs is not None:
+        if report.integrated_lufs is None:
+            print("  ⚠ 未能测量响度，跳过响度标准化")
+        else:
+            gain_db = report.normalization_gain(target_lufs)
+            print(f"  综合响度 {report.integrated_lufs:.1f} LUFS，"
+                  f"增益 {gain_db:+.2f} dB (目标 {target_lufs:.1f} LUFS)")
+    return start_trim, end_trim, total_duration, gain_db
+
+
+def plan_chapters(video_path: str, report_path: str, story_content: str,
+                  min_start_padding: float = 0.5, min_end_padding: float = 0.5,
+                  sylt: bool = False) -> Optional[ChapterMap]:
+    """读取录屏的分析报告（没有时分析一次并保存），生成输出音频中的章节"""
+    report = load_report(video_path, report_path)
+    if report is None:
+        if not NUMPY_AVAILABLE:
+            print("  ⚠ 生成章节需要安装 numpy，跳过章节")
+            return None
+        print("正在分析停顿...")
+        try:
+            report = analyze_recording(video_path)
+            report.save(report_path)
+        except subprocess.CalledProcessError as e:
+            print(f"  ⚠ 停顿分析失败，跳过章节: {e}")
+            return None
+    silence = report.silence
+    start_trim, end_trim = compute_trims(silence.silence_starts, silence.silence_ends,
+                                         report.duration, min_start_padding, min_end_padding)
+    chapter_map = build_chapter_map(story_content, silence.silence_starts, silence.silence_ends,
+                                    report.duration, start_trim, end_trim, sylt=sylt)
+    if chapter_map is None:
+        print("  ⚠ 故事没有正文段落，跳过章节")
+        return None
+    print("生成章节:")
+    print_chapter_map(chapter_map)
+    return chapter_map
+
+
+def default_output_path(video_path: str) -> Path:
+    """未指定输出路径时，输出到录屏文件旁边的 `<文件名>_processed.mp3`"""
+    video_path = Path(video_path).resolve()
+    return video_path.parent / f"{video_path.stem}_processed.mp3"
 
 
 def process_video(video_path: str, output_path: Optional[str] = None,
@@ -485,7 +822,17 @@ def process_video(video_path: str, output_path: Optional[str] = None,
                   story_path: Optional[str] = None,
                   min_start_padding: float = 0.5,
                   min_end_padding: float = 0.5,
-                  fade_in_duration: float = 0.2):
+                  fade_in_duration: float = 0.2,
+                  single_pass: bool = True,
+                  edges_only: bool = True,
+                  scratch_dir: Optional[str] = None,
+                  cache: Optional[BuildCache] = None,
+                  streaming: bool = True,
+                  target_lufs: Optional[float] = None,
+                  renditions: Optional[Sequence[str]] = None,
+                  tracer: Optional[Tracer] = None,
+                  chapters: bool = False,
+                  sylt: bool = False):
     """处理录屏文件的完整流程
     
     Args:
@@ -496,7 +843,27 @@ def process_video(video_path: str, output_path: Optional[str] = None,
         min_start_padding: 开头最小保留时长（秒），默认0.5秒
         min_end_padding: 结尾最小保留时长（秒），默认0.5秒
         fade_in_duration: 淡入时长（秒），默认0.2秒
+        single_pass: 是否直接分析源文件并一次编码完成裁剪和淡入，默认开启；
+            关闭时按 提取 -> 裁剪 -> 淡入 分三次编码
+        edges_only: 静音检测只解码开头和结尾的窗口，默认开启；关闭时解码整段音频
+        scratch_dir: 临时文件目录（可选），默认为环境变量 WUWUNV_SCRATCH_DIR，
+            都未设置时与录屏文件同目录
+        cache: 构建缓存（可选），录屏、封面、故事和参数都未变化时直接复用结果
+        streaming: 单次编码时把编码结果输出到管道，在内存中写入标签，
+            最后一次性原子写入输出路径，不产生任何临时文件，默认开启
+        target_lufs: 响度标准化目标（LUFS，如 -16），默认不调整。单次编码时有效，
+            分析报告保存为输出文件旁的 `.analysis.json`，录屏未变化时不再重复解码
+        renditions: 输出版本名列表（见 renditions.py），如 ['mp3', 'opus', 'aac']，
+            默认只输出 MP3。各版本由同一次解码编码，写入相同的标签，与 MP3 同名不同扩展名
+        tracer: 记录各步骤的耗时和资源占用（可选，见 tracing.py）
+        chapters: 按停顿把故事段落对齐到音频，写入 ID3 章节（见 chapters.py）。
+            需要整段的静音区间，单次编码时与响度一起在分析步骤中得到，不会额外解码
+        sylt: 同时写入每段一条的同步歌词（SYLT），需要 chapters
     """
+    import io
+    import shutil
+    import tempfile
+    
     if not check_ffmpeg():
         return False
     
@@ -507,69 +874,249 @@ def process_video(video_path: str, output_path: Optional[str] = None,
     
     # 确定输出路径
     if output_path is None:
-        output_path = video_path.parent / f"{video_path.stem}_processed.mp3"
+        output_path = default_output_path(str(video_path))
     else:
         output_path = Path(output_path).resolve()
     
-    # 临时文件
-    temp_audio = video_path.parent / f"{video_path.stem}_temp.mp3"
-    temp_trimmed = video_path.parent / f"{video_path.stem}_trimmed.mp3"
-    temp_with_fade = video_path.parent / f"{video_path.stem}_with_fade.mp3"
+    # 临时文件（流式模式下不会用到）
+    scratch_dir = scratch_dir or default_scratch_dir()
+    temp_dir = Path(scratch_dir) if scratch_dir else video_path.parent
+    temp_audio = temp_dir / f"{video_path.stem}_temp.mp3"
+    temp_trimmed = temp_dir / f"{video_path.stem}_trimmed.mp3"
+    temp_with_fade = temp_dir / f"{video_path.stem}_with_fade.mp3"
+    streaming = streaming and single_pass
+    extras = [RENDITIONS[name] for name in (renditions or DEFAULT_RENDITIONS) if name != 'mp3']
+    if extras and not single_pass:
+        print("⚠ 多版本输出需要单次编码，本次只输出 MP3")
+        extras = []
+    extra_partials = {}  # 版本名 -> 输出目录中的临时文件，标签写完后原子重命名
+    for r in extras:
+        fd, partial = tempfile.mkstemp(dir=output_path.parent,
+                                       prefix=f".{output_path.stem}-", suffix=r.suffix + '.partial')
+        os.close(fd)
+        extra_partials[r.name] = partial
+    report_path = report_path_for(str(output_path))
     
     try:
-        # 1. 提取音频
-        if not extract_audio(str(video_path), str(temp_audio)):
-            return False
+        with span(tracer, 'find_assets'):
+            # 1. 查找封面 - 使用原始文件路径
+            print("\n查找封面图片...")
+            if cover_path is None:
+                cover_path = find_cover_image(str(video_path))  # 使用原始视频文件路径
+            else:
+                print(f"  使用指定的封面: {cover_path}")
         
-        # 2. 检测静音
-        start_trim, end_trim = detect_silence(str(temp_audio), 
-                                             min_start_padding=min_start_padding,
-                                             min_end_padding=min_end_padding)
+            # 2. 查找故事文件 - 使用原始文件路径
+            print("\n查找故事文件...")
+            if story_path is None:
+                story_path = find_story_file(str(video_path))  # 使用原始视频文件路径
+            else:
+                print(f"  使用指定的故事文件: {story_path}")
         
-        # 3. 去除空白
-        if not trim_audio(str(temp_audio), str(temp_trimmed), start_trim, end_trim):
-            return False
+            story_title = None
+            story_content = None
+            if story_path and os.path.exists(story_path):
+                print(f"  读取故事内容...")
+                story_title, story_content = read_story_content(story_path)
+                print(f"  ✓ 标题: {story_title}")  # 这里会显示清理后的标题
+                print(f"  ✓ 内容长度: {len(story_content)} 字符")
+            else:
+                print("  ⚠ 未找到故事文件")
         
-        # 4. 应用淡入效果
-        if not apply_fade_in_effect(str(temp_trimmed), str(temp_with_fade), fade_in_duration):
-            print("警告: 淡入效果应用失败，跳过此步骤")
-            # 如果淡入失败，直接使用修剪后的音频
-            temp_with_fade = temp_trimmed
-        else:
-            # 如果成功应用了淡入效果，删除修剪后的临时文件
-            if temp_trimmed.exists() and temp_trimmed != temp_with_fade:
-                temp_trimmed.unlink()
+        # 3. 查询缓存：编码结果只取决于录屏和处理参数，最终文件还取决于封面和故事
+        cached_encode = None
+        analysis_key = encode_key = final_key = None
+        if cache is not None:
+            print("\n检查构建缓存...")
+            with span(tracer, 'cache_lookup'):
+                analysis_key, encode_key, final_key = cache_keys(
+                    str(video_path), cover_path, story_path, min_start_padding,
+                    min_end_padding, fade_in_duration, single_pass, edges_only,
+                    target_lufs, chapters, sylt)
+                cached_final = cache.read_bytes('final', final_key, '.mp3')
+                cached_final_extras = {r.name: cache.read_bytes('final',
+                                                                _rendition_key(final_key, r),
+                                                                r.suffix) for r in extras}
+                if cached_final is not None and \
+                        all(v is not None for v in cached_final_extras.values()):
+                    publish_bytes(cached_final, str(output_path))
+                    for r in extras:
+                        publish_bytes(cached_final_extras[r.name],
+                                      str(rendition_path(str(output_path), r)))
+                    print(f"  ✓ 命中缓存，录屏、封面和故事均未变化")
+                    print(f"\n✓ 处理完成: {output_path}")
+                    return True
+                cached_encode = cache.get_file('encode', encode_key, '.mp3')
+                cached_extras = {r.name: cache.get_file('encode', _rendition_key(encode_key, r),
+                                                        r.suffix) for r in extras}
+                if not all(cached_extras.values()):
+                    cached_encode = None  # 有版本未缓存时全部重新编码，仍然只解码一次
         
-        # 5. 查找封面和故事文件 - 使用原始文件路径
-        print("\n查找封面图片...")
-        if cover_path is None:
-            cover_path = find_cover_image(str(video_path))  # 使用原始视频文件路径
-        else:
-            print(f"  使用指定的封面: {cover_path}")
+        encoded = None  # 流式模式下内存中的 MP3 数据
+        if cached_encode:
+            # 4. 只有封面或故事变化，复用已编码的音频，只需重新写入元数据
+            with span(tracer, 'cache_restore'):
+                try:
+                    if streaming:
+                        encoded = cached_encode.read_bytes()
+                    else:
+                        shutil.copyfile(str(cached_encode), str(temp_with_fade))
+                    for r in extras:
+                        shutil.copyfile(str(cached_extras[r.name]), extra_partials[r.name])
+                    print("  ✓ 命中编码缓存，跳过音频编码")
+                except FileNotFoundError:
+                    # 查找之后被其他进程淘汰，当作未命中
+                    print("  ⚠ 编码缓存已被淘汰，重新编码")
+                    cached_encode = None
+                    encoded = None
+        if not cached_encode and single_pass:
+            # 4. 直接分析源文件，再一次编码完成裁剪、响度调整、淡入和重采样
+            with span(tracer, 'analyze'):
+                gain_db = 0.0
+                report = load_report(str(video_path), str(report_path))
+                if report is None and (target_lufs is not None or not edges_only or chapters) \
+                        and NUMPY_AVAILABLE:
+                    # 需要整段解码时一次得到静音、时长和响度，并保存报告供之后复用
+                    print("正在分析静音和响度...")
+                    try:
+                        report = analyze_recording(str(video_path))
+                        report.save(str(report_path))
+                    except subprocess.CalledProcessError as e:
+                        print(f"✗ 音频分析失败: {e}")
+                        return False
+                if report is not None:
+                    start_trim, end_trim, total_duration, gain_db = trims_from_report(
+                        report, min_start_padding, min_end_padding, target_lufs,
+                        label=f"分析报告: {report_path.name}")
+                else:
+                    if target_lufs is not None:
+                        print("  ⚠ 响度测量需要安装 numpy，跳过响度标准化")
+                    analysis = cache.get_json('analysis', analysis_key) \
+                        if cache is not None else None
+                    if analysis:
+                        start_trim = analysis['start_trim']
+                        end_trim = analysis['end_trim']
+                        total_duration = analysis['total_duration']
+                        print(f"  ✓ 命中分析缓存 (开头: {start_trim:.2f}秒, "
+                              f"结尾: {end_trim:.2f}秒)")
+                    else:
+                        start_trim, end_trim, total_duration = analyze_trims(
+                            str(video_path),
+                            min_start_padding=min_start_padding,
+                            min_end_padding=min_end_padding,
+                            edges_only=edges_only)
+                        if cache is not None and total_duration > 0:
+                            cache.put_json('analysis', analysis_key, {
+                                'start_trim': start_trim,
+                                'end_trim': end_trim,
+                                'total_duration': total_duration,
+                            })
+            with span(tracer, 'encode', renditions=1 + len(extras), streaming=streaming):
+                if extras:
+                    # 一次解码、一个滤镜图同时输出所有版本
+                    mp3_target = 'pipe:1' if streaming else str(temp_with_fade)
+                    targets = [(RENDITIONS['mp3'], mp3_target)]
+                    targets += [(r, extra_partials[r.name]) for r in extras]
+                    encoded = encode_renditions(str(video_path), targets, start_trim, end_trim,
+                                                total_duration, fade_in_duration, gain_db)
+                    if encoded is None:
+                        return False
+                elif streaming:
+                    encoded = encode_to_memory(str(video_path), start_trim, end_trim,
+                                               total_duration, fade_in_duration, gain_db)
+                    if encoded is None:
+                        return False
+                elif not encode_single_pass(str(video_path), str(temp_with_fade),
+                                            start_trim, end_trim, total_duration,
+                                            fade_in_duration, gain_db):
+                    return False
+        elif not cached_encode:
+            # 4.1 提取音频
+            with span(tracer, 'extract_audio'):
+                if not extract_audio(str(video_path), str(temp_audio)):
+                    return False
         
-        # 6. 查找故事文件 - 使用原始文件路径
-        print("\n查找故事文件...")
-        if story_path is None:
-            story_path = find_story_file(str(video_path))  # 使用原始视频文件路径
-        else:
-            print(f"  使用指定的故事文件: {story_path}")
+            # 4.2 检测静音（同时得到精确时长，裁剪时无需再调用 ffprobe）
+            with span(tracer, 'detect_silence'):
+                start_trim, end_trim, total_duration = analyze_trims(
+                    str(temp_audio),
+                    min_start_padding=min_start_padding,
+                    min_end_padding=min_end_padding,
+                    edges_only=edges_only)
         
-        story_title = None
-        story_content = None
-        if story_path and os.path.exists(story_path):
-            print(f"  读取故事内容...")
-            story_title, story_content = read_story_content(story_path)
-            print(f"  ✓ 标题: {story_title}")  # 这里会显示清理后的标题
-            print(f"  ✓ 内容长度: {len(story_content)} 字符")
-        else:
-            print("  ⚠ 未找到故事文件")
+            # 4.3 去除空白
+            with span(tracer, 'trim_audio'):
+                if not trim_audio(str(temp_audio), str(temp_trimmed), start_trim, end_trim,
+                                  total_duration or None):
+                    return False
         
-        # 7. 添加元数据
-        add_metadata(str(temp_with_fade), cover_path, story_title, story_content)
+            # 4.4 应用淡入效果
+            with span(tracer, 'apply_fade_in_effect'):
+                if not apply_fade_in_effect(str(temp_trimmed), str(temp_with_fade),
+                                            fade_in_duration):
+                    print("警告: 淡入效果应用失败，跳过此步骤")
+                    # 如果淡入失败，直接使用修剪后的音频
+                    temp_with_fade = temp_trimmed
+                else:
+                    # 如果成功应用了淡入效果，删除修剪后的临时文件
+                    if temp_trimmed.exists() and temp_trimmed != temp_with_fade:
+                        temp_trimmed.unlink()
         
-        # 8. 移动到最终输出位置
-        import shutil
-        shutil.move(str(temp_with_fade), str(output_path))
+        # 章节：按分析报告中的停顿对齐故事段落（只写入 MP3）
+        chapter_map = None
+        if chapters and story_content:
+            with span(tracer, 'chapters'):
+                chapter_map = plan_chapters(str(video_path), str(report_path), story_content,
+                                            min_start_padding, min_end_padding, sylt)
+        
+        # 其他版本写入标签后与 MP3 同名发布
+        for r in extras:
+            with span(tracer, 'rendition', rendition=r.name):
+                partial = extra_partials[r.name]
+                if cache is not None and not cached_encode:
+                    cache.put_file('encode', _rendition_key(encode_key, r), partial, r.suffix)
+                tag_rendition(partial, r, cover_path, story_title, story_content)
+                if cache is not None:
+                    cache.put_file('final', _rendition_key(final_key, r), partial, r.suffix)
+                publish_file(partial, str(rendition_path(str(output_path), r)))
+                print(f"  ✓ {r.name} 版本: {rendition_path(str(output_path), r)}")
+        
+        if streaming:
+            if cache is not None and not cached_encode:
+                with span(tracer, 'cache_store'):
+                    cache.put_bytes('encode', encode_key, encoded, '.mp3')
+            
+            # 5. 在内存中添加元数据
+            with span(tracer, 'add_metadata'):
+                buffer = io.BytesIO(encoded)
+                add_metadata(buffer, cover_path, story_title, story_content,
+                             chapters=chapter_map)
+                tagged = buffer.getvalue()
+            if cache is not None:
+                with span(tracer, 'cache_store'):
+                    cache.put_bytes('final', final_key, tagged, '.mp3')
+            
+            # 6. 一次性写入最终输出位置
+            with span(tracer, 'publish'):
+                publish_bytes(tagged, str(output_path))
+            print(f"\n✓ 处理完成: {output_path}")
+            return True
+        
+        if cache is not None and not cached_encode:
+            with span(tracer, 'cache_store'):
+                cache.put_file('encode', encode_key, str(temp_with_fade), '.mp3')
+        
+        # 5. 添加元数据
+        with span(tracer, 'add_metadata'):
+            add_metadata(str(temp_with_fade), cover_path, story_title, story_content,
+                         chapters=chapter_map)
+        if cache is not None:
+            with span(tracer, 'cache_store'):
+                cache.put_file('final', final_key, str(temp_with_fade), '.mp3')
+        
+        # 6. 移动到最终输出位置
+        with span(tracer, 'publish'):
+            publish_file(str(temp_with_fade), str(output_path))
         print(f"\n✓ 处理完成: {output_path}")
         
         # 清理临时文件
@@ -585,7 +1132,8 @@ def process_video(video_path: str, output_path: Optional[str] = None,
         return False
     finally:
         # 清理临时文件
-        for temp_file in [temp_audio, temp_trimmed, temp_with_fade]:
+        for temp_file in [temp_audio, temp_trimmed, temp_with_fade] + \
+                [Path(p) for p in extra_partials.values()]:
             if temp_file.exists() and temp_file != output_path:
                 try:
                     temp_file.unlink()
@@ -593,22 +1141,276 @@ def process_video(video_path: str, output_path: Optional[str] = None,
                     pass
 
 
+RECORDING_EXTENSIONS = {'.mov', '.mp4', '.m4v', '.mkv', '.m4a', '.wav'}
+
+
+def collect_recordings(sources: List[str]) -> List[Path]:
+    """把目录或通配符展开为录屏文件列表"""
+    import glob
+    
+    recordings = []
+    for source in sources:
+        path = Path(source)
+        if path.is_dir():
+            candidates = path.iterdir()
+        else:
+            candidates = (Path(p) for p in glob.glob(source))
+        for candidate in candidates:
+            if candidate.is_file() and candidate.suffix.lower() in RECORDING_EXTENSIONS:
+                recordings.append(candidate.resolve())
+    return sorted(set(recordings))
+
+
+def batch_output_path(recording: Path, output_dir: Optional[str] = None) -> Path:
+    """批量处理时录屏的输出路径：输出目录中或录屏旁边的 `<文件名>_processed.mp3`"""
+    if output_dir:
+        return Path(output_dir).resolve() / f"{recording.stem}_processed.mp3"
+    return default_output_path(str(recording))
+
+
+def find_output_conflicts(recordings: List[Path],
+                          output_dir: Optional[str] = None) -> Dict[Path, List[Path]]:
+    """找出会写到同一个输出文件的录屏（如 foo.mov 和 foo.m4a），返回 {输出路径: 录屏列表}"""
+    by_output: Dict[Path, List[Path]] = {}
+    for recording in recordings:
+        by_output.setdefault(batch_output_path(recording, output_dir), []).append(recording)
+    return {output: group for output, group in by_output.items() if len(group) > 1}
+
+
+def batch_process(recordings: List[Path], output_dir: Optional[str] = None,
+                  jobs: Optional[int] = None, scratch_root: Optional[str] = None,
+                  hls: bool = False, tracers: Optional[List[Tracer]] = None,
+                  **options) -> Tuple[List[Path], List[Path]]:
+    """用线程池并行处理多个录屏文件
+    
+    每个任务使用独立的临时目录，互不干扰；编码工作在 ffmpeg 子进程中完成，
+    线程只负责调度。
+    
+    Args:
+        recordings: 录屏文件列表
+        output_dir: 输出目录（可选），默认与录屏文件同目录
+        jobs: 并行任务数，默认为 CPU 核心数
+        scratch_root: 各任务临时目录的上级目录，默认为 WUWUNV_SCRATCH_DIR 或系统临时目录
+        hls: 处理成功后打包 HLS 分段（见 package_hls.py）
+        tracers: 传入列表时为每个录屏记录各步骤的耗时，Tracer 会追加到这个列表中
+        **options: 传给 process_video 的其他参数
+    
+    Returns:
+        (succeeded, failed): 成功和失败的录屏文件列表。输出到同一个文件的录屏
+        （见 find_output_conflicts）不会处理，计入失败
+    """
+    import shutil
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    
+    if not check_ffmpeg():
+        return [], list(recordings)
+    
+    jobs = jobs or os.cpu_count() or 1
+    if output_dir:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    
+    def run_one(recording: Path) -> bool:
+        output_path = str(batch_output_path(recording, output_dir))
+        scratch_dir = tempfile.mkdtemp(prefix=f"{recording.stem}_",
+                                       dir=scratch_root or default_scratch_dir())
+        tracer = None
+        if tracers is not None:
+            tracer = Tracer(recording.name)
+            tracers.append(tracer)
+        try:
+            ok = process_video(str(recording), output_path,
+                               scratch_dir=scratch_dir, tracer=tracer, **options)
+            if ok and hls:
+                with span(tracer, 'package_hls'):
+                    ok = package_story(output_path) is not None
+            return ok
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+    
+    succeeded = []
+    failed = []
+    # 同时写同一个输出文件会互相覆盖，这些录屏都不处理
+    for output, group in find_output_conflicts(recordings, output_dir).items():
+        print(f"✗ {', '.join(r.name for r in group)} 都会输出到 {output.name}，"
+              f"已跳过，请重命名其中的录屏")
+        failed.extend(group)
+    
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(run_one, r): r for r in recordings if r not in failed}
+        for future in as_completed(futures):
+            recording = futures[future]
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"✗ 处理失败: {recording.name}: {e}")
+                ok = False
+            (succeeded if ok else failed).append(recording)
+    
+    return sorted(succeeded), sorted(failed)
+
+
+def add_trace_arguments(parser) -> None:
+    """耗时记录和性能分析的命令行参数（process_audio.py 和 batch_add_metadata.py 共用）"""
+    parser.add_argument('--trace-json', default=None, metavar='PATH',
+                        help='记录各步骤的耗时、CPU 时间、子进程内存和读写字节数，保存为 JSON')
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help='运行性能分析器并把结果保存到 PATH')
+    parser.add_argument('--profiler', choices=('cprofile', 'pyinstrument'), default='cprofile',
+                        help='性能分析器（默认: cprofile；pyinstrument 需另行安装，输出 HTML）')
+
+
+def batch_main(argv: List[str]):
+    """batch 子命令：并行处理目录或通配符匹配到的所有录屏文件"""
+    import argparse
+    import time
+    
+    parser = argparse.ArgumentParser(
+        prog='process_audio.py batch',
+        description='并行处理目录中的所有录屏文件')
+    parser.add_argument('sources', nargs='+', help='录屏文件目录或通配符（如 "recordings/*.mov"）')
+    parser.add_argument('--output-dir', help='输出目录（默认与录屏文件同目录）')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='并行任务数（默认: CPU 核心数）')
+    parser.add_argument('--multi-pass', action='store_true',
+                        help='使用旧的三次编码流程（提取 -> 裁剪 -> 淡入）')
+    parser.add_argument('--full-scan', action='store_true',
+                        help='静音检测解码整段音频，而不是只分析开头和结尾')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用构建缓存，总是重新处理')
+    parser.add_argument('--no-streaming', action='store_true',
+                        help='编码结果先写入临时文件再添加元数据，而不是在内存中完成')
+    parser.add_argument('--scratch-dir', default=None,
+                        help='临时文件目录（如 /dev/shm），默认读取环境变量 WUWUNV_SCRATCH_DIR')
+    parser.add_argument('--loudnorm', nargs='?', type=float, const=DEFAULT_TARGET_LUFS,
+                        default=None, metavar='LUFS',
+                        help=f'把综合响度标准化到目标值（默认 {DEFAULT_TARGET_LUFS:.0f} LUFS）')
+    parser.add_argument('--renditions', type=parse_renditions, default=list(DEFAULT_RENDITIONS),
+                        metavar='LIST',
+                        help=f'输出版本，逗号分隔（可选: {", ".join(RENDITIONS)}；默认: mp3）')
+    parser.add_argument('--hls', action='store_true',
+                        help='处理完成后打包 HLS 分段和播放列表（audio/hls/<文件名>/index.m3u8）')
+    parser.add_argument('--chapters', action='store_true',
+                        help='按停顿把故事段落对齐到音频，写入 ID3 章节')
+    parser.add_argument('--sylt', action='store_true',
+                        help='同时写入每段一条的同步歌词（SYLT），包含 --chapters')
+    add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    recordings = collect_recordings(args.sources)
+    if not recordings:
+        print("未找到录屏文件")
+        sys.exit(1)
+    
+    jobs = args.jobs or os.cpu_count() or 1
+    print(f"找到 {len(recordings)} 个录屏文件，使用 {jobs} 个并行任务")
+    
+    # 处理过程中不淘汰缓存，全部完成后淘汰一次
+    cache = None if args.no_cache else BuildCache(auto_evict=False)
+    started = time.monotonic()
+    tracers = [] if args.trace_json else None
+    with profiled(args.profile, args.profiler):
+        succeeded, failed = batch_process(recordings, args.output_dir, jobs,
+                                          single_pass=not args.multi_pass,
+                                          edges_only=not args.full_scan,
+                                          cache=cache,
+                                          streaming=not args.no_streaming,
+                                          target_lufs=args.loudnorm,
+                                          renditions=args.renditions,
+                                          scratch_root=args.scratch_dir,
+                                          hls=args.hls,
+                                          tracers=tracers,
+                                          chapters=args.chapters or args.sylt,
+                                          sylt=args.sylt)
+    elapsed = time.monotonic() - started
+    if cache is not None:
+        cache.evict()
+    
+    # 输出统计
+    print(f"\n{'='*60}")
+    print("批量处理完成！")
+    print(f"{'='*60}")
+    print(f"总计: {len(recordings)} 个文件，耗时 {elapsed:.1f} 秒")
+    print(f"成功: {len(succeeded)} 个")
+    if failed:
+        print(f"失败: {len(failed)} 个")
+        for recording in failed:
+            print(f"  - {recording}")
+    print(f"{'='*60}\n")
+    if tracers:
+        print("各步骤耗时分布:")
+        print(format_histogram(aggregate(t.to_dict() for t in tracers)))
+        save_traces(args.trace_json, tracers)
+        print(f"\n耗时记录: {args.trace_json}")
+    sys.exit(0 if not failed else 1)
+
+
 def main():
     """主函数"""
-    if len(sys.argv) < 2:
-        print("用法:")
-        print("  python scripts/process_audio.py <录屏文件> [输出文件] [封面图片] [故事文件]")
-        print("\n示例:")
-        print("  python scripts/process_audio.py screen_recording.mov")
-        print("  python scripts/process_audio.py screen_recording.mov output.mp3 cover.jpg story.md")
-        sys.exit(1)
+    import argparse
+    
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        batch_main(sys.argv[2:])
+        return
     
-    video_path = sys.argv[1]
-    output_path = sys.argv[2] if len(sys.argv) > 2 else None
-    cover_path = sys.argv[3] if len(sys.argv) > 3 else None
-    story_path = sys.argv[4] if len(sys.argv) > 4 else None
+    parser = argparse.ArgumentParser(
+        description='从录屏文件中提取音频，去除空白，嵌入封面和元数据',
+        epilog='示例:\n'
+               '  python scripts/process_audio.py screen_recording.mov\n'
+               '  python scripts/process_audio.py screen_recording.mov output.mp3 cover.jpg story.md\n'
+               '  python scripts/process_audio.py batch recordings/ --output-dir audio',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', help='录屏文件')
+    parser.add_argument('output', nargs='?', help='输出文件（可选）')
+    parser.add_argument('cover', nargs='?', help='封面图片（可选）')
+    parser.add_argument('story', nargs='?', help='故事文件（可选）')
+    parser.add_argument('--multi-pass', action='store_true',
+                        help='使用旧的三次编码流程（提取 -> 裁剪 -> 淡入）')
+    parser.add_argument('--full-scan', action='store_true',
+                        help='静音检测解码整段音频，而不是只分析开头和结尾')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用构建缓存，总是重新处理')
+    parser.add_argument('--no-streaming', action='store_true',
+                        help='编码结果先写入临时文件再添加元数据，而不是在内存中完成')
+    parser.add_argument('--scratch-dir', default=None,
+                        help='临时文件目录（如 /dev/shm），默认读取环境变量 WUWUNV_SCRATCH_DIR')
+    parser.add_argument('--loudnorm', nargs='?', type=float, const=DEFAULT_TARGET_LUFS,
+                        default=None, metavar='LUFS',
+                        help=f'把综合响度标准化到目标值（默认 {DEFAULT_TARGET_LUFS:.0f} LUFS）')
+    parser.add_argument('--renditions', type=parse_renditions, default=list(DEFAULT_RENDITIONS),
+                        metavar='LIST',
+                        help=f'输出版本，逗号分隔（可选: {", ".join(RENDITIONS)}；默认: mp3）')
+    parser.add_argument('--hls', action='store_true',
+                        help='处理完成后打包 HLS 分段和播放列表（audio/hls/<文件名>/index.m3u8）')
+    parser.add_argument('--chapters', action='store_true',
+                        help='按停顿把故事段落对齐到音频，写入 ID3 章节')
+    parser.add_argument('--sylt', action='store_true',
+                        help='同时写入每段一条的同步歌词（SYLT），包含 --chapters')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
     
-    success = process_video(video_path, output_path, cover_path, story_path)
+    tracer = Tracer(Path(args.video).name) if args.trace_json else None
+    with profiled(args.profile, args.profiler):
+        success = process_video(args.video, args.output, args.cover, args.story,
+                                single_pass=not args.multi_pass,
+                                edges_only=not args.full_scan,
+                                cache=None if args.no_cache else BuildCache(),
+                                streaming=not args.no_streaming,
+                                target_lufs=args.loudnorm,
+                                renditions=args.renditions,
+                                scratch_dir=args.scratch_dir,
+                                tracer=tracer,
+                                chapters=args.chapters or args.sylt,
+                                sylt=args.sylt)
+        if success and args.hls:
+            output = args.output or str(default_output_path(args.video))
+            with span(tracer, 'package_hls'):
+                success = package_story(output) is not None
+    if tracer is not None:
+        print("\n各步骤耗时:")
+        print(tracer.summary())
+        save_traces(args.trace_json, [tracer])
+        print(f"耗时记录: {args.trace_json}")
     sys.exit(0 if success else 1)
 
 
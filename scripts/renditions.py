@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多版本音频输出
+定义可选的输出版本（MP3 存档版、Opus 和 AAC 低码率流媒体版），
+构建一次解码、一个滤镜图、多路输出的 ffmpeg 命令，并为各容器写入相同的标签和封面
+"""
+
+import base64
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    from mutagen.flac import Picture
+    from mutagen.mp4 import MP4, MP4Cover
+    from mutagen.oggopus import OggOpus
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MUTAGEN_AVAILABLE = False
+
+from build_cache import BuildCache
+from cover_art import detect_image_mime, prepare_cover
+
+
+ARTIST = '巫巫女睡前故事'
+ALBUM = '巫巫女睡前故事集'
+GENRE = '儿童故事'
+INTRO_LENGTH = 500  # 简介截取的字符数，与 MP3 的 COMM 帧一致
+
+
+@dataclass(frozen=True)
+class Rendition:
+    """一个输出版本的编码参数"""
+    name: str
+    suffix: str
+    codec: str
+    bitrate: str
+    sample_rate: int
+    channels: Optional[int] = None  # None 表示保留滤镜输出的声道数
+    muxer: str = 'mp3'
+    extra_args: Tuple[str, ...] = ()
+
+    def output_args(self, piped: bool = False) -> List[str]:
+        """该版本在 ffmpeg 命令中的输出参数"""
+        args = ['-c:a', self.codec, '-b:a', self.bitrate, '-ar', str(self.sample_rate)]
+        if self.channels:
+            args += ['-ac', str(self.channels)]
+        args += list(self.extra_args)
+        if piped and self.muxer == 'mp3':
+            args += ['-write_xing', '0']  # 管道不能回写 Xing 头
+        return args + ['-f', self.muxer]
+
+
+RENDITIONS = {
+    # 存档版，与原来的输出完全相同
+    'mp3': Rendition('mp3', '.mp3', 'libmp3lame', '192k', 44100),
+    # 单声道朗读用 Opus 40k 已接近透明，libopus 只支持 48k 等固定采样率
+    'opus': Rendition('opus', '.opus', 'libopus', '40k', 48000, channels=1, muxer='opus',
+                      extra_args=('-vbr', 'on', '-application', 'audio')),
+    # 兼容老设备的 AAC-LC，moov 放在文件开头，边下边播
+    'aac': Rendition('aac', '.m4a', 'aac', '64k', 44100, channels=1, muxer='mp4',
+                     extra_args=('-movflags', '+faststart')),
+}
+DEFAULT_RENDITIONS = ('mp3',)
+
+
+def parse_renditions(spec: str) -> List[str]:
+    """解析逗号分隔的版本列表，MP3 总是第一个输出
+
+    Raises:
+        ValueError: 包含未知的版本名
+    """
+    names = [name.strip().lower() for name in spec.split(',') if name.strip()]
+    unknown = [name for name in names if name not in RENDITIONS]
+    if unknown:
+        raise ValueError(f"未知的输出版本: {', '.join(unknown)}（可选: {', '.join(RENDITIONS)}）")
+    return ['mp3'] + [name for name in dict.fromkeys(names) if name != 'mp3']
+
+
+def rendition_path(output_path: str, rendition: Rendition) -> Path:
+    """各版本与 MP3 同名，只有扩展名不同"""
+    return Path(output_path).with_suffix(rendition.suffix)
+
+
+def multi_output_cmd(input_path: str, audio_filter: str,
+                     targets: Sequence[Tuple[Rendition, str]]) -> List[str]:
+    """构建一次解码、共用一个滤镜链、asplit 后分别编码各版本的 ffmpeg 命令
+
+    Args:
+        audio_filter: 裁剪、增益、淡入等共用滤镜（不含重采样，由各版本自行设置采样率）
+        targets: (版本, 输出路径) 列表，输出路径可以是 'pipe:1'
+    """
+    labels = [f'[r{i}]' for i in range(len(targets))]
+    graph = f'[0:a]{audio_filter}'
+    if len(targets) > 1:
+        graph += f',asplit={len(targets)}'
+    graph += ''.join(labels)
+
+    cmd = ['ffmpeg', '-nostdin', '-y', '-i', input_path, '-filter_complex', graph]
+    for label, (rendition, path) in zip(labels, targets):
+        cmd += ['-map', label] + rendition.output_args(piped=path == 'pipe:1') + [path]
+    return cmd
+
+
+def tag_rendition(path: str, rendition: Rendition,
+                  cover_path: Optional[str] = None,
+                  story_title: Optional[str] = None,
+                  story_content: Optional[str] = None) -> None:
+    """为 Opus 或 AAC 版本写入与 MP3 相同的标题、简介、全文和封面"""
+    if not MUTAGEN_AVAILABLE:
+        print("  ⚠ 未安装 mutagen，跳过标签写入 (pip install mutagen)")
+        return
+
+    cover_data = mime = None
+    if cover_path:
+        cover_data, mime = prepare_cover(cover_path, cache=BuildCache())
+        mime = detect_image_mime(cover_data) or mime
+    intro = None
+    if story_content:
+        intro = story_content[:INTRO_LENGTH] + "..." if len(story_content) > INTRO_LENGTH \
+            else story_content
+
+    if rendition.muxer == 'opus':
+        audio = OggOpus(path)
+        tags = audio.tags
+        if story_title:
+            tags['title'] = [story_title]
+        tags['artist'] = [ARTIST]
+        tags['album'] = [ALBUM]
+        tags['genre'] = [GENRE]
+        if story_content:
+            tags['description'] = [intro]
+            tags['lyrics'] = [story_content]
+        if cover_data:
+            picture = Picture()
+            picture.type = 3  # 封面图片
+            picture.mime = mime
+            picture.desc = 'Cover'
+            picture.data = cover_data
+            tags['metadata_block_picture'] = [base64.b64encode(picture.write()).decode('ascii')]
+        audio.save()
+    elif rendition.muxer == 'mp4':
+        audio = MP4(path)
+        if audio.tags is None:
+            audio.add_tags()
+        tags = audio.tags
+        if story_title:
+            tags['\xa9nam'] = [story_title]
+        tags['\xa9ART'] = [ARTIST]
+        tags['\xa9alb'] = [ALBUM]
+        tags['\xa9gen'] = [GENRE]
+        if story_content:
+            tags['desc'] = [intro]
+            tags['\xa9lyr'] = [story_content]
+        if cover_data:
+            image_format = MP4Cover.FORMAT_PNG if mime == 'image/png' else MP4Cover.FORMAT_JPEG
+            tags['covr'] = [MP4Cover(cover_data, imageformat=image_format)]
+        audio.save()
+    else:
+        raise ValueError(f"不支持为 {rendition.name} 写入标签")
+    print(f"  ✓ 已为 {rendition.name} 版本写入标签")
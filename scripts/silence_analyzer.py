@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式静音分析
+通过 ffmpeg 管道按固定大小读取 PCM 数据，用 NumPy 向量化地查找静音区间，
+内存占用与录音长度无关，结果精确到采样点
+"""
+
+import subprocess
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+from probe_cache import probe_duration
+
+SAMPLE_RATE = 44100  # 与输出 MP3 的采样率一致，静音区间可直接用于裁剪
+CHUNK_SAMPLES = 1 << 16  # 每次从管道读取的采样数（单声道 16 位，约 128 KB）
+
+
+@dataclass
+class SilenceReport:
+    """静音分析结果，区间均以采样点为单位，左闭右开"""
+    sample_rate: int
+    total_samples: int
+    spans: List[Tuple[int, int]] = field(default_factory=list)
+    peak: float = 0.0  # 全片最大幅度（0~1）
+    rms: float = 0.0  # 全片均方根幅度（0~1）
+    edges_only: bool = False  # 只分析了开头和结尾，中间的静音区间不完整
+
+    @property
+    def duration(self) -> float:
+        return self.total_samples / self.sample_rate if self.sample_rate else 0.0
+
+    @property
+    def silence_starts(self) -> List[float]:
+        return [start / self.sample_rate for start, _ in self.spans]
+
+    @property
+    def silence_ends(self) -> List[float]:
+        return [end / self.sample_rate for _, end in self.spans]
+
+    def to_dict(self) -> dict:
+        return {
+            'sample_rate': self.sample_rate,
+            'total_samples': self.total_samples,
+            'spans': [list(span) for span in self.spans],
+            'peak': self.peak,
+            'rms': self.rms,
+            'edges_only': self.edges_only,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SilenceReport':
+        return cls(
+            sample_rate=data['sample_rate'],
+            total_samples=data['total_samples'],
+            spans=[tuple(span) for span in data.get('spans', [])],
+            peak=data.get('peak', 0.0),
+            rms=data.get('rms', 0.0),
+            edges_only=data.get('edges_only', False),
+        )
+
+
+class SilenceTracker:
+    """逐块累积静音区间
+
+    与 ffmpeg silencedetect 的判定一致：幅度低于阈值的连续采样持续超过
+    min_duration 即视为静音。跨块的静音会被正确拼接。
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE,
+                 noise_db: float = -30.0,
+                 min_duration: float = 0.5,
+                 offset: int = 0):
+        self.sample_rate = sample_rate
+        self.threshold = 10 ** (noise_db / 20) * 32768
+        self.min_samples = int(round(min_duration * sample_rate))
+        self.offset = offset  # 第一个采样点在原始音频中的位置（用于 seek 后的分析）
+        self.pos = 0
+        self.spans: List[Tuple[int, int]] = []
+        self._run_start: Optional[int] = None
+        self._peak = 0
+        self._sum_squares = 0.0
+
+    def feed(self, samples: 'np.ndarray') -> None:
+        """输入一块 int16 单声道采样"""
+        if samples.size == 0:
+            return
+        amplitude = np.abs(samples.astype(np.int32))
+        self._peak = max(self._peak, int(amplitude.max()))
+        self._sum_squares += float(np.dot(amplitude, amplitude.astype(np.float64)))
+
+        silent = amplitude < self.threshold
+        prev = np.array([self._run_start is not None], dtype=np.int8)
+        edges = np.diff(np.concatenate((prev, silent.astype(np.int8))))
+        starts = np.flatnonzero(edges == 1) + self.pos
+        ends = np.flatnonzero(edges == -1) + self.pos
+
+        # 上一块延续下来的静音
+        if self._run_start is not None and ends.size:
+            self._close(self._run_start, int(ends[0]))
+            self._run_start = None
+            ends = ends[1:]
+        # 本块末尾仍处于静音，留到下一块继续
+        if silent[-1] and starts.size:
+            self._run_start = int(starts[-1])
+            starts = starts[:-1]
+
+        if starts.size:
+            keep = (ends - starts) >= self.min_samples
+            for start, end in zip(starts[keep].tolist(), ends[keep].tolist()):
+                self.spans.append((start + self.offset, end + self.offset))
+
+        self.pos += samples.size
+
+    def _close(self, start: int, end: int) -> None:
+        if end - start >= self.min_samples:
+            self.spans.append((start + self.offset, end + self.offset))
+
+    def finish(self) -> SilenceReport:
+        """结束分析，音频末尾的静音以结尾作为静音结束点"""
+        if self._run_start is not None:
+            self._close(self._run_start, self.pos)
+            self._run_start = None
+        rms = (self._sum_squares / self.pos) ** 0.5 / 32768 if self.pos else 0.0
+        return SilenceReport(
+            sample_rate=self.sample_rate,
+            total_samples=self.offset + self.pos,
+            spans=list(self.spans),
+            peak=self._peak / 32768,
+            rms=rms,
+        )
+
+
+def pcm_decoder_cmd(audio_path: str, sample_rate: int = SAMPLE_RATE,
+                    start: Optional[float] = None,
+                    duration: Optional[float] = None) -> List[str]:
+    """构建把音频解码为单声道 16 位 PCM 并输出到管道的 ffmpeg 命令"""
+    cmd = ['ffmpeg', '-v', 'error']
+    if start is not None:
+        cmd += ['-ss', f'{start:.6f}']
+    if duration is not None:
+        cmd += ['-t', f'{duration:.6f}']
+    cmd += [
+        '-i', audio_path,
+        '-vn',
+        '-ac', '1',
+        '-ar', str(sample_rate),
+        '-f', 's16le', '-acodec', 'pcm_s16le',
+        'pipe:1'
+    ]
+    return cmd
+
+
+def analyze_silence(audio_path: str,
+                    noise_db: float = -30.0,
+                    min_duration: float = 0.5,
+                    sample_rate: int = SAMPLE_RATE) -> SilenceReport:
+    """解码整段音频并返回静音区间和总时长
+
+    Raises:
+        RuntimeError: 未安装 NumPy
+        subprocess.CalledProcessError: ffmpeg 解码失败
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("需要安装 numpy 库: pip install numpy")
+
+    tracker = SilenceTracker(sample_rate, noise_db, min_duration)
+    cmd = pcm_decoder_cmd(audio_path, sample_rate)
+    _decode_into(cmd, tracker)
+    return tracker.finish()
+
+
+def _analyze_window(audio_path: str, start: float, duration: Optional[float],
+                    noise_db: float, min_duration: float,
+                    sample_rate: int) -> SilenceReport:
+    """只解码 [start, start + duration) 这一段，区间位置换算到整段音频上"""
+    offset = int(round(start * sample_rate))
+    tracker = SilenceTracker(sample_rate, noise_db, min_duration, offset=offset)
+    cmd = pcm_decoder_cmd(audio_path, sample_rate,
+                          start=start if start > 0 else None,
+                          duration=duration)
+    _decode_into(cmd, tracker)
+    return tracker.finish()
+
+
+def analyze_edges(audio_path: str,
+                  total_duration: Optional[float] = None,
+                  window: float = 8.0,
+                  noise_db: float = -30.0,
+                  min_duration: float = 0.5,
+                  sample_rate: int = SAMPLE_RATE) -> SilenceReport:
+    """只解码开头和结尾的一小段来查找首尾静音
+
+    开头窗口里第一段静音一直延续到窗口末尾、或结尾窗口里最后一段静音从窗口
+    起点就开始时，静音的真实边界在窗口之外，窗口会加倍后重新分析。窗口覆盖
+    超过一半时长时直接退回到整段分析。结果中只包含首尾的静音区间，
+    但对 compute_trims 而言与整段分析等价。
+
+    Args:
+        total_duration: 音频时长（秒），未提供时从媒体信息缓存读取（见 probe_cache.py）
+        window: 初始窗口长度（秒），需大于结尾判定用的 2 秒
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("需要安装 numpy 库: pip install numpy")
+
+    if total_duration is None:
+        total_duration = probe_duration(audio_path)
+
+    # 开头窗口
+    head_window = window
+    while True:
+        if head_window * 2 >= total_duration:
+            return analyze_silence(audio_path, noise_db, min_duration, sample_rate)
+        head = _analyze_window(audio_path, 0.0, head_window,
+                               noise_db, min_duration, sample_rate)
+        first = head.spans[0] if head.spans else None
+        # 只有从 1 秒内开始的第一段静音会影响开头裁剪，它被窗口截断时才需要加宽
+        if first is None or first[0] >= sample_rate or first[1] < head.total_samples:
+            break
+        head_window *= 2
+
+    # 结尾窗口
+    tail_window = window
+    while True:
+        if head_window + tail_window >= total_duration:
+            return analyze_silence(audio_path, noise_db, min_duration, sample_rate)
+        tail_start = total_duration - tail_window
+        tail = _analyze_window(audio_path, tail_start, None,
+                               noise_db, min_duration, sample_rate)
+        tail_offset = int(round(tail_start * sample_rate))
+        if tail.total_samples > tail_offset and (
+                not tail.spans or tail.spans[-1][0] > tail_offset):
+            break
+        tail_window *= 2
+
+    return SilenceReport(
+        sample_rate=sample_rate,
+        total_samples=tail.total_samples,
+        spans=head.spans + tail.spans,
+        peak=max(head.peak, tail.peak),
+        rms=0.0,  # 只分析了首尾，整体均方根无意义
+        edges_only=True,
+    )
+
+
+def _decode_into(cmd: List[str], tracker: SilenceTracker) -> str:
+    """运行解码命令，把管道中的 PCM 分块送入 tracker，返回 ffmpeg 的 stderr 输出
+
+    stderr 在后台线程中读取，ffmpeg 输出大量日志时也不会因管道写满而阻塞
+    """
+    chunk_bytes = CHUNK_SAMPLES * 2
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr_chunks: List[bytes] = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.extend(iter(proc.stderr.readline, b'')),
+                                     daemon=True)
+    stderr_reader.start()
+    leftover = b''
+    try:
+        while True:
+            data = proc.stdout.read(chunk_bytes)
+            if not data:
+                break
+            data = leftover + data
+            usable = len(data) - len(data) % 2
+            leftover = data[usable:]
+            tracker.feed(np.frombuffer(data[:usable], dtype='<i2'))
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+        stderr_reader.join()
+        proc.stderr.close()
+    stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    return stderr
+
+
+def main():
+    """主函数"""
+    if len(sys.argv) < 2:
+        print("用法:")
+        print("  python scripts/silence_analyzer.py <音频或录屏文件> [--edges]")
+        sys.exit(1)
+
+    if len(sys.argv) > 2 and sys.argv[2] == '--edges':
+        report = analyze_edges(sys.argv[1])
+    else:
+        report = analyze_silence(sys.argv[1])
+    print(f"总时长: {report.duration:.3f} 秒 ({report.total_samples} 采样点)")
+    print(f"峰值: {report.peak:.4f}  均方根: {report.rms:.4f}")
+    for start, end in report.spans:
+        print(f"  静音 {start / report.sample_rate:.3f} - {end / report.sample_rate:.3f} 秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+故事文稿解析缓存
+每个 .md 文稿只解析一次：标题（去掉 Markdown 标记）、简介段落、全文、字数和正文哈希
+保存在缓存目录下的 SQLite 数据库中，以 (路径, 大小, 修改时间) 为键。
+修改时间变了但正文哈希不变时（例如重新检出）直接沿用旧记录，不再重新解析
+
+process_audio.read_story_content、目录和 RSS 生成、标签校验都从这里读取文稿
+
+用法：
+    python scripts/story_corpus.py                      # 项目根目录下的全部故事文稿
+    python scripts/story_corpus.py 01-巫巫女的心变了.md [...]
+    python scripts/story_corpus.py --prune              # 删除已不存在的文件的记录
+"""
+
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from build_cache import default_cache_dir
+
+
+STORY_VERSION = 1  # 记录格式或解析规则变化时加一，旧记录全部作废
+DB_NAME = 'stories.sqlite'
+INTRO_PARAGRAPHS = 3  # 取正文前几段作为简介
+INTRO_FALLBACK_CHARS = 500  # 没有正文段落时，简介取全文开头的字数
+
+_HEADING_MARK = re.compile(r'^#+\s*')
+_BOLD = re.compile(r'\*\*(.*?)\*\*')
+_ITALIC = re.compile(r'\*(.*?)\*')
+_LINK = re.compile(r'\[(.*?)\]\(.*?\)')
+_CODE = re.compile(r'`(.*?)`')
+
+
+def clean_markdown_title(title: str) -> str:
+    """清理Markdown标题，去除标记符号"""
+    cleaned = _HEADING_MARK.sub('', title)
+    cleaned = _BOLD.sub(r'\1', cleaned)
+    cleaned = _ITALIC.sub(r'\1', cleaned)
+    cleaned = _LINK.sub(r'\1', cleaned)
+    cleaned = _CODE.sub(r'\1', cleaned)
+    return cleaned.strip()
+
+
+@dataclass
+class StoryRecord:
+    """一篇文稿的解析结果"""
+    path: str
+    size: int = 0
+    mtime_ns: int = 0
+    sha256: str = ''  # 正文按 UTF-8 编码后的哈希，与 MP3 中全文帧的哈希可以直接比较
+    title: str = ''
+    intro: List[str] = field(default_factory=list)  # 标题之后的前几个非标题段落
+    text: str = ''
+    chars: int = 0
+
+    @property
+    def intro_text(self) -> str:
+        """简介文本，没有正文段落时取全文开头"""
+        return '\n'.join(self.intro) if self.intro else self.text[:INTRO_FALLBACK_CHARS]
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def parse_story(path: str, text: str) -> StoryRecord:
+    """解析文稿内容，只扫描到取够简介为止"""
+    lines = io.StringIO(text)
+    title = clean_markdown_title(lines.readline().strip())
+    intro = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            intro.append(line)
+            if len(intro) >= INTRO_PARAGRAPHS:
+                break
+    return StoryRecord(path=path, sha256=_sha256(text), title=title, intro=intro,
+                       text=text, chars=len(text))
+
+
+def _read_text(path: str) -> str:
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+class StoryCorpus:
+    """SQLite 中的文稿解析缓存，可在多个线程中共用
+
+    stats 记录命中、未命中（重新解析）的次数
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        directory = Path(root) if root else default_cache_dir()
+        self.path = directory / DB_NAME
+        self.stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._db = self._open(str(self.path))
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠ 无法打开文稿缓存 {self.path}: {e}，本次只在内存中缓存")
+            self._db = self._open(':memory:')
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        if db.execute('PRAGMA user_version').fetchone()[0] != STORY_VERSION:
+            db.execute('DROP TABLE IF EXISTS stories')
+            db.execute(f'PRAGMA user_version = {STORY_VERSION}')
+        if path != ':memory:':
+            db.execute('PRAGMA journal_mode = WAL')  # 多个进程同时读写
+        db.execute('CREATE TABLE IF NOT EXISTS stories ('
+                   'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+                   'sha256 TEXT, record TEXT)')
+        db.commit()
+        return db
+
+    def _load(self, path: str) -> Optional[StoryRecord]:
+        with self._lock:
+            row = self._db.execute('SELECT record FROM stories WHERE path = ?', (path,)).fetchone()
+        return StoryRecord(**json.loads(row[0])) if row else None
+
+    def _store(self, record: StoryRecord) -> None:
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO stories VALUES (?, ?, ?, ?, ?)',
+                             (record.path, record.size, record.mtime_ns, record.sha256,
+                              json.dumps(asdict(record), ensure_ascii=False)))
+            self._db.commit()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def load(self, path: str) -> StoryRecord:
+        """返回文稿的解析结果，缓存中没有或文稿已变化时重新解析
+
+        读取失败时抛出 OSError，不是 UTF-8 编码时抛出 UnicodeDecodeError
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        record = self._load(path)
+        if record is not None and (record.size, record.mtime_ns) == (st.st_size, st.st_mtime_ns):
+            self._count('hits')
+            return record
+
+        text = _read_text(path)
+        if record is not None and record.sha256 == _sha256(text):
+            self._count('hits')
+        else:
+            self._count('misses')
+            record = parse_story(path, text)
+        record.size, record.mtime_ns = st.st_size, st.st_mtime_ns
+        self._store(record)
+        return record
+
+    def load_many(self, paths: Iterable[str], jobs: Optional[int] = None) -> Dict[str, StoryRecord]:
+        """并行读取多篇文稿，返回 {传入的路径: StoryRecord}"""
+        paths = [str(p) for p in paths]
+        jobs = jobs or min(32, (os.cpu_count() or 1) * 2)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            return dict(zip(paths, executor.map(self.load, paths)))
+
+    def prune(self) -> int:
+        """删除已不存在的文件的记录，返回删除的条数"""
+        with self._lock:
+            paths = [row[0] for row in self._db.execute('SELECT path FROM stories')]
+            missing = [(p,) for p in paths if not os.path.exists(p)]
+            self._db.executemany('DELETE FROM stories WHERE path = ?', missing)
+            self._db.commit()
+        return len(missing)
+
+
+_default_corpus: Optional[StoryCorpus] = None
+_default_lock = threading.Lock()
+
+
+def default_story_corpus() -> StoryCorpus:
+    """进程内共用的缓存实例"""
+    global _default_corpus
+    with _default_lock:
+        if _default_corpus is None:
+            _default_corpus = StoryCorpus()
+        return _default_corpus
+
+
+def load_story(path: str) -> StoryRecord:
+    """用共用的缓存读取文稿，见 StoryCorpus.load"""
+    return default_story_corpus().load(path)
+
+
+def load_stories(paths: Iterable[str], jobs: Optional[int] = None) -> Dict[str, StoryRecord]:
+    return default_story_corpus().load_many(paths, jobs)
+
+
+def main():
+    """主函数"""
+    import argparse
+    from asset_index import build_asset_index
+
+    parser = argparse.ArgumentParser(description='解析并缓存故事文稿')
+    parser.add_argument('paths', nargs='*', help='文稿路径（默认: 项目根目录下的全部故事文稿）')
+    parser.add_argument('--prune', action='store_true', help='删除已不存在的文件的记录')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出（不含全文）')
+    args = parser.parse_args()
+
+    corpus = default_story_corpus()
+    if args.prune:
+        print(f"已删除 {corpus.prune()} 条记录")
+        if not args.paths:
+            return
+
+    paths = args.paths or [e.story for e in build_asset_index().values() if e.story]
+    try:
+        records = corpus.load_many(paths)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    if args.json:
+        summaries = [{k: v for k, v in asdict(r).items() if k != 'text'} for r in records.values()]
+        print(json.dumps(summaries, ensure_ascii=False, indent=2))
+    else:
+        for path, record in records.items():
+            intro = record.intro[0] if record.intro else ''
+            if len(intro) > 40:
+                intro = intro[:40] + '…'
+            print(f"✓ {Path(path).name}: {record.title}  {record.chars} 字符  {intro}")
+    stats = corpus.stats
+    print(f"\n缓存命中 {stats['hits']} 个，重新解析 {stats['misses']} 个")
+
+
+if __name__ == '__main__':
+    main()
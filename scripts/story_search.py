@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+故事全文检索
+用 read_story_content 解析项目根目录下的故事文稿和设定文档，中文按相邻两字（bigram）
+和单字切分，英文和数字按词切分，建立带位置信息的倒排索引并保存到 .cache/story_index.json。
+文稿按修改时间和内容哈希增量更新，查询时只读取索引，不再逐个打开文稿
+
+用法：
+    python scripts/story_search.py 月光
+    python scripts/story_search.py 莉莉 欣欣 --limit 5
+    python scripts/story_search.py --rebuild --stats
+"""
+
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from asset_index import project_root
+from build_cache import default_cache_dir
+from process_audio import read_story_content
+
+
+INDEX_VERSION = 1
+INDEX_NAME = 'story_index.json'
+SNIPPET_CONTEXT = 24  # 摘要中命中位置前后保留的字符数
+TITLE_BOOST = 2.0  # 标题中的命中按此倍数计分
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (0x3400 <= code <= 0x9FFF or 0xF900 <= code <= 0xFAFF
+            or 0x3040 <= code <= 0x30FF or 0x20000 <= code <= 0x2FFFF)
+
+
+def _runs(text: str) -> List[Tuple[bool, int, int]]:
+    """切分为连续的中文串或英文数字词：[(是否中文, 起点, 终点)]，标点和空白只起分隔作用"""
+    runs = []
+    start = None
+    cjk = False
+    for i, ch in enumerate(text + ' '):
+        ch_cjk = _is_cjk(ch)
+        ch_word = ch_cjk or (ch.isascii() and ch.isalnum())
+        if start is not None and (not ch_word or ch_cjk != cjk):
+            runs.append((cjk, start, i))
+            start = None
+        if ch_word and start is None:
+            start, cjk = i, ch_cjk
+    return runs
+
+
+def tokenize(text: str) -> List[Tuple[str, int]]:
+    """切分为 (词元, 字符位置) 列表
+
+    中文串输出每个单字和每对相邻两字，英文字母和数字组成的词转为小写。
+    位置是词元第一个字符在原文中的下标
+    """
+    tokens = []
+    for cjk, start, end in _runs(text):
+        if not cjk:
+            tokens.append((text[start:end].lower(), start))
+            continue
+        for i in range(start, end):
+            tokens.append((text[i], i))
+            if i + 1 < end:
+                tokens.append((text[i:i + 2], i))
+    return tokens
+
+
+def _query_phrases(query: str) -> List[Tuple[List[Tuple[str, int]], int]]:
+    """把查询词切成短语：[(词元和相对位置列表, 短语长度)]
+
+    多字中文用相邻两字的位置链匹配，单个汉字用单字匹配，英文按词匹配
+    """
+    phrases = []
+    for cjk, start, end in _runs(query):
+        text = query[start:end]
+        if not cjk:
+            phrases.append(([(text.lower(), 0)], len(text)))
+        elif len(text) == 1:
+            phrases.append(([(text, 0)], 1))
+        else:
+            phrases.append(([(text[i:i + 2], i) for i in range(len(text) - 1)], len(text)))
+    return phrases
+
+
+@dataclass
+class SearchHit:
+    path: str
+    title: str
+    score: float
+    positions: List[int]
+    snippet: str
+
+
+class StoryIndex:
+    """带位置信息的倒排索引：词元 -> {文档编号: [位置, ...]}"""
+
+    def __init__(self):
+        self.docs: Dict[str, dict] = {}  # 文档编号 -> {path, title, text, size, mtime_ns, sha256, title_end}
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+        self.next_id = 0
+
+    # ---- 持久化 ----
+
+    @classmethod
+    def load(cls, path: Path) -> 'StoryIndex':
+        index = cls()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return index
+        if data.get('version') != INDEX_VERSION:
+            return index
+        index.docs = data['docs']
+        index.postings = data['postings']
+        index.next_id = data['next_id']
+        return index
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'.{path.name}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'next_id': self.next_id,
+                       'docs': self.docs, 'postings': self.postings},
+                      f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    # ---- 增量更新 ----
+
+    def _remove(self, doc_id: str) -> None:
+        doc = self.docs.pop(doc_id)
+        for token in set(t for t, _ in tokenize(doc['text'])):
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[token]
+
+    def _add(self, path: str, st: os.stat_result, digest: str) -> None:
+        title, text = read_story_content(path)
+        doc_id = str(self.next_id)
+        self.next_id += 1
+        first_line = text.split('\n', 1)[0]
+        self.docs[doc_id] = {
+            'path': path, 'title': title, 'text': text,
+            'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest,
+            'title_end': len(first_line),
+        }
+        for token, pos in tokenize(text):
+            self.postings.setdefault(token, {}).setdefault(doc_id, []).append(pos)
+
+    def update(self, paths: List[str]) -> Tuple[int, int, int]:
+        """与磁盘上的文稿同步，返回 (新增或更新, 未变化, 删除) 的数量"""
+        by_path = {doc['path']: doc_id for doc_id, doc in self.docs.items()}
+        changed = unchanged = 0
+        for path in paths:
+            st = os.stat(path)
+            doc_id = by_path.pop(path, None)
+            if doc_id is not None:
+                doc = self.docs[doc_id]
+                if doc['size'] == st.st_size and doc['mtime_ns'] == st.st_mtime_ns:
+                    unchanged += 1
+                    continue
+                digest = _file_sha256(path)
+                if digest == doc['sha256']:
+                    doc['mtime_ns'] = st.st_mtime_ns  # 只是修改时间变了
+                    unchanged += 1
+                    continue
+                self._remove(doc_id)
+            else:
+                digest = _file_sha256(path)
+            self._add(path, st, digest)
+            changed += 1
+        for doc_id in by_path.values():
+            self._remove(doc_id)
+        return changed, unchanged, len(by_path)
+
+    # ---- 查询 ----
+
+    def _phrase_positions(self, phrase: List[Tuple[str, int]]) -> Dict[str, List[int]]:
+        """返回包含整个短语的文档及短语起始位置"""
+        first_token, _ = phrase[0]
+        candidates = self.postings.get(first_token, {})
+        matches = {}
+        for doc_id, starts in candidates.items():
+            positions = starts
+            for token, offset in phrase[1:]:
+                other = self.postings.get(token, {}).get(doc_id)
+                if not other:
+                    positions = []
+                    break
+                other_set = set(other)
+                positions = [p for p in positions if p + offset in other_set]
+                if not positions:
+                    break
+            if positions:
+                matches[doc_id] = positions
+        return matches
+
+    def search(self, query: str, limit: int = 10) -> Tuple[List[SearchHit], int]:
+        """所有查询词都出现的文档按 BM25 打分排序，标题中的命中加权
+
+        Returns:
+            (得分最高的 limit 个结果, 匹配的文档总数)
+        """
+        terms = [term for term in query.split() if term]
+        if not terms or not self.docs:
+            return [], 0
+        avg_len = sum(len(doc['text']) for doc in self.docs.values()) / len(self.docs)
+        scores: Dict[str, float] = {}
+        hit_positions: Dict[str, List[Tuple[int, int]]] = {}
+        for term in terms:
+            docs_for_term: Optional[Dict[str, List[Tuple[int, int]]]] = None
+            for phrase, span in _query_phrases(term):
+                matches = self._phrase_positions(phrase)
+                found = {doc_id: [(p, span) for p in positions] for doc_id, positions in matches.items()}
+                if docs_for_term is None:
+                    docs_for_term = found
+                else:
+                    docs_for_term = {d: docs_for_term[d] + found[d] for d in docs_for_term if d in found}
+            docs_for_term = docs_for_term or {}
+            df = len(docs_for_term)
+            idf = math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+            for doc_id, hits in docs_for_term.items():
+                doc = self.docs[doc_id]
+                tf = sum(TITLE_BOOST if p < doc['title_end'] else 1.0 for p, _ in hits)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc['text']) / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+                hit_positions.setdefault(doc_id, []).extend(hits)
+            # 所有查询词都要出现
+            scores = {d: s for d, s in scores.items() if d in docs_for_term}
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.docs[item[0]]['path']))
+        results = []
+        for doc_id, score in ranked[:limit]:
+            doc = self.docs[doc_id]
+            hits = sorted(hit_positions[doc_id])
+            results.append(SearchHit(path=doc['path'], title=doc['title'], score=score,
+                                     positions=[p for p, _ in hits],
+                                     snippet=_snippet(doc['text'], hits, doc['title_end'])))
+        return results, len(ranked)
+
+
+def _snippet(text: str, hits: List[Tuple[int, int]], title_end: int) -> str:
+    """取正文中第一个命中位置附近的文字，命中部分用【】标出"""
+    body_hits = [(p, n) for p, n in hits if p >= title_end] or hits
+    pos, length = body_hits[0]
+    start = max(0, pos - SNIPPET_CONTEXT)
+    end = min(len(text), pos + length + SNIPPET_CONTEXT)
+    snippet = text[start:pos] + '【' + text[pos:pos + length] + '】' + text[pos + length:end]
+    snippet = ' '.join(snippet.split())
+    return ('…' if start > 0 else '') + snippet + ('…' if end < len(text) else '')
+
+
+def _file_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def corpus_paths(root: Optional[str] = None) -> List[str]:
+    """项目根目录下的故事文稿和设定文档（不含 README）"""
+    root = Path(root) if root else project_root()
+    return sorted(str(p) for p in root.glob('*.md') if not p.name.upper().startswith('README'))
+
+
+def index_path() -> Path:
+    return default_cache_dir() / INDEX_NAME
+
+
+def open_index(root: Optional[str] = None, rebuild: bool = False) -> Tuple[StoryIndex, Tuple[int, int, int]]:
+    """读取索引并与磁盘同步，有变化时写回"""
+    index = StoryIndex() if rebuild else StoryIndex.load(index_path())
+    stats = index.update(corpus_paths(root))
+    if stats[0] or stats[2] or rebuild:
+        index.save(index_path())
+    return index, stats
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='在故事文稿和设定文档中全文检索')
+    parser.add_argument('query', nargs='*', help='查询词，多个词表示都要出现（如 月光 莉莉）')
+    parser.add_argument('--limit', '-n', type=int, default=10, help='最多显示的结果数（默认: 10）')
+    parser.add_argument('--rebuild', action='store_true', help='丢弃已有索引，重新建立')
+    parser.add_argument('--stats', action='store_true', help='显示索引统计信息')
+    parser.add_argument('--root', default=None, help='项目根目录（默认: 脚本所在项目）')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index, (changed, unchanged, removed) = open_index(args.root, args.rebuild)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    if args.stats or not args.query:
+        print(f"索引: {index_path()}")
+        print(f"  文档: {len(index.docs)} 篇（本次更新 {changed}，未变化 {unchanged}，删除 {removed}）")
+        print(f"  词元: {len(index.postings)} 个")
+        print(f"  载入并同步耗时: {load_ms:.1f} ms")
+    if not args.query:
+        return
+
+    query = ' '.join(args.query)
+    started = time.perf_counter()
+    results, total = index.search(query, args.limit)
+    query_ms = (time.perf_counter() - started) * 1000
+
+    root = Path(args.root).resolve() if args.root else project_root()
+    shown = f"，显示前 {len(results)} 篇" if total > len(results) else ''
+    print(f"“{query}” 共 {total} 篇{shown}（查询耗时 {query_ms:.2f} ms）\n")
+    for rank, hit in enumerate(results, 1):
+        name = os.path.relpath(hit.path, root)
+        print(f"{rank}. {hit.title}  [{name}]  命中 {len(hit.positions)} 处  得分 {hit.score:.2f}")
+        print(f"   {hit.snippet}")
+    sys.exit(0 if results else 1)
+
+
+if __name__ == '__main__':
+    main()
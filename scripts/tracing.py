@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+处理步骤的计时和资源统计
+每个步骤记录为一个 span：墙钟时间、本线程 CPU 时间、ffmpeg 等子进程的 CPU 时间和峰值内存
+（resource.getrusage(RUSAGE_CHILDREN)）、本进程读写的字节数（Linux 上读取 /proc/self/io）。
+结果可保存为 JSON，批量处理时按步骤汇总为耗时分布
+
+子进程的统计是整个进程范围的：并行处理多个文件时，同一时间结束的 ffmpeg 会计入各自正在进行的步骤，
+需要精确的子进程数据时使用 --jobs 1
+
+用法：
+    python scripts/tracing.py trace.json [...]   # 汇总已保存的 trace 文件
+"""
+
+import json
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+
+TRACE_VERSION = 1
+# 耗时分布的分桶上限（秒），最后一个桶是 "以上"
+HISTOGRAM_BUCKETS = (0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30, 100, 300)
+
+_RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', None)  # 仅 Linux
+
+
+def _thread_cpu() -> float:
+    usage = resource.getrusage(_RUSAGE_THREAD if _RUSAGE_THREAD is not None
+                               else resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _children_usage() -> tuple:
+    """(子进程 CPU 秒数, 子进程峰值内存 MB)"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024  # macOS 上单位为字节
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss / divisor
+
+
+def _io_counters() -> Optional[tuple]:
+    """本进程累计读写的字节数 (rchar, wchar)，不支持时返回 None"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+@dataclass
+class Span:
+    """一个处理步骤的统计"""
+    name: str
+    start: float  # 相对 Tracer 创建时的秒数
+    wall: float = 0.0
+    cpu: float = 0.0  # 本线程的 CPU 时间
+    child_cpu: float = 0.0  # 步骤期间结束的子进程的 CPU 时间
+    child_max_rss_mb: float = 0.0  # 子进程的峰值内存（到步骤结束时为止的最大值）
+    bytes_read: Optional[int] = None
+    bytes_written: Optional[int] = None
+    parent: Optional[str] = None
+    attrs: dict = field(default_factory=dict)
+
+
+class Tracer:
+    """收集一次处理（一个录屏或一个 MP3）中各步骤的 span
+
+    可在多个线程中使用，嵌套的 span 会记录上一级的名称
+    """
+
+    def __init__(self, label: Optional[str] = None):
+        self.label = label
+        self.spans: List[Span] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """记录一个步骤；在 with 块中可以通过返回的 Span.attrs 补充信息（如输出字节数）"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        record = Span(name=name, start=time.perf_counter() - self._origin,
+                      parent=stack[-1].name if stack else None, attrs=dict(attrs))
+        io_before = _io_counters()
+        cpu_before = _thread_cpu()
+        child_cpu_before, _ = _children_usage()
+        started = time.perf_counter()
+        stack.append(record)
+        try:
+            yield record
+        finally:
+            stack.pop()
+            record.wall = time.perf_counter() - started
+            record.cpu = _thread_cpu() - cpu_before
+            child_cpu_after, record.child_max_rss_mb = _children_usage()
+            record.child_cpu = child_cpu_after - child_cpu_before
+            io_after = _io_counters()
+            if io_before and io_after:
+                record.bytes_read = io_after[0] - io_before[0]
+                record.bytes_written = io_after[1] - io_before[1]
+            with self._lock:
+                self.spans.append(record)
+
+    def to_dict(self) -> dict:
+        return {'label': self.label, 'spans': [asdict(s) for s in self.spans]}
+
+    def summary(self) -> str:
+        """每个顶层步骤一行的文字摘要"""
+        lines = []
+        for s in self.spans:
+            if s.parent is None:
+                lines.append(f"  {s.name:<22}{s.wall:>8.3f} 秒  CPU {s.cpu:.3f} + 子进程 "
+                             f"{s.child_cpu:.3f} 秒")
+        return '\n'.join(lines)
+
+
+def span(tracer: Optional[Tracer], name: str, **attrs):
+    """tracer 为 None 时返回空的上下文，调用方不需要判断"""
+    return tracer.span(name, **attrs) if tracer is not None else nullcontext(Span(name, 0.0))
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def aggregate(traces: Iterable[dict]) -> Dict[str, dict]:
+    """把多个 Tracer.to_dict() 的结果按步骤名汇总为耗时分布"""
+    walls: Dict[str, List[float]] = {}
+    child_cpu: Dict[str, float] = {}
+    for trace in traces:
+        for s in trace['spans']:
+            walls.setdefault(s['name'], []).append(s['wall'])
+            child_cpu[s['name']] = child_cpu.get(s['name'], 0.0) + s['child_cpu']
+    stats = {}
+    for name, values in walls.items():
+        values.sort()
+        counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for value in values:
+            counts[next((i for i, b in enumerate(HISTOGRAM_BUCKETS) if value <= b),
+                        len(HISTOGRAM_BUCKETS))] += 1
+        stats[name] = {
+            'count': len(values),
+            'total': sum(values),
+            'p50': _percentile(values, 0.5),
+            'p90': _percentile(values, 0.9),
+            'p99': _percentile(values, 0.99),
+            'max': values[-1],
+            'child_cpu': child_cpu[name],
+            'buckets': counts,
+        }
+    return stats
+
+
+def format_histogram(stats: Dict[str, dict]) -> str:
+    """按总耗时从高到低输出各步骤的耗时分布"""
+    labels = [f'≤{b:g}s' for b in HISTOGRAM_BUCKETS] + [f'>{HISTOGRAM_BUCKETS[-1]:g}s']
+    lines = [f"{'步骤':<22}{'次数':>6}{'总计(秒)':>10}{'p50':>9}{'p90':>9}{'p99':>9}{'最大':>9}  分布"]
+    for name, s in sorted(stats.items(), key=lambda item: -item[1]['total']):
+        distribution = ' '.join(f'{label}:{count}'
+                                for label, count in zip(labels, s['buckets']) if count)
+        lines.append(f"{name:<22}{s['count']:>6}{s['total']:>10.2f}{s['p50']:>9.3f}"
+                     f"{s['p90']:>9.3f}{s['p99']:>9.3f}{s['max']:>9.3f}  {distribution}")
+    return '\n'.join(lines)
+
+
+def save_traces(path: str, tracers: List[Tracer]) -> None:
+    """保存所有 trace 及汇总后的耗时分布"""
+    traces = [t.to_dict() for t in tracers]
+    data = {'version': TRACE_VERSION, 'traces': traces, 'histogram': aggregate(traces)}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+@contextmanager
+def profiled(path: Optional[str], profiler: str = 'cprofile'):
+    """在 with 块中运行性能分析器，结束后写入 path；path 为 None 时不做任何事
+
+    cprofile 输出可用 `python -m pstats` 或 snakeviz 查看；pyinstrument（需另行安装）输出 HTML
+    """
+    if not path:
+        yield
+        return
+    if profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("⚠ 未安装 pyinstrument (pip install pyinstrument)，改用 cProfile")
+        else:
+            profiler_obj = Profiler()
+            profiler_obj.start()
+            try:
+                yield
+            finally:
+                profiler_obj.stop()
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(profiler_obj.output_html())
+                print(f"性能分析结果: {path}")
+            return
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+        print(f"性能分析结果: {path}")
+
+
+def main():
+    """主函数"""
+    if len(sys.argv) < 2:
+        print("用法:")
+        print("  python scripts/tracing.py <trace.json> [...]")
+        sys.exit(1)
+
+    traces = []
+    for path in sys.argv[1:]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                traces.extend(json.load(f).get('traces', []))
+        except (OSError, ValueError) as e:
+            print(f"✗ 无法读取 {path}: {e}")
+            sys.exit(1)
+    print(f"共 {len(traces)} 次处理")
+    print(format_histogram(aggregate(traces)))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,11 +2,16 @@
 # -*- coding: utf-8 -*-
 """
 验证 MP3 文件的元数据和封面
+单个文件输出详细信息；目录或多个文件时并行检查，可输出 JSON 或 JUnit 报告
 """
 
 import sys
 import os
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterable, List, Optional
 
 try:
     from mutagen.mp3 import MP3
@@ -17,9 +22,23 @@ except ImportError:
     print("请运行: pip install mutagen")
     sys.exit(1)
 
+from asset_index import build_asset_index, story_key
+from build_cache import BuildCache
+from cover_art import PIL_AVAILABLE, prepare_cover
+from probe_cache import probe
+from story_corpus import load_story
 
-def verify_audio(audio_path: str):
-    """验证音频文件的元数据和封面"""
+
+# 必须嵌入的标签，以及报告中使用的名称
+REQUIRED_TAGS = {'title': '标题', 'cover': '封面', 'intro': '简介', 'text': '全文'}
+
+
+def verify_audio(audio_path: str, extract_cover: bool = False):
+    """验证音频文件的元数据和封面
+    
+    Args:
+        extract_cover: 把嵌入的封面另存为 `<文件名>_cover.<扩展名>` 以便查看，默认关闭
+    """
     if not os.path.exists(audio_path):
         print(f"错误: 文件不存在: {audio_path}")
         return False
@@ -85,21 +104,22 @@ def verify_audio(audio_path: str):
             print(f"    - 描述: {desc}")
             print(f"    - 大小: {len(apic_data)} 字节 ({len(apic_data)/1024:.2f} KB)")
             
-            # 保存封面到文件以便查看
-            cover_ext = {
-                'image/jpeg': '.jpg',
-                'image/png': '.png',
-                'image/gif': '.gif',
-                'image/bmp': '.bmp'
-            }.get(mime, '.jpg')
-            
-            cover_path = Path(audio_path).parent / f"{Path(audio_path).stem}_cover{cover_ext}"
-            try:
-                with open(cover_path, 'wb') as f:
-                    f.write(apic_data)
-                print(f"    - 已保存到: {cover_path}")
-            except Exception as e:
-                print(f"    - 保存封面失败: {e}")
+            if extract_cover:
+                # 保存封面到文件以便查看
+                cover_ext = {
+                    'image/jpeg': '.jpg',
+                    'image/png': '.png',
+                    'image/gif': '.gif',
+                    'image/bmp': '.bmp'
+                }.get(mime, '.jpg')
+                
+                cover_path = Path(audio_path).parent / f"{Path(audio_path).stem}_cover{cover_ext}"
+                try:
+                    with open(cover_path, 'wb') as f:
+                        f.write(apic_data)
+                    print(f"    - 已保存到: {cover_path}")
+                except Exception as e:
+                    print(f"    - 保存封面失败: {e}")
             apic_found = True
             break
     
@@ -173,18 +193,187 @@ def verify_audio(audio_path: str):
     return all_good
 
 
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def check_audio(audio_path: str, index: Optional[dict] = None,
+                cache: Optional[BuildCache] = None) -> dict:
+    """检查一个 MP3，返回结构化结果（不输出、不写文件）
+    
+    时长、标签目录和嵌入内容的哈希来自媒体信息缓存（见 probe_cache.py），文件未变化时
+    不会重新解析。除了标签是否齐全，还会找到对应的故事文稿和封面，按哈希比较嵌入的标题、全文和封面
+    是否与当前源文件一致；找不到源文件时对应的比较结果为 None
+    
+    Args:
+        index: build_asset_index() 的结果，批量检查时共用
+        cache: 构建缓存，用来查找已优化的封面（只读），批量检查时共用
+    """
+    result = {'path': str(audio_path), 'ok': False, 'problems': []}
+    try:
+        info = probe(audio_path, hashes=True)
+    except Exception as e:
+        result['problems'].append(f"无法读取文件: {e}")
+        return result
+    if info.error:
+        result['problems'].append(f"无法读取文件: {info.error}")
+        return result
+    
+    tags = info.tags
+    frames = tags['frames']
+    title = tags['title']
+    result.update({
+        'duration': round(info.duration, 3),
+        'bitrate': info.bitrate,
+        'sample_rate': info.sample_rate,
+        'bytes': info.size,
+        'title': title,
+        'tags': {
+            'title': 'TIT2' in frames,
+            'artist': 'TPE1' in frames,
+            'album': 'TALB' in frames,
+            'genre': 'TCON' in frames,
+            'cover': 'APIC' in frames,
+            'intro': 'COMM' in frames,
+            'text': 'USLT' in frames,
+        },
+        'cover_bytes': tags['cover_bytes'],
+        'cover_mime': tags['cover_mime'],
+        'cover_sha256': tags['cover_sha256'],
+        'text_chars': tags['text_chars'],
+        'text_sha256': tags['text_sha256'],
+    })
+    for name, label in REQUIRED_TAGS.items():
+        if not result['tags'][name]:
+            result['problems'].append(f"缺少{label}")
+    
+    # 与源文件比较
+    index = index if index is not None else build_asset_index()
+    entry = index.get(story_key(str(audio_path)))
+    story_path = entry.story if entry else None
+    cover_path = entry.cover if entry else None
+    result['story'] = story_path
+    result['source_cover'] = cover_path
+    matches = {'title': None, 'text': None, 'cover': None}
+    if story_path:
+        try:
+            story = load_story(story_path)  # 正文哈希在文稿缓存中，不用重新读取
+        except (OSError, UnicodeDecodeError) as e:
+            result['problems'].append(f"无法读取文稿: {e}")
+        else:
+            matches['title'] = title == story.title
+            matches['text'] = result['text_sha256'] == story.sha256
+    if cover_path:
+        try:
+            with open(cover_path, 'rb') as f:
+                candidates = {_sha256(f.read())}
+            if PIL_AVAILABLE:
+                # 默认嵌入的是 cover_art 优化后的版本，结果在构建缓存中
+                # 只读取已缓存的版本，缓存中没有时在内存中生成，不写入缓存
+                candidates.add(_sha256(prepare_cover(cover_path, cache=cache, store=False)[0]))
+        except OSError as e:
+            result['problems'].append(f"无法读取封面: {e}")
+        else:
+            matches['cover'] = result['cover_sha256'] in candidates
+    result['matches'] = matches
+    for name, matched in matches.items():
+        if matched is False:
+            result['problems'].append(f"{REQUIRED_TAGS[name]}与源文件不一致")
+    
+    result['ok'] = not result['problems']
+    return result
+
+
+def verify_directory(paths: Iterable[str], jobs: Optional[int] = None) -> List[dict]:
+    """并行检查多个 MP3，结果按路径排序"""
+    paths = sorted(str(p) for p in paths)
+    index = build_asset_index()
+    cache = BuildCache()
+    jobs = jobs or min(32, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(lambda p: check_audio(p, index, cache), paths))
+
+
+def write_json_report(results: List[dict], path: str) -> None:
+    summary = {'total': len(results), 'passed': sum(r['ok'] for r in results)}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'summary': summary, 'files': results}, f, ensure_ascii=False, indent=2)
+
+
+def write_junit_report(results: List[dict], path: str) -> None:
+    """输出 JUnit XML，每个文件是一个测试用例"""
+    from xml.sax.saxutils import escape, quoteattr
+    
+    failures = sum(not r['ok'] for r in results)
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             f'<testsuite name="verify_audio" tests="{len(results)}" failures="{failures}">']
+    for r in results:
+        name = quoteattr(Path(r['path']).name)
+        if r['ok']:
+            lines.append(f'  <testcase classname="audio" name={name} />')
+        else:
+            message = '；'.join(r['problems'])
+            lines.append(f'  <testcase classname="audio" name={name}>')
+            lines.append(f'    <failure message={quoteattr(message)}>{escape(message)}</failure>')
+            lines.append('  </testcase>')
+    lines.append('</testsuite>')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def _collect(targets: List[str]) -> List[Path]:
+    files = []
+    for target in map(Path, targets):
+        if target.is_dir():
+            files.extend(p for p in target.iterdir() if p.suffix.lower() == '.mp3')
+        else:
+            files.append(target)
+    return files
+
+
 def main():
     """主函数"""
-    if len(sys.argv) < 2:
-        print("用法:")
-        print("  python scripts/verify_audio.py <MP3文件>")
-        print("\n示例:")
-        print("  python scripts/verify_audio.py audio/01-巫巫女的心变了.mp3")
-        sys.exit(1)
+    import argparse
     
-    audio_path = sys.argv[1]
-    success = verify_audio(audio_path)
-    sys.exit(0 if success else 1)
+    parser = argparse.ArgumentParser(
+        description='验证 MP3 文件的元数据和封面',
+        epilog='示例: python scripts/verify_audio.py audio/01-巫巫女的心变了.mp3\n'
+               '      python scripts/verify_audio.py audio --json report.json',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='MP3 文件或目录')
+    parser.add_argument('--jobs', '-j', type=int, default=None, help='并行线程数')
+    parser.add_argument('--json', default=None, help='输出 JSON 报告')
+    parser.add_argument('--junit', default=None, help='输出 JUnit XML 报告')
+    parser.add_argument('--extract-cover', action='store_true',
+                        help='把嵌入的封面另存为 <文件名>_cover.<扩展名>（仅单个文件时）')
+    args = parser.parse_args()
+    
+    # 单个文件且不需要报告时，输出详细信息
+    if len(args.paths) == 1 and not Path(args.paths[0]).is_dir() \
+            and not args.json and not args.junit:
+        success = verify_audio(args.paths[0], extract_cover=args.extract_cover)
+        sys.exit(0 if success else 1)
+    
+    files = _collect(args.paths)
+    if not files:
+        print("未找到 MP3 文件")
+        sys.exit(1)
+    results = verify_directory(files, args.jobs)
+    for r in results:
+        name = Path(r['path']).name
+        if r['ok']:
+            print(f"  ✓ {name} ({r['duration']:.1f} 秒, 封面 {r['cover_bytes'] / 1024:.0f} KB)")
+        else:
+            print(f"  ✗ {name}: {'；'.join(r['problems'])}")
+    passed = sum(r['ok'] for r in results)
+    print(f"\n通过: {passed}/{len(results)}")
+    if args.json:
+        write_json_report(results, args.json)
+        print(f"JSON 报告: {args.json}")
+    if args.junit:
+        write_junit_report(results, args.junit)
+        print(f"JUnit 报告: {args.junit}")
+    sys.exit(0 if passed == len(results) else 1)
 
 
 if __name__ == '__main__':
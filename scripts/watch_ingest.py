@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监视投放目录，自动处理新的录屏
+录屏复制到投放目录后，等文件大小不再变化，按故事命名规则找到文稿和封面，
+在常驻进程中调用 process_video 生成 `audio/<故事名>.mp3`，不需要每个文件启动一次 Python。
+Linux 上用 inotify 立即得到通知，其他系统定时扫描目录
+
+任务记录保存在缓存目录的 watch_journal.jsonl 中：处理过的录屏（大小和修改时间未变）不会重复处理，
+中断时正在处理的录屏在下次启动时重新处理，失败的录屏按退避时间重试
+
+用法：
+    python scripts/watch_ingest.py ~/Drop                  # 持续监视
+    python scripts/watch_ingest.py ~/Drop --once           # 处理目录中已有的录屏后退出
+    python scripts/watch_ingest.py ~/Drop --catalog        # 每处理完一个故事就更新目录和 RSS
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import queue
+import select
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from asset_index import invalidate, project_root, story_key
+from build_cache import BuildCache, default_cache_dir
+from process_audio import (RECORDING_EXTENSIONS, check_ffmpeg, find_cover_image, find_story_file,
+                           process_video)
+from audio_analysis import DEFAULT_TARGET_LUFS
+
+
+JOURNAL_NAME = 'watch_journal.jsonl'
+DEFAULT_SETTLE = 3.0  # 文件大小和修改时间保持不变多少秒后才开始处理
+DEFAULT_POLL = 5.0  # 没有 inotify 时扫描目录的间隔（秒）
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 30.0  # 第一次重试前等待的秒数，之后每次加倍
+
+# inotify 事件：新建、写入完成、移入目录（不监听 IN_MODIFY，复制大文件时它会频繁触发）
+IN_CREATE = 0x00000100
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+
+class PollingWaiter:
+    """定时唤醒"""
+
+    def wait(self, timeout: float) -> None:
+        time.sleep(timeout)
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWaiter:
+    """目录中有文件新建、写入完成或移入时立即唤醒（通过 ctypes 调用 libc，不需要额外的库）"""
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+        mask = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch 失败')
+
+    def wait(self, timeout: float) -> None:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(self.fd, 65536):  # 只需要被唤醒，事件内容由之后的扫描确认
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def make_waiter(directory: str, polling: bool = False):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWaiter(directory)
+        except (OSError, AttributeError) as e:
+            print(f"⚠ 无法使用 inotify ({e})，改为每 {DEFAULT_POLL:g} 秒扫描一次")
+    return PollingWaiter()
+
+
+class JobJournal:
+    """按录屏路径记录任务状态，追加写入 JSON Lines，启动时重放并压缩
+
+    状态：queued（排队）、running（处理中）、retry（等待重试）、done（完成）、
+    failed（重试次数用完）、unmatched（找不到对应的故事）
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.records: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 上次退出时写了一半的行
+                    self.records[record['path']] = record
+        except OSError:
+            pass
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._compact()
+
+    def _compact(self) -> None:
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self.records.values():
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def get(self, path: str) -> Optional[dict]:
+        with self._lock:
+            record = self.records.get(path)
+            return dict(record) if record else None
+
+    def update(self, path: str, **fields) -> dict:
+        with self._lock:
+            record = self.records.setdefault(path, {'path': path, 'attempts': 0})
+            record.update(fields, updated=time.time())
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            return dict(record)
+
+
+def _signature(st: os.stat_result) -> Tuple[int, int]:
+    return st.st_size, st.st_mtime_ns
+
+
+class IngestWatcher:
+    """扫描投放目录，把稳定下来的录屏放入有界队列，由工作线程处理"""
+
+    def __init__(self, drop_dir: str, output_dir: Optional[str] = None,
+                 root: Optional[str] = None, jobs: int = 1, queue_size: int = 8,
+                 settle: float = DEFAULT_SETTLE, poll: float = DEFAULT_POLL,
+                 retries: int = DEFAULT_RETRIES, retry_delay: float = DEFAULT_RETRY_DELAY,
+                 allow_unmatched: bool = False, catalog: bool = False,
+                 journal: Optional[JobJournal] = None, **options):
+        self.drop_dir = Path(drop_dir).resolve()
+        self.root = Path(root).resolve() if root else project_root()
+        self.output_dir = Path(output_dir).resolve() if output_dir else self.root / 'audio'
+        self.settle = settle
+        self.poll = poll
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.allow_unmatched = allow_unmatched
+        self.catalog = catalog
+        self.options = options  # 传给 process_video 的参数
+        self.journal = journal or JobJournal(default_cache_dir() / JOURNAL_NAME)
+        self.queue: 'queue.Queue[Optional[str]]' = queue.Queue(maxsize=queue_size)
+        self.jobs = jobs
+        self.pending: Dict[str, Tuple[Tuple[int, int], float]] = {}  # 路径 -> (签名, 稳定起始时间)
+        self.active = set()  # 已入队或正在处理的录屏
+        self.reported = set()  # 已提示过的 (路径, 状态)，避免每次扫描重复输出
+        self._lock = threading.Lock()
+        self._catalog_lock = threading.Lock()
+        self.stop = threading.Event()
+
+    def _candidates(self):
+        try:
+            with os.scandir(self.drop_dir) as it:
+                for entry in it:
+                    if (entry.is_file() and not entry.name.startswith('.')
+                            and Path(entry.name).suffix.lower() in RECORDING_EXTENSIONS):
+                        yield entry.path, entry.stat()
+        except OSError as e:
+            print(f"⚠ 无法读取投放目录: {e}")
+
+    def _report_once(self, path: str, status: str, message: str) -> None:
+        if (path, status) not in self.reported:
+            self.reported.add((path, status))
+            print(message)
+
+    def _ready(self, path: str, signature: Tuple[int, int], now: float) -> bool:
+        """根据任务记录判断录屏是否需要（再次）处理"""
+        record = self.journal.get(path)
+        if record is None or (record.get('size'), record.get('mtime_ns')) != signature:
+            return True  # 新文件，或处理后又被替换
+        status = record['status']
+        if status in ('queued', 'running'):
+            return True  # 上次运行中断
+        if status in ('retry', 'unmatched'):
+            return now >= record.get('retry_at', 0)  # 未匹配的录屏定期重新查找故事
+        if status == 'failed':
+            self._report_once(path, 'failed', f"  ✗ {Path(path).name}: 已失败 "
+                              f"{record['attempts']} 次，文件变化后才会重试")
+        return False
+
+    def scan(self) -> None:
+        """扫描一次投放目录，把大小保持不变超过 settle 秒的录屏放入队列"""
+        now = time.monotonic()
+        seen = set()
+        for path, st in self._candidates():
+            seen.add(path)
+            with self._lock:
+                if path in self.active:
+                    continue
+            signature = _signature(st)
+            if not self._ready(path, signature, time.time()):
+                self.pending.pop(path, None)
+                continue
+            previous = self.pending.get(path)
+            if previous is None or previous[0] != signature:
+                self.pending[path] = (signature, now)  # 新出现或仍在增长
+                continue
+            if now - previous[1] < self.settle:
+                continue
+            try:
+                self.queue.put_nowait(path)
+            except queue.Full:
+                continue  # 队列已满，下次扫描再放入
+            del self.pending[path]
+            with self._lock:
+                self.active.add(path)
+            record = self.journal.get(path)
+            fields = {}
+            if record and (record.get('size'), record.get('mtime_ns')) != signature:
+                fields['attempts'] = 0  # 文件被替换，重新计算重试次数
+            self.journal.update(path, status='queued', size=signature[0], mtime_ns=signature[1],
+                                **fields)
+        for path in list(self.pending):
+            if path not in seen:
+                del self.pending[path]  # 文件被移走
+
+    def match(self, recording: str) -> Tuple[Optional[str], Optional[str]]:
+        """按 process_audio 的命名规则查找故事和封面，就像录屏放在项目的 audio/ 目录中一样"""
+        invalidate()  # 目录内容可能已经变化（例如刚提交的新故事）
+        as_if_in_audio = str(self.root / 'audio' / Path(recording).name)
+        return find_story_file(as_if_in_audio), find_cover_image(as_if_in_audio)
+
+    def ingest(self, recording: str) -> None:
+        """处理一个录屏并更新任务记录"""
+        name = Path(recording).name
+        record = self.journal.get(recording) or {}
+        story_path, cover_path = self.match(recording)
+        if story_path is None and not self.allow_unmatched:
+            self.journal.update(recording, status='unmatched', retry_at=time.time() + self.poll)
+            self._report_once(recording, 'unmatched',
+                              f"  ⚠ {name}: 找不到对应的故事文稿，补上后会自动处理")
+            return
+
+        attempts = record.get('attempts', 0) + 1
+        output_path = self.output_dir / f"{story_key(recording)}.mp3"
+        self.journal.update(recording, status='running', attempts=attempts,
+                            output=str(output_path))
+        print(f"\n▶ 开始处理: {name} (第 {attempts} 次)")
+        try:
+            ok = process_video(recording, str(output_path), cover_path=cover_path,
+                               story_path=story_path, **self.options)
+            error = None if ok else '处理失败'
+        except Exception as e:
+            ok, error = False, str(e)
+
+        if ok:
+            self.journal.update(recording, status='done', error=None)
+            print(f"✓ 已发布: {output_path}")
+            if self.catalog:
+                self.update_catalog()
+        else:
+            self._fail(recording, attempts, error)
+
+    def _fail(self, recording: str, attempts: int, error: str) -> None:
+        """记录第 attempts 次处理失败：未超过重试次数时按指数退避等待重试，否则放弃"""
+        name = Path(recording).name
+        if attempts < self.retries:
+            delay = self.retry_delay * 2 ** (attempts - 1)
+            self.journal.update(recording, status='retry', attempts=attempts, error=error,
+                                retry_at=time.time() + delay)
+            print(f"✗ {name}: {error}，{delay:g} 秒后重试")
+        else:
+            self.journal.update(recording, status='failed', attempts=attempts, error=error)
+            print(f"✗ {name}: {error}，已重试 {attempts} 次，放弃")
+
+    def update_catalog(self) -> None:
+        from build_catalog import update_catalog
+
+        with self._catalog_lock:
+            invalidate()
+            _, changed = update_catalog(self.root, os.environ.get('WUWUNV_BASE_URL', ''))
+            if changed:
+                print(f"  已更新: {', '.join(changed)}")
+
+    def _worker(self) -> None:
+        while True:
+            recording = self.queue.get()
+            if recording is None:
+                return
+            try:
+                self.ingest(recording)
+            except Exception as e:
+                record = self.journal.get(recording) or {}
+                if record.get('status') == 'done':
+                    print(f"✗ {Path(recording).name}: {e}")  # 已发布，更新目录时出错
+                else:
+                    # 在开始处理之前出错（如查找故事时文件系统出错）也计入重试次数，
+                    # 否则记录停在 queued，每次扫描都会被当作中断的任务立即重新排队
+                    attempts = record.get('attempts', 0)
+                    if record.get('status') != 'running':
+                        attempts += 1
+                    self._fail(recording, attempts, str(e))
+            finally:
+                with self._lock:
+                    self.active.discard(recording)
+
+    def _idle(self) -> bool:
+        """没有等待稳定、排队、处理中或等待重试的录屏（找不到故事的录屏不再等待）"""
+        with self._lock:
+            if self.active:
+                return False
+        if self.pending:
+            return False
+        for path, _ in self._candidates():
+            record = self.journal.get(path)
+            if record and record['status'] == 'retry':
+                return False
+        return True
+
+    def run(self, once: bool = False, polling: bool = False) -> None:
+        """持续监视；once 为 True 时处理完目录中已有的录屏后返回"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        waiter = make_waiter(str(self.drop_dir), polling)
+        mode = 'inotify' if isinstance(waiter, InotifyWaiter) else f'每 {self.poll:g} 秒扫描'
+        print(f"监视 {self.drop_dir} ({mode})，输出到 {self.output_dir}")
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.jobs)]
+        for worker in workers:
+            worker.start()
+        try:
+            while not self.stop.is_set():
+                self.scan()
+                if once and self._idle():
+                    break
+                # 有文件等待稳定或重试时每秒检查一次，否则等待目录变化
+                busy = self.pending or once
+                waiter.wait(min(1.0, self.settle) if busy else self.poll)
+        except KeyboardInterrupt:
+            print("\n正在停止（正在处理的录屏会在下次启动时重新处理）...")
+        finally:
+            waiter.close()
+            for _ in workers:
+                self.queue.put(None)
+            for worker in workers:
+                worker.join()
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='监视投放目录，自动处理新的录屏并发布到 audio/',
+        epilog='示例: python scripts/watch_ingest.py ~/Drop --catalog',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('drop_dir', help='投放录屏的目录')
+    parser.add_argument('--output-dir', default=None, help='输出目录（默认: 项目的 audio/）')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='同时处理的录屏数（默认: 1）')
+    parser.add_argument('--queue-size', type=int, default=8, help='等待处理的队列长度（默认: 8）')
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE,
+                        help=f'文件大小保持不变多少秒后开始处理（默认: {DEFAULT_SETTLE:g}）')
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL,
+                        help=f'没有 inotify 时扫描目录的间隔秒数（默认: {DEFAULT_POLL:g}）')
+    parser.add_argument('--polling', action='store_true', help='不使用 inotify，定时扫描目录')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f'每个录屏最多处理几次（默认: {DEFAULT_RETRIES}）')
+    parser.add_argument('--retry-delay', type=float, default=DEFAULT_RETRY_DELAY,
+                        help=f'第一次重试前等待的秒数，之后每次加倍（默认: {DEFAULT_RETRY_DELAY:g}）')
+    parser.add_argument('--allow-unmatched', action='store_true',
+                        help='找不到故事文稿时也处理（不写入标题和全文）')
+    parser.add_argument('--catalog', action='store_true',
+                        help='每发布一个故事就更新 catalog.json、feed.xml 和 README 表格')
+    parser.add_argument('--once', action='store_true', help='处理完目录中已有的录屏后退出')
+    parser.add_argument('--no-cache', action='store_true', help='不使用构建缓存')
+    parser.add_argument('--loudnorm', nargs='?', type=float, const=DEFAULT_TARGET_LUFS,
+                        default=None, metavar='LUFS',
+                        help=f'把综合响度标准化到目标值（默认 {DEFAULT_TARGET_LUFS:.0f} LUFS）')
+    parser.add_argument('--chapters', action='store_true',
+                        help='按停顿把故事段落对齐到音频，写入 ID3 章节')
+    parser.add_argument('--sylt', action='store_true',
+                        help='同时写入每段一条的同步歌词（SYLT），包含 --chapters')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.drop_dir):
+        print(f"错误: 目录不存在: {args.drop_dir}")
+        sys.exit(1)
+    if not check_ffmpeg():
+        sys.exit(1)
+
+    watcher = IngestWatcher(args.drop_dir, args.output_dir,
+                            jobs=args.jobs, queue_size=args.queue_size,
+                            settle=args.settle, poll=args.poll,
+                            retries=args.retries, retry_delay=args.retry_delay,
+                            allow_unmatched=args.allow_unmatched, catalog=args.catalog,
+                            cache=None if args.no_cache else BuildCache(),
+                            target_lufs=args.loudnorm,
+                            chapters=args.chapters or args.sylt,
+                            sylt=args.sylt)
+    watcher.run(once=args.once, polling=args.polling)
+
+
+if __name__ == '__main__':
+    main()